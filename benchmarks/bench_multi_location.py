@@ -0,0 +1,54 @@
+import pytest
+
+from payloads import feed_data_objs, make_response, rounds, scales
+
+
+@pytest.fixture
+def fake_api(client, monkeypatch):
+    """Answer every request from memory, with a different station per url"""
+
+    def install(n):
+        data_objs = iter(feed_data_objs(n))
+        responses = {}
+
+        def fake_request(url):
+            if url not in responses:
+                responses[url] = make_response(next(data_objs))
+            return responses[url]
+
+        monkeypatch.setattr(client, "_make_api_request", fake_request)
+
+    return install
+
+
+@pytest.mark.parametrize("scale", scales())
+def bench_get_multiple_city_air(benchmark, client, fake_api, scale):
+    cities = [f"city{i}" for i in range(scale)]
+    fake_api(scale)
+
+    df = benchmark.pedantic(
+        client.get_multiple_city_air, args=(cities,), rounds=rounds(scale)
+    )
+    assert len(df) == scale
+
+
+@pytest.mark.parametrize("scale", scales())
+def bench_get_multiple_coordinate_air(benchmark, client, fake_api, scale):
+    locations = [(i / 1000, -i / 1000) for i in range(scale)]
+    fake_api(scale)
+
+    df = benchmark.pedantic(
+        client.get_multiple_coordinate_air, args=(locations,), rounds=rounds(scale)
+    )
+    assert len(df) == scale
+
+
+@pytest.mark.parametrize("scale", scales())
+def bench_iter_multiple_city_air(benchmark, client, fake_api, scale):
+    cities = [f"city{i}" for i in range(scale)]
+    fake_api(scale)
+
+    def run():
+        return sum(len(chunk) for chunk in client.iter_multiple_city_air(cities))
+
+    assert benchmark.pedantic(run, rounds=rounds(scale)) == scale
@@ -0,0 +1,51 @@
+import pytest
+
+from ozon3.historical import _reverse_engineered
+from payloads import feed_data, feed_data_objs, historical_messages, rounds, scales
+
+
+@pytest.mark.parametrize("scale", scales())
+def bench_extract_live_data(benchmark, client, scale):
+    data_objs = feed_data_objs(scale)
+
+    rows = benchmark.pedantic(
+        lambda: [client._extract_live_data(obj) for obj in data_objs],
+        rounds=rounds(scale),
+    )
+    assert len(rows) == scale
+
+
+# About 13 ms per call, so 100k calls would take over 20 minutes a round.
+@pytest.mark.parametrize("scale", scales(10, 1000))
+def bench_extract_forecast_data(benchmark, client, scale):
+    data_obj = feed_data()
+
+    frames = benchmark.pedantic(
+        lambda: [client._extract_forecast_data(data_obj) for _ in range(scale)],
+        rounds=rounds(scale * 100),
+    )
+    assert len(frames) == scale
+
+
+def bench_parse_incoming_result(benchmark):
+    message = historical_messages()[0]
+
+    df = benchmark.pedantic(
+        _reverse_engineered.parse_incoming_result, args=(message,), rounds=5
+    )
+    assert len(df) > 0
+
+
+# Historical data scales with the number of server-sent events of a city; the
+# recorded stream has 37. Decoding runs JavaScript, at a few events a second.
+@pytest.mark.parametrize("events", [1, 10, len(historical_messages())])
+def bench_get_data_from_id(benchmark, monkeypatch, events):
+    messages = historical_messages()[:events]
+    monkeypatch.setattr(
+        _reverse_engineered, "get_results_from_backend", lambda *args: messages
+    )
+
+    df = benchmark.pedantic(
+        _reverse_engineered.get_data_from_id, args=(5724,), rounds=1
+    )
+    assert len(df) > 0
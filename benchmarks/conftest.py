@@ -0,0 +1,12 @@
+from unittest import mock
+
+import pytest
+
+from ozon3 import Ozon3
+
+
+@pytest.fixture(scope="session")
+def client():
+    """A client that never touches the network"""
+    with mock.patch.object(Ozon3, "_check_token_validity"):
+        return Ozon3("DUMMY_TOKEN")
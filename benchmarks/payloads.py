@@ -0,0 +1,111 @@
+"""Payloads for the benchmarks, taken from the recorded test cassettes
+
+The cassettes hold one real response per endpoint. The scaled-up payloads are
+copies of it with a different station name, id and AQI for every location, so
+that nothing can be served from a cache.
+"""
+
+import copy
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import pytest
+import requests
+import yaml
+
+from ozon3.historical._disk_cache import HistoricalCache
+
+CASSETTES = os.path.join(os.path.dirname(__file__), "..", "tests", "cassettes")
+
+# Scales of the benchmarks that take a number of locations. Scales above
+# OZON3_BENCH_MAX_SCALE (e.g. 1000 for a quick run) are skipped.
+SCALES = (10, 1000, 100000)
+MAX_SCALE = int(os.environ.get("OZON3_BENCH_MAX_SCALE", max(SCALES)))
+
+
+def scales(*values: int) -> List[Any]:
+    """Parameters for pytest.mark.parametrize, skipping those above MAX_SCALE"""
+    return [
+        pytest.param(
+            value,
+            marks=pytest.mark.skipif(
+                value > MAX_SCALE, reason="above OZON3_BENCH_MAX_SCALE"
+            ),
+        )
+        for value in (values or SCALES)
+    ]
+
+
+def rounds(scale: int) -> int:
+    """Fewer rounds for larger scales, so that no benchmark takes too long"""
+    return max(1, min(20, 10000 // scale))
+
+
+def recorded_bodies(cassette: str, uri_part: str) -> List[str]:
+    """Response bodies of the requests in a cassette whose uri has uri_part"""
+    with open(os.path.join(CASSETTES, cassette)) as f:
+        interactions = yaml.safe_load(f)["interactions"]
+    return [
+        i["response"]["body"]["string"]
+        for i in interactions
+        if uri_part in i["request"]["uri"] and i["response"]["body"]["string"]
+    ]
+
+
+@lru_cache(maxsize=None)
+def feed_data() -> Dict[str, Any]:
+    """The recorded `feed` data object of London, forecast included"""
+    (body,) = recorded_bodies(
+        "test_get_city_forecast/test_return_value_and_format.yaml", "/feed/london/"
+    )
+    return json.loads(body)["data"]
+
+
+def feed_data_objs(n: int) -> List[Dict[str, Any]]:
+    """n copies of the recorded feed data, each for a different station"""
+    objs = []
+    for i in range(n):
+        obj = copy.deepcopy(feed_data())
+        obj["idx"] = i
+        obj["aqi"] = i % 300
+        obj["city"]["name"] = f"station{i}"
+        objs.append(obj)
+    return objs
+
+
+# Directory of an Ozon3 historical data cache (see Ozon3's historical_cache_dir)
+# whose cities the historical benchmarks decode instead of the recorded one.
+HISTORICAL_CACHE = os.environ.get("OZON3_BENCH_HISTORICAL_CACHE")
+
+
+@lru_cache(maxsize=None)
+def historical_messages() -> List[Dict[str, Any]]:
+    """The recorded server-sent `data` events of London's historical data
+
+    With OZON3_BENCH_HISTORICAL_CACHE set, the events of every city cached
+    there instead, expired or not.
+    """
+    if HISTORICAL_CACHE:
+        cache = HistoricalCache(HISTORICAL_CACHE, ttl=None)
+        return [
+            event for city_id in cache.city_ids() for event in cache.get(city_id) or []
+        ]
+
+    (body,) = recorded_bodies(
+        "test_get_historical_data/test_column_types.yaml", "/attsse/"
+    )
+    return [
+        json.loads(line[len("data: ") :])
+        for line in body.splitlines()
+        if line.startswith("data: {")
+    ]
+
+
+def make_response(data_obj: Dict[str, Any]) -> requests.Response:
+    """A successful API response with data_obj as its data"""
+    r = requests.Response()
+    r.status_code = 200
+    r._content = json.dumps({"status": "ok", "data": data_obj}).encode()
+    return r
@@ -19,10 +19,13 @@ setuptools.setup(
         "pandas; python_version>='3'",
         "requests; python_version>='3'",
         "openpyxl; python_version>='3'",
-        "ratelimit; python_version>='3'",
         "js2py; python_version>='3'",
         "sseclient-py; python_version>='3'",
     ],
+    extras_require={
+        "spatial": ["scipy>=1.6"],
+        "parquet": ["pyarrow"],
+    },
     python_requires=">=3.6",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
@@ -1,3 +1,51 @@
-from ozon3.ozon3 import Ozon3
+from typing import TYPE_CHECKING, Any
 
-__all__ = ["Ozon3"]
+from ozon3.delta import DeltaTracker
+from ozon3.errors import APIError
+from ozon3.lite import Ozon3Lite
+from ozon3.metrics import Metrics
+from ozon3.tracing import Tracer, TraceRecorder
+from ozon3.records import AirReading
+
+if TYPE_CHECKING:
+    # The lazily imported names, for type checkers.
+    from ozon3.batch import BatchResult
+    from ozon3.collector import Collector
+    from ozon3.ozon3 import Ozon3
+    from ozon3.sinks import SQLiteSink
+
+__all__ = [
+    "Ozon3",
+    "Ozon3Lite",
+    "AirReading",
+    "Collector",
+    "DeltaTracker",
+    "SQLiteSink",
+    "APIError",
+    "BatchResult",
+    "Metrics",
+    "Tracer",
+    "TraceRecorder",
+]
+
+
+def __getattr__(name: str) -> Any:
+    # Ozon3 is imported lazily so that the pandas-free parts of the package
+    # (e.g. `ozon3.lite`) can be imported without loading pandas.
+    if name == "Ozon3":
+        from ozon3.ozon3 import Ozon3
+
+        return Ozon3
+    if name == "Collector":
+        from ozon3.collector import Collector
+
+        return Collector
+    if name == "SQLiteSink":
+        from ozon3.sinks import SQLiteSink
+
+        return SQLiteSink
+    if name == "BatchResult":
+        from ozon3.batch import BatchResult
+
+        return BatchResult
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
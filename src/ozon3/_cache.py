@@ -0,0 +1,83 @@
+"""_cache module for the Ozon3 package.
+
+This module contains the small in-memory cache that Ozon3 uses to share
+recently fetched API data between its methods.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Thread-safe in-memory cache whose entries expire after a fixed time
+
+    Lookups do not take the lock, so threads reading the cache never wait for
+    each other; only storing entries and removing expired ones do.
+
+    Attributes:
+        ttl (float): Number of seconds an entry stays valid. A ttl of 0 or less
+            disables the cache: nothing is stored and every lookup misses.
+        maxsize (int): Maximum number of entries kept. When full, the entry
+            that expires soonest is evicted to make room.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found no valid entry.
+    """
+
+    def __init__(self, ttl: float = 0.0, maxsize: int = 10000):
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get the cached value for key, or None if missing or expired"""
+        if not self.enabled:
+            return None
+
+        # A single dict lookup is atomic, and entries are never modified in
+        # place, only replaced, so no lock is needed to read them.
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            with self._lock:
+                # Another thread may have stored a fresh entry in the meantime.
+                if self._data.get(key) is entry:
+                    del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key for the next ttl seconds"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                soonest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[soonest]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self) -> None:
+        """Remove all entries and reset hit/miss counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,146 @@
+"""_hedging module for the Ozon3 package.
+
+This module contains Hedger, which sends a duplicate of a request that is
+taking unusually long, and uses whichever answer arrives first.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Optional
+
+import numpy
+
+
+class Hedger:
+    """Hedge slow requests with a duplicate, to cut tail latency
+
+    The latencies of recent requests are recorded. Once there are at least
+    min_samples of them, a request that has not answered within the given
+    percentile of those latencies gets a duplicate, and the first answer of the
+    two is used. The other one is left to finish on its own.
+
+    Attributes:
+        percentile (float): Percentile of recent latencies after which a
+            duplicate is sent, e.g. 95. None disables hedging.
+        window (int): Number of recent latencies kept.
+        min_samples (int): Number of latencies needed before hedging starts.
+        requests (int): Number of requests made through the hedger.
+        hedged (int): Number of duplicates sent, i.e. how often hedging fired.
+        hedge_wins (int): Number of times the duplicate answered first.
+    """
+
+    def __init__(
+        self,
+        percentile: Optional[float] = None,
+        window: int = 1000,
+        min_samples: int = 20,
+        max_workers: int = 64,
+    ):
+        self.percentile: Optional[float] = percentile
+        self.window: int = window
+        self.min_samples: int = min_samples
+        self.requests: int = 0
+        self.hedged: int = 0
+        self.hedge_wins: int = 0
+        self._latencies: Deque[float] = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._max_workers: int = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.percentile is not None
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a request is hedged, None if not known yet"""
+        if self.percentile is None:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = list(self._latencies)
+        return float(numpy.percentile(latencies, self.percentile))
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _submit(self, fn: Callable[[], Any], timed: bool = True) -> "Future[Any]":
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="ozon3-hedge"
+                )
+            executor = self._executor
+
+        start = time.monotonic()
+
+        def record(future: "Future[Any]") -> None:
+            # Calls that fail say nothing about how long answers take.
+            if timed and future.exception() is None:
+                self.record(time.monotonic() - start)
+
+        future = executor.submit(fn)
+        future.add_done_callback(record)
+        return future
+
+    def close(self) -> None:
+        """Stop the threads that send hedged requests, once they are done"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def call(
+        self, fn: Callable[[], Any], duplicate: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """Call fn, calling duplicate as well if fn is slow
+
+        Only the latencies of fn are recorded, so fn should time just the
+        request itself, not any wait for a rate limit.
+
+        Args:
+            fn (Callable): The request, a function without arguments.
+            duplicate (Callable, optional): Makes the same request again, e.g.
+                with another token. Defaults to fn, which must then be safe to
+                repeat.
+
+        Returns:
+            Any: The result of whichever call finished first without an error.
+        """
+        with self._lock:
+            self.requests += 1
+
+        delay = self.delay()
+        if delay is None:
+            start = time.monotonic()
+            result = fn()
+            self.record(time.monotonic() - start)
+            return result
+
+        primary = self._submit(fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedged += 1
+        second = self._submit(duplicate or fn, timed=duplicate is None)
+
+        pending = {primary, second}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    if future is second:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,109 @@
+"""_scheduler module for the Ozon3 package.
+
+This module contains PriorityScheduler, which decides in which order waiting
+requests get their turn at the rate limit, so that interactive lookups are not
+stuck behind bulk jobs.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import collections
+import contextlib
+import threading
+from typing import Deque, Dict, Iterator, Mapping, Optional
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class PriorityScheduler:
+    """Weighted fair sharing of the rate limit between priority classes
+
+    A request takes a turn before it waits for the rate limit, and gives it up
+    once the rate limit let it through. While nobody waits, a turn is granted at
+    once. Otherwise requests queue per priority class, and each freed turn goes
+    to the class that has had the least share of turns relative to its weight
+    (start-time fair queueing). With the default weights, interactive requests
+    get 8 of every 9 turns while both classes are waiting, and bulk requests get
+    every turn the interactive class does not use.
+
+    Weights given for some classes only are merged over the default weights, so
+    `{"interactive": 4}` keeps the bulk class at its default weight of 1.
+
+    Attributes:
+        weights (dict): Weight of each priority class.
+        granted (dict): Number of turns granted to each priority class.
+        queued (int): Number of turns that had to wait for another request.
+    """
+
+    def __init__(self, weights: Optional[Mapping[str, float]] = None):
+        self.weights: Dict[str, float] = {INTERACTIVE: 8.0, BULK: 1.0}
+        self.weights.update(weights or {})
+        if any(weight <= 0 for weight in self.weights.values()):
+            raise Exception("Priority weights must be positive.")
+        self.granted: Dict[str, int] = {priority: 0 for priority in self.weights}
+        self.queued: int = 0
+        self._cond = threading.Condition()
+        self._busy: bool = False
+        self._queues: Dict[str, Deque[object]] = {
+            priority: collections.deque() for priority in self.weights
+        }
+        # Virtual finish time of each class's last turn, and the virtual time
+        # of the last turn granted to any class.
+        self._finish: Dict[str, float] = {priority: 0.0 for priority in self.weights}
+        self._clock: float = 0.0
+        self._next: Optional[object] = None
+
+    def _grant(self, priority: str) -> None:
+        start = max(self._finish[priority], self._clock)
+        self._clock = start
+        self._finish[priority] = start + 1.0 / self.weights[priority]
+        self.granted[priority] += 1
+
+    @contextlib.contextmanager
+    def turn(self, priority: str) -> Iterator[None]:
+        """Wait for a turn as a request of the given priority class
+
+        Args:
+            priority (str): The priority class, e.g. "interactive" or "bulk".
+        """
+        if priority not in self.weights:
+            raise Exception(
+                f"Unknown priority {priority!r}, expected one of {list(self.weights)}."
+            )
+
+        with self._cond:
+            if self._busy:
+                ticket = object()
+                self._queues[priority].append(ticket)
+                self.queued += 1
+                while self._next is not ticket:
+                    self._cond.wait()
+                self._next = None
+            else:
+                self._busy = True
+                self._grant(priority)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                waiting = [p for p, queue in self._queues.items() if queue]
+                if waiting:
+                    # Least virtual start time first; ties go to the heavier class.
+                    priority = min(
+                        waiting,
+                        key=lambda p: (
+                            max(self._finish[p], self._clock),
+                            -self.weights[p],
+                        ),
+                    )
+                    self._next = self._queues[priority].popleft()
+                    self._grant(priority)
+                    self._cond.notify_all()
+                else:
+                    self._busy = False
+
+
+if __name__ == "__main__":
+    pass
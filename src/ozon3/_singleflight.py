@@ -0,0 +1,115 @@
+"""_singleflight module for the Ozon3 package.
+
+This module contains SingleFlight, which coalesces identical requests that are
+in flight at the same time so that only one of them reaches the network.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """A call in flight, and the outcome its waiters are waiting for"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share the same key
+
+    The first caller for a key (the leader) runs the function. Every caller that
+    arrives with the same key while the leader is still running waits for it and
+    gets the same result, or the same exception. Once the leader finishes, the
+    next call for that key runs the function again.
+
+    Attributes:
+        calls (int): Number of times a function was actually run.
+        coalesced (int): Number of calls that were answered by another call's
+            result instead of running the function, i.e. calls saved.
+    """
+
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.coalesced: int = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, _Call] = {}
+        self._in_flight_async: Dict[Tuple[int, Hashable], "asyncio.Future[Any]"] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn, unless a call with the same key is in flight; then wait for it
+
+        Args:
+            key (Hashable): Identifies calls that can share a result.
+            fn (Callable): Function with no arguments to run as leader.
+
+        Returns:
+            Any: The result of fn, from this call or the one it waited for.
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if call is None:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Asyncio counterpart of do
+
+        fn is blocking, so the leader runs it in the event loop's default
+        executor. Coroutines waiting for the same key await the leader's future
+        without occupying a thread each. The executor job itself goes through
+        do, so it is also coalesced with calls made from plain threads.
+
+        Args:
+            key (Hashable): Identifies calls that can share a result.
+            fn (Callable): Blocking function with no arguments to run as leader.
+
+        Returns:
+            Any: The result of fn, from this call or the one it waited for.
+        """
+        loop = asyncio.get_event_loop()
+        loop_key = (id(loop), key)
+
+        with self._lock:
+            future = self._in_flight_async.get(loop_key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = loop.run_in_executor(None, self.do, key, fn)
+                self._in_flight_async[loop_key] = future
+                future.add_done_callback(
+                    lambda _: self._in_flight_async.pop(loop_key, None)
+                )
+
+        # Shield so that a cancelled waiter does not cancel the shared future.
+        return await asyncio.shield(future)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,140 @@
+"""_tokens module for the Ozon3 package.
+
+This module contains TokenPool, which spreads requests over one or more WAQI
+API tokens, each with its own rate limit.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import collections
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Sequence
+
+
+class _RateLimiter:
+    """Allow at most `calls` calls in any `period` seconds, sleeping if needed"""
+
+    def __init__(self, calls: int, period: float):
+        self.calls: int = calls
+        self.period: float = period
+        self._times: Deque[float] = collections.deque(maxlen=calls)
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until a call is allowed, and count it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if len(self._times) < self.calls or (
+                    now - self._times[0] >= self.period
+                ):
+                    self._times.append(now)
+                    return
+                delay = self._times[0] + self.period - now
+            time.sleep(delay)
+
+
+class _TokenState:
+    def __init__(self, token: str, calls: int, period: float):
+        self.token: str = token
+        self.limiter: _RateLimiter = _RateLimiter(calls, period)
+        self.in_flight: int = 0
+        self.requests: int = 0
+        self.quarantined_until: float = 0.0
+
+
+class TokenPool:
+    """A set of API tokens that requests are spread over
+
+    Every token has its own rate limiter, so n tokens allow n times the request
+    rate of one. acquire picks the least loaded token: the one with the fewest
+    requests in flight, then the fewest requests so far. A token that the API
+    rejects (invalid, or over its quota) can be quarantined, which takes it out
+    of rotation for a while.
+
+    Attributes:
+        tokens (list): The tokens, in the order given.
+        calls (int): Number of requests allowed per token every period seconds.
+        period (float): Length of a rate limit window in seconds.
+        quarantine_seconds (float): Default time a quarantined token is skipped.
+    """
+
+    def __init__(
+        self,
+        tokens: Sequence[str],
+        calls: int,
+        period: float,
+        quarantine_seconds: float = 60.0,
+    ):
+        if not tokens:
+            raise Exception("A token pool needs at least one token.")
+        self.tokens: List[str] = list(dict.fromkeys(tokens))
+        self.calls: int = calls
+        self.period: float = period
+        self.quarantine_seconds: float = quarantine_seconds
+        self._states: Dict[str, _TokenState] = {
+            token: _TokenState(token, calls, period) for token in self.tokens
+        }
+        self._lock = threading.Lock()
+
+    def acquire(self) -> str:
+        """Pick a token for a request and wait for its rate limiter
+
+        If every token is quarantined, the one whose quarantine ends first is
+        used anyway, so that the request fails with the API's own error instead
+        of blocking.
+
+        Returns:
+            str: The token. Pass it to release once the request is done.
+        """
+        with self._lock:
+            now = time.monotonic()
+            states = [s for s in self._states.values() if s.quarantined_until <= now]
+            if states:
+                state = min(states, key=lambda s: (s.in_flight, s.requests))
+            else:
+                state = min(self._states.values(), key=lambda s: s.quarantined_until)
+            state.in_flight += 1
+            state.requests += 1
+
+        state.limiter.wait()
+        return state.token
+
+    def release(self, token: str) -> None:
+        """Mark a request made with token as done"""
+        with self._lock:
+            self._states[token].in_flight -= 1
+
+    def wait(self, token: str) -> None:
+        """Wait for the rate limiter of a specific token, and count the request"""
+        with self._lock:
+            self._states[token].requests += 1
+        self._states[token].limiter.wait()
+
+    def quarantine(self, token: str, seconds: Optional[float] = None) -> None:
+        """Take token out of rotation for seconds (default: quarantine_seconds)"""
+        if seconds is None:
+            seconds = self.quarantine_seconds
+        with self._lock:
+            self._states[token].quarantined_until = time.monotonic() + seconds
+
+    def is_quarantined(self, token: str) -> bool:
+        return self._states[token].quarantined_until > time.monotonic()
+
+    @property
+    def available(self) -> int:
+        """Number of tokens currently in rotation"""
+        return sum(not self.is_quarantined(token) for token in self.tokens)
+
+    def requests(self) -> Dict[str, int]:
+        """Number of requests made with each token so far"""
+        with self._lock:
+            return {token: state.requests for token, state in self._states.items()}
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,24 @@
+"""_utils module for the Ozon3 package.
+
+This module contains small helper functions shared by several Ozon3 modules.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+from typing import Any
+
+import numpy
+
+
+def _as_float(x: Any) -> float:
+    """Convert x into a float. If unable, convert into numpy.nan instead.
+
+    Naming and functionality inspired by R function as.numeric()"""
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+if __name__ == "__main__":
+    pass
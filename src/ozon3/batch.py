@@ -0,0 +1,147 @@
+"""batch module for the Ozon3 package.
+
+This module contains BatchResult, which the batch methods of Ozon3 return when
+called with `as_result=True`: the data, along with why each failed item failed,
+and a way to retry only those items.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas
+
+from .delta import DeltaTracker
+from .errors import APIError
+
+# Fetches the rows of some items. Returns one row per item and the exception of
+# every item that failed, by its position in the given list.
+_FetchRows = Callable[[List[Any]], Tuple[List[Dict[str, Any]], Dict[int, Exception]]]
+
+
+class BatchError(NamedTuple):
+    """Why one item of a batch could not be fetched
+
+    Attributes:
+        position (int): Position of the item in the batch.
+        item (Any): The item, e.g. a city name or a (latitude, longitude) pair.
+        message (str): The error message.
+        status_code (int): HTTP status code of the response, if there was one.
+        api_message (str): The error message in the API's response, if any.
+        timed_out (bool): Whether the item was not fetched before the deadline.
+    """
+
+    position: int
+    item: Any
+    message: str
+    status_code: Optional[int] = None
+    api_message: Optional[str] = None
+    timed_out: bool = False
+
+    @classmethod
+    def from_exception(cls, position: int, item: Any, e: Exception) -> "BatchError":
+        if isinstance(e, APIError):
+            return cls(position, item, str(e), e.status_code, e.api_message)
+        return cls(position, item, str(e), timed_out=isinstance(e, TimeoutError))
+
+
+class BatchResult:
+    """Data of a batch call, with details of the items that failed
+
+    Attributes:
+        errors (list): A BatchError for every item that failed, in batch order.
+    """
+
+    def __init__(
+        self,
+        items: List[Any],
+        fetch_rows: _FetchRows,
+        df: pandas.DataFrame = pandas.DataFrame(),
+        delta: Optional[DeltaTracker] = None,
+    ):
+        """Fetch every item of a batch
+
+        Args:
+            items (list): The items of the batch.
+            fetch_rows (Callable): Function that fetches the rows of a list of
+                items, returning the rows and the exceptions of failed items.
+            df (pandas.DataFrame, optional): An existing dataframe that data
+                appends the rows to.
+            delta (DeltaTracker, optional): If given, rows it has seen before
+                are left out of data.
+        """
+        self._items: List[Any] = list(items)
+        self._fetch_rows: _FetchRows = fetch_rows
+        self._df: pandas.DataFrame = df
+        self._delta: Optional[DeltaTracker] = delta
+        # One entry per item; None for rows left out by delta.
+        self._rows: List[Optional[Dict[str, Any]]] = [None] * len(self._items)
+        self.errors: List[BatchError] = []
+        self._fetch(list(range(len(self._items))))
+
+    def _fetch(self, indexes: List[int]) -> None:
+        rows, exceptions = self._fetch_rows([self._items[i] for i in indexes])
+        errors = {e.position: e for e in self.errors}
+        for j, (i, row) in enumerate(zip(indexes, rows)):
+            if j in exceptions:
+                errors[i] = BatchError.from_exception(i, self._items[i], exceptions[j])
+            else:
+                errors.pop(i, None)
+        self.errors = [errors[i] for i in sorted(errors)]
+
+        # Filter all rows in one call, so that a tracker with a path saves once.
+        if self._delta is not None:
+            kept = {id(row) for row in self._delta.filter(rows)}
+        else:
+            kept = {id(row) for row in rows}
+        for i, row in zip(indexes, rows):
+            self._rows[i] = row if id(row) in kept else None
+
+    @property
+    def data(self) -> pandas.DataFrame:
+        """The data, one row per item; failed items keep only their identifiers"""
+        rows = [row for row in self._rows if row is not None]
+        df = pandas.concat([self._df, pandas.DataFrame(rows)], ignore_index=True)
+        df.reset_index(inplace=True, drop=True)
+        return df
+
+    @property
+    def failed(self) -> List[Any]:
+        """The items that failed"""
+        return [error.item for error in self.errors]
+
+    @property
+    def ok(self) -> bool:
+        """Whether every item was fetched"""
+        return not self.errors
+
+    def retry_failed(self, attempts: int = 3, backoff: float = 1.0) -> "BatchResult":
+        """Fetch the failed items again, and merge their data into this result
+
+        Only failed items are requested, so no quota is spent on items that
+        already succeeded. Failed items are retried up to attempts times,
+        waiting backoff seconds before the first retry and twice as long before
+        each one after that.
+
+        Args:
+            attempts (int, optional): Maximum number of retries. Defaults to 3.
+            backoff (float, optional): Seconds to wait before the first retry.
+                Defaults to 1.
+
+        Returns:
+            BatchResult: This result, updated in place.
+        """
+        for attempt in range(attempts):
+            if not self.errors:
+                break
+            time.sleep(backoff * 2**attempt)
+            self._fetch([error.position for error in self.errors])
+        return self
+
+    def __repr__(self) -> str:
+        return f"<BatchResult: {len(self._items)} items, {len(self.errors)} failed>"
+
+
+if __name__ == "__main__":
+    pass
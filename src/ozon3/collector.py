@@ -0,0 +1,300 @@
+"""collector module for the Ozon3 package.
+
+This module contains the Collector class, which keeps polling a set of cities
+and coordinates with an Ozon3 client and hands the collected data to a sink.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import warnings
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import pandas
+
+from .delta import DeltaTracker
+from ._scheduler import BULK
+from .lite import CALLS, RATE_LIMIT, _as_float
+from .ozon3 import Ozon3
+
+# Fractional part of the golden ratio. Multiples of it modulo 1 are spread
+# evenly over [0, 1) however many there are, which is used to give every new
+# target its own phase within its polling interval.
+_GOLDEN_FRACTION: float = 0.6180339887498949
+
+
+class _Target(NamedTuple):
+    """A location polled by a Collector"""
+
+    kind: str  # "city" or "coordinate"
+    query: Tuple
+    interval: float
+
+
+class Collector:
+    """Continuously poll cities and coordinates, spreading requests over time
+
+    Instead of requesting every target at once and then sitting idle, the
+    collector gives each target its own phase within its polling interval, so
+    requests are spread evenly over the interval. Requests are additionally
+    paced so that they never exceed the WAQI rate limit (CALLS per RATE_LIMIT
+    seconds) or max_rate. Requests run on the client's thread pool, with at most
+    client.max_workers of them in flight at a time.
+
+    Collected rows (in the same format as Ozon3.get_multiple_city_air and
+    Ozon3.get_multiple_coordinate_air) are buffered and handed to sink as a
+    pandas.DataFrame whenever batch_size rows are ready, or flush_interval
+    seconds have passed since the last batch. With a DeltaTracker as delta,
+    readings that did not change since the previous poll are left out.
+
+    Example:
+        >>> collector = Collector(o3, sink=print, interval=15 * 60)
+        >>> collector.add_cities(["london", "paris"])
+        >>> collector.add_coordinate(51.51, -0.13, interval=5 * 60)
+        >>> collector.start()
+        >>> ...
+        >>> collector.stop()
+
+    Attributes:
+        client (Ozon3): The client used to make requests.
+        sink (Callable): Called with each batch of collected data.
+        interval (float): Default polling interval of a target, in seconds.
+        batch_size (int): Number of rows that triggers a batch.
+        flush_interval (float): Maximum number of seconds rows wait in the buffer.
+        max_rate (float): Optional cap on requests per second.
+        delta (DeltaTracker): Optional tracker used to drop repeated readings.
+        clock (Callable): Time source, in seconds (default: time.monotonic).
+        requests_made (int): Number of targets polled so far.
+        errors (int): Number of polls that failed.
+        batches_delivered (int): Number of batches handed to sink.
+    """
+
+    def __init__(
+        self,
+        client: Ozon3,
+        sink: Callable[[pandas.DataFrame], Any],
+        interval: float = 900.0,
+        batch_size: int = 100,
+        flush_interval: float = 10.0,
+        max_rate: Optional[float] = None,
+        delta: Optional[DeltaTracker] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be a positive number of seconds.")
+
+        self.client: Ozon3 = client
+        self.sink: Callable[[pandas.DataFrame], Any] = sink
+        self.interval: float = interval
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.max_rate: Optional[float] = max_rate
+        self.delta: Optional[DeltaTracker] = delta
+        self.clock: Callable[[], float] = clock
+        self.requests_made: int = 0
+        self.errors: int = 0
+        self.batches_delivered: int = 0
+
+        self._schedule: List[Tuple[float, int, _Target]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._sink_lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush: float = self.clock()
+        # Polls submitted to the client's thread pool that did not finish yet.
+        self._pending: Set[Future] = set()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_city(self, city: str, interval: Optional[float] = None) -> None:
+        """Poll a city every interval seconds (default: the collector's interval)"""
+        self._add(
+            _Target("city", (city,), self.interval if interval is None else interval)
+        )
+
+    def add_cities(self, cities: List[str], interval: Optional[float] = None) -> None:
+        """Poll each of the given cities, see add_city"""
+        for city in cities:
+            self.add_city(city, interval)
+
+    def add_coordinate(
+        self, lat: float, lon: float, interval: Optional[float] = None
+    ) -> None:
+        """Poll a coordinate every interval seconds (default: the collector's)"""
+        self._add(
+            _Target(
+                "coordinate",
+                (lat, lon),
+                self.interval if interval is None else interval,
+            )
+        )
+
+    def add_coordinates(
+        self, locations: List[Tuple], interval: Optional[float] = None
+    ) -> None:
+        """Poll each of the given (latitude, longitude) pairs, see add_coordinate"""
+        for loc in locations:
+            self.add_coordinate(loc[0], loc[1], interval)
+
+    def _add(self, target: _Target) -> None:
+        with self._lock:
+            count = next(self._counter)
+            phase = (count * _GOLDEN_FRACTION) % 1.0
+            due = self.clock() + phase * target.interval
+            heapq.heappush(self._schedule, (due, count, target))
+        self._wakeup.set()
+
+    @property
+    def min_spacing(self) -> float:
+        """Minimum number of seconds between two requests"""
+        spacing = RATE_LIMIT / CALLS
+        if self.max_rate:
+            spacing = max(spacing, 1 / self.max_rate)
+        return spacing
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start polling in a background thread"""
+        if self.running:
+            return
+        self._stopping.clear()
+        self._last_flush = self.clock()
+        self._thread = threading.Thread(
+            target=self._run, name="ozon3-collector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop polling, wait for requests in flight and deliver remaining rows"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def __enter__(self) -> "Collector":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _sleep(self, seconds: float) -> None:
+        """Wait until seconds have passed, or until woken up by a new target"""
+        self._wakeup.wait(seconds)
+        self._wakeup.clear()
+
+    def _run(self) -> None:
+        slots = threading.BoundedSemaphore(max(self.client.max_workers, 1))
+        last_dispatch = float("-inf")
+
+        def finished(future: Future) -> None:
+            with self._lock:
+                self._pending.discard(future)
+            slots.release()
+
+        while not self._stopping.is_set():
+            now = self.clock()
+            if now - self._last_flush >= self.flush_interval:
+                self.flush()
+
+            with self._lock:
+                next_due = self._schedule[0][0] if self._schedule else None
+
+            # Sleep until the next target is due, but never dispatch faster than
+            # the rate budget allows. Without targets, sleep until the next flush
+            # (or until one is added).
+            wait_time = self._last_flush + self.flush_interval - now
+            if next_due is not None:
+                wait_time = min(
+                    wait_time, max(next_due, last_dispatch + self.min_spacing) - now
+                )
+            if next_due is None or wait_time > 0:
+                self._sleep(wait_time)
+                continue
+
+            # Wait for a free slot, so that the pool's queue never grows unbounded.
+            if not slots.acquire(timeout=self.min_spacing):
+                continue
+
+            with self._lock:
+                due, count, target = heapq.heappop(self._schedule)
+                heapq.heappush(self._schedule, (due + target.interval, count, target))
+
+            last_dispatch = self.clock()
+            future = self.client._thread_pool().submit(self._poll, target)
+            with self._lock:
+                self._pending.add(future)
+            future.add_done_callback(finished)
+
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def _poll(self, target: _Target) -> None:
+        """Request one target and buffer its row"""
+        client = self.client
+        failed = False
+        try:
+            # Collection runs in the background, so it yields to interactive use.
+            with client.priority(BULK):
+                if target.kind == "city":
+                    (city,) = target.query
+                    row: Dict[str, Any] = client._extract_live_data(
+                        client._get_city_data_obj(city)
+                    )
+                    row["city"] = city
+                else:
+                    lat, lon = target.query
+                    row = client._extract_live_data(
+                        client._get_coordinate_data_obj(lat, lon)
+                    )
+        except Exception:
+            failed = True
+            if target.kind == "city":
+                row = {"city": target.query[0]}
+            else:
+                row = {
+                    "latitude": _as_float(target.query[0]),
+                    "longitude": _as_float(target.query[1]),
+                }
+
+        with self._lock:
+            self.requests_made += 1
+            self.errors += failed
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the rows collected so far to the sink, if there are any"""
+        with self._sink_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._last_flush = self.clock()
+            if self.delta is not None:
+                rows = self.delta.filter(rows)
+            if not rows:
+                return
+
+            try:
+                self.sink(pandas.DataFrame(rows))
+                self.batches_delivered += 1
+            except Exception as e:
+                warnings.warn(f"Collector sink raised an exception: {e!r}")
+
+
+if __name__ == "__main__":
+    pass
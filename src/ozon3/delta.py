@@ -0,0 +1,107 @@
+"""delta module for the Ozon3 package.
+
+This module contains DeltaTracker, which remembers the last reading seen from
+every station so that readings that did not change can be left out.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class DeltaTracker:
+    """Remember each station's last reported timestamp and drop repeated readings
+
+    Stations usually update once an hour, so most polls return the reading that
+    was already seen. Pass a DeltaTracker as the delta argument of the multiple
+    location methods of Ozon3, or to a Collector, to only get readings whose
+    station timestamp changed since the previous call.
+
+    Readings are identified by their "station_id" and "timestamp" values, as
+    several stations can share a name. Rows without them (e.g. locations that
+    could not be fetched) are always kept.
+
+    Attributes:
+        path (str): Optional JSON file the last seen timestamps are loaded from
+            and saved to, so that they survive a restart. Saved after every
+            filter call.
+        suppressed (int): Number of repeated readings left out so far.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path: Optional[str] = path
+        self.suppressed: int = 0
+        # Keyed by station ID, as a string so that it survives a JSON round trip.
+        self._last_seen: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._last_seen = json.load(f)
+
+    def is_new(self, station_id: int, timestamp: str) -> bool:
+        """Check whether a reading is new, and remember it as the last one seen
+
+        Args:
+            station_id (int): The station's ID (the `idx` of the API).
+            timestamp (str): The time the station reported the reading at.
+
+        Returns:
+            bool: False if the same timestamp was last seen from this station.
+        """
+        key = str(station_id)
+        with self._lock:
+            if self._last_seen.get(key) == timestamp:
+                self.suppressed += 1
+                return False
+            self._last_seen[key] = timestamp
+            return True
+
+    def filter(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep only the rows holding a new reading, see is_new
+
+        Args:
+            rows (iterable): Rows as returned by Ozon3Lite._extract_live_data.
+
+        Returns:
+            list: The rows that are new, in their original order.
+        """
+        kept = [
+            row
+            for row in rows
+            if not isinstance(row.get("station_id"), int)
+            or not isinstance(row.get("timestamp"), str)
+            or self.is_new(row["station_id"], row["timestamp"])
+        ]
+        if self.path is not None:
+            self.save()
+        return kept
+
+    def save(self) -> None:
+        """Write the last seen timestamps to path"""
+        if self.path is None:
+            raise Exception("DeltaTracker has no path to save to.")
+
+        with self._lock:
+            snapshot = dict(self._last_seen)
+        # Write a temporary file first so that a crash never leaves half a file.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """Forget all stations and reset the suppressed counter"""
+        with self._lock:
+            self._last_seen.clear()
+            self.suppressed = 0
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+
+if __name__ == "__main__":
+    pass
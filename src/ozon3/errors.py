@@ -0,0 +1,33 @@
+"""errors module for the Ozon3 package.
+
+This module contains the exception raised when the WAQI API answers a request
+with an error.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+from typing import Optional
+
+
+class APIError(Exception):
+    """The WAQI API answered with an error, or with a response Ozon3 can't parse
+
+    Attributes:
+        status_code (int): HTTP status code of the response.
+        api_message (str): The error message in the API's response, e.g.
+            "Unknown station", if it had one.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        api_message: Optional[str] = None,
+    ):
+        super().__init__(message)
+        self.status_code: Optional[int] = status_code
+        self.api_message: Optional[str] = api_message
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,327 @@
+"""export module for the Ozon3 package.
+
+This module contains writers that stream DataFrames to CSV, JSON Lines,
+partitioned Parquet and Excel files in fixed-size chunks, so that exports of
+any size can be written without holding all the data in memory.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import abc
+import math
+import os
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Type
+
+import openpyxl
+import pandas
+
+try:
+    # Optional: only needed for Parquet export.
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+class ChunkedWriter(abc.ABC):
+    """Base class of the writers: buffers DataFrames and writes fixed-size chunks
+
+    Data passed to write is buffered until chunk_size rows are ready, which are
+    then written out at once. The remaining rows are written by flush or close.
+    Writers are context managers that close themselves on exit.
+
+    Attributes:
+        path (str): Path of the output file (or directory, for Parquet).
+        chunk_size (int): Number of rows written at once.
+        columns (list): The columns of the output, in order. Taken from the
+            first chunk written if not given. Writers with a header (CSV and
+            Excel) raise an exception when a later chunk has data in a column
+            that is not one of them.
+        rows_written (int): Number of rows written so far.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 10000,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        self.path: str = path
+        self.chunk_size: int = chunk_size
+        self.columns: Optional[List[str]] = None if columns is None else list(columns)
+        self.rows_written: int = 0
+        self._buffer: List[pandas.DataFrame] = []
+        self._buffered: int = 0
+
+    def write(self, df: pandas.DataFrame) -> None:
+        """Add rows to the output, writing every full chunk"""
+        if df.empty:
+            return
+        self._buffer.append(df)
+        self._buffered += len(df)
+        if self._buffered < self.chunk_size:
+            return
+
+        data = pandas.concat(self._buffer, ignore_index=True)
+        full = len(data) - len(data) % self.chunk_size
+        for start in range(0, full, self.chunk_size):
+            self._write(data.iloc[start : start + self.chunk_size])
+        self._buffer = [data.iloc[full:]]
+        self._buffered = len(data) - full
+
+    def flush(self) -> None:
+        """Write the buffered rows, even if they are fewer than chunk_size"""
+        if self._buffered:
+            self._write(pandas.concat(self._buffer, ignore_index=True))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self) -> None:
+        """Write the buffered rows and finish the output"""
+        self.flush()
+
+    def _write(self, chunk: pandas.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        self._write_chunk(chunk)
+        self.rows_written += len(chunk)
+
+    def _fixed_columns(self, chunk: pandas.DataFrame) -> pandas.DataFrame:
+        """chunk with exactly the output columns, for writers with a header"""
+        columns = self.columns or []
+        unseen = [
+            c for c in chunk.columns if c not in columns and chunk[c].notna().any()
+        ]
+        if unseen:
+            raise Exception(
+                f"Columns {unseen} are not in the output's columns {columns}. "
+                "Pass every column to expect as columns when opening the writer."
+            )
+        return chunk.reindex(columns=columns)
+
+    @abc.abstractmethod
+    def _write_chunk(self, chunk: pandas.DataFrame) -> None:
+        """Write one chunk of rows to the output"""
+
+    def __enter__(self) -> "ChunkedWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class CSVWriter(ChunkedWriter):
+    """Stream rows to a CSV file
+
+    The header is the columns attribute. Every chunk is written with those
+    columns, in that order; missing ones are left empty.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 10000,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        super().__init__(path, chunk_size, columns)
+        self._file: IO[str] = open(path, "w", newline="", encoding="utf-8")
+
+    def _write_chunk(self, chunk: pandas.DataFrame) -> None:
+        first = self.rows_written == 0
+        self._fixed_columns(chunk).to_csv(self._file, header=first, index=False)
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+class JSONLinesWriter(ChunkedWriter):
+    """Stream rows to a JSON Lines file, one JSON object per row"""
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 10000,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        super().__init__(path, chunk_size, columns)
+        self._file: IO[str] = open(path, "w", encoding="utf-8")
+
+    def _write_chunk(self, chunk: pandas.DataFrame) -> None:
+        text = chunk.to_json(orient="records", lines=True, date_format="iso")
+        self._file.write(text if text.endswith("\n") else text + "\n")
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+class ParquetWriter(ChunkedWriter):
+    """Stream rows to a Parquet dataset partitioned by date (and/or station)
+
+    path is the dataset's root directory. Every chunk is written as new files in
+    hive-style partition directories, e.g. path/date=2022-05-23/....parquet. If
+    "date" is a partition column but the data has no date column (as with live
+    data), it is taken from the day of the "timestamp" column.
+
+    Requires pyarrow (pip install ozon3[parquet]).
+
+    Attributes:
+        partition_cols (list): Columns the dataset is partitioned by.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 100000,
+        partition_cols: Sequence[str] = ("date",),
+        columns: Optional[Sequence[str]] = None,
+    ):
+        if pyarrow is None:
+            raise Exception(
+                "Parquet export requires pyarrow. "
+                "Install it with: pip install ozon3[parquet]"
+            )
+        super().__init__(path, chunk_size, columns)
+        self.partition_cols: List[str] = list(partition_cols)
+        os.makedirs(path, exist_ok=True)
+
+    def _write_chunk(self, chunk: pandas.DataFrame) -> None:
+        if "date" in self.partition_cols and "date" not in chunk.columns:
+            chunk = chunk.assign(date=chunk["timestamp"].astype(str).str[:10])
+        elif "date" in self.partition_cols:
+            chunk = chunk.assign(
+                date=pandas.to_datetime(chunk["date"]).dt.strftime("%Y-%m-%d")
+            )
+        table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+        pyarrow.parquet.write_to_dataset(
+            table, root_path=self.path, partition_cols=self.partition_cols
+        )
+
+
+class ExcelWriter(ChunkedWriter):
+    """Stream rows to an Excel (.xlsx) file using openpyxl's write-only mode
+
+    Write-only workbooks keep rows on disk instead of in memory. When a sheet
+    reaches Excel's row limit, the rows continue on a new sheet. The header is
+    the columns attribute, as with CSVWriter.
+
+    Attributes:
+        sheet_name (str): Name of the first sheet. Further sheets get a number.
+    """
+
+    max_rows: int = 1048576
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 10000,
+        sheet_name: str = "data",
+        columns: Optional[Sequence[str]] = None,
+    ):
+        super().__init__(path, chunk_size, columns)
+        self.sheet_name: str = sheet_name
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet: Any = None
+        self._sheet_rows: int = 0
+        self._sheets: int = 0
+
+    def _new_sheet(self, columns: pandas.Index) -> None:
+        self._sheets += 1
+        title = self.sheet_name
+        if self._sheets > 1:
+            title = f"{self.sheet_name}_{self._sheets}"
+        self._sheet = self._workbook.create_sheet(title)
+        self._sheet.append([str(c) for c in columns])
+        self._sheet_rows = 1
+
+    def _write_chunk(self, chunk: pandas.DataFrame) -> None:
+        chunk = self._fixed_columns(chunk)
+        for row in chunk.itertuples(index=False, name=None):
+            if self._sheet is None or self._sheet_rows >= self.max_rows:
+                self._new_sheet(chunk.columns)
+            self._sheet.append([_excel_value(value) for value in row])
+            self._sheet_rows += 1
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            if self._sheet is None:
+                # openpyxl can't save a workbook without sheets.
+                self._workbook.create_sheet(self.sheet_name)
+            self._workbook.save(self.path)
+
+
+def _excel_value(value: Any) -> Any:
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pandas.NaT:
+        return None
+    return value
+
+
+WRITERS: Dict[str, Type[ChunkedWriter]] = {
+    "csv": CSVWriter,
+    "jsonl": JSONLinesWriter,
+    "parquet": ParquetWriter,
+    "xlsx": ExcelWriter,
+}
+
+_EXTENSIONS = {"ndjson": "jsonl", "json": "jsonl", "xls": "xlsx"}
+
+
+def open_writer(
+    path: str, format: Optional[str] = None, **kwargs: Any
+) -> ChunkedWriter:
+    """Open the writer for a format, see WRITERS
+
+    Args:
+        path (str): Path of the output file (or directory, for Parquet).
+        format (str, optional): "csv", "jsonl", "parquet" or "xlsx". Inferred
+            from the extension of path if not given.
+        **kwargs: Passed on to the writer, e.g. chunk_size, or columns when
+            the first chunk may not have every column.
+
+    Returns:
+        ChunkedWriter: The writer, to be closed when done.
+    """
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip(".").lower()
+        format = _EXTENSIONS.get(format, format)
+    if format not in WRITERS:
+        raise Exception(
+            f"Unknown export format {format!r}, use one of {list(WRITERS)}."
+        )
+    return WRITERS[format](path, **kwargs)
+
+
+def export(
+    frames: Iterable[pandas.DataFrame],
+    path: str,
+    format: Optional[str] = None,
+    **kwargs: Any,
+) -> int:
+    """Write DataFrames, e.g. from Ozon3's iter_* methods, to a file in chunks
+
+    Args:
+        frames (iterable): The DataFrames to write, in order.
+        path (str): Path of the output file (or directory, for Parquet).
+        format (str, optional): See open_writer.
+        **kwargs: Passed on to the writer, e.g. chunk_size.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with open_writer(path, format, **kwargs) as writer:
+        for df in frames:
+            writer.write(df)
+    return writer.rows_written
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,113 @@
+"""_disk_cache module for the Ozon3 package.
+
+This module contains HistoricalCache, which keeps the raw server-sent events of
+historical data on disk, so that historical data can be decoded again without
+downloading it again.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class HistoricalCache:
+    """Compressed on-disk cache of the historical data stream of each city
+
+    The `data` events of a city's stream are stored, as received, in one
+    gzipped JSON Lines file per city ID (`<city_id>.jsonl.gz`). Files are
+    written to a temporary file first and then renamed, so readers (threads or
+    other processes) never see a partly written file.
+
+    Example:
+        >>> o3 = Ozon3(token, historical_cache_dir="~/.cache/ozon3")
+        >>> o3.get_historical_data(city_id=5724)  # Downloaded and cached
+        >>> o3.get_historical_data(city_id=5724)  # Decoded from the cache
+
+    Attributes:
+        directory (str): Directory the files are kept in.
+        ttl (float): Number of seconds a city's file stays valid after it was
+            written. None keeps files forever.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found no valid file.
+    """
+
+    def __init__(self, directory: str, ttl: Optional[float] = 86400.0):
+        self.directory: str = os.path.expanduser(directory)
+        self.ttl: Optional[float] = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, city_id: int) -> str:
+        return os.path.join(self.directory, f"{int(city_id)}.jsonl.gz")
+
+    def get(self, city_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Get the cached events of a city, or None if missing or expired
+
+        Returns:
+            list: The parsed `data` events, as returned by
+                get_results_from_backend.
+        """
+        path = self._path(city_id)
+        try:
+            fresh = self.ttl is None or time.time() - os.path.getmtime(path) < self.ttl
+            events = self._read(path) if fresh else None
+        except (OSError, EOFError, ValueError):
+            # Missing, or unreadable (e.g. truncated by a crash): refetch.
+            events = None
+
+        with self._lock:
+            if events is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return events
+
+    def _read(self, path: str) -> List[Dict[str, Any]]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def set(self, city_id: int, events: List[Dict[str, Any]]) -> None:
+        """Store the events of a city, replacing any earlier ones"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(
+                raw, "wt", encoding="utf-8"
+            ) as f:
+                for event in events:
+                    f.write(json.dumps(event, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self._path(city_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def city_ids(self) -> List[int]:
+        """IDs of the cities with a file in the cache, expired or not"""
+        return sorted(
+            int(name.split(".")[0])
+            for name in os.listdir(self.directory)
+            if name.endswith(".jsonl.gz") and name.split(".")[0].isdigit()
+        )
+
+    def clear(self, city_id: Optional[int] = None) -> None:
+        """Delete the file of a city, or of every city"""
+        city_ids = self.city_ids() if city_id is None else [city_id]
+        for cid in city_ids:
+            try:
+                os.remove(self._path(cid))
+            except FileNotFoundError:
+                pass
+
+    def __repr__(self) -> str:
+        return f"<HistoricalCache: {self.directory!r}, ttl={self.ttl}>"
+
+
+if __name__ == "__main__":
+    pass
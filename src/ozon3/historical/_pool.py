@@ -0,0 +1,208 @@
+"""_pool module for the Ozon3 package.
+
+This module contains DecoderPool, which decodes historical data messages in
+worker processes, so that decoding several messages (or several cities) uses
+several cores instead of one.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import math
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+
+_Species = Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]
+# Where each pollutant of each message of a chunk is in its shared memory block:
+# (pollutant, offset of the timestamps, number of values); values follow the
+# timestamps.
+_Layout = List[List[Tuple[str, int, int]]]
+
+
+class DecoderPool:
+    """Worker processes that decode messages of the historical data stream
+
+    Decoding runs the aqicn.org JavaScript through js2py, which is pure Python
+    and CPU-bound, so threads can't decode in parallel. Each worker builds its
+    JavaScript context once, when it starts. Messages are sent to the workers in
+    chunks, and each chunk's timestamps and values come back as float64 arrays
+    in one shared memory block, instead of as pickled DataFrames. Workers are
+    started on first use and stopped by close, or when the interpreter exits.
+
+    The pool can be shared by any number of threads. Shared memory needs Python
+    3.8 or later; on older versions, leave historical_workers unset. Workers
+    are spawned, so they import the main module: scripts that use the pool need
+    an `if __name__ == "__main__":` guard.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        chunks (int): Number of chunks decoded so far.
+    """
+
+    def __init__(self, workers: int):
+        if workers < 1:
+            raise Exception("A decoder pool needs at least one worker.")
+        if sys.version_info < (3, 8):
+            raise Exception("Decoding in worker processes needs Python 3.8 or later.")
+        self.workers: int = workers
+        self.chunks: int = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Not fork: the parent may have threads (and their locks) that a
+                # forked worker would inherit in an unknown state.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_up,
+                )
+            return self._executor
+
+    def decode(self, messages: List[Dict[str, Any]]) -> List[_Species]:
+        """Decode messages into the timestamps and values of each pollutant
+
+        Args:
+            messages (list): The "msg" objects of the stream's data events.
+
+        Returns:
+            list: For each message, a dict of pollutant to (unix timestamps,
+                values), as float64 arrays.
+        """
+        if not messages:
+            return []
+        size = math.ceil(len(messages) / self.workers)
+        chunks = [messages[i : i + size] for i in range(0, len(messages), size)]
+        pool = self._pool()
+        futures = [pool.submit(_decode_chunk, chunk) for chunk in chunks]
+
+        result: List[_Species] = []
+        read = 0
+        try:
+            for future in futures:
+                result.extend(_read_chunk(*future.result()))
+                read += 1
+        finally:
+            # If a chunk failed, free the blocks of the chunks not read yet.
+            for future in futures[read:]:
+                if not future.cancel() and future.exception() is None:
+                    name = future.result()[0]
+                    if name is not None:
+                        _unlink(name)
+        with self._lock:
+            self.chunks += len(chunks)
+        return result
+
+    def close(self) -> None:
+        """Stop the worker processes; they are started again when needed"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def __repr__(self) -> str:
+        return f"<DecoderPool: {self.workers} workers>"
+
+
+def _warm_up() -> None:
+    """Build the JavaScript context of a worker before its first chunk"""
+    from . import _reverse_engineered  # noqa: F401
+
+
+def _decode_chunk(messages: List[Dict[str, Any]]) -> Tuple[Optional[str], _Layout]:
+    """Decode messages in a worker, into a new shared memory block"""
+    from multiprocessing import shared_memory
+
+    from ._reverse_engineered import _decode_species
+
+    decoded = [_decode_species(msg) for msg in messages]
+    layout: _Layout = []
+    offset = 0
+    for species in decoded:
+        entries = []
+        for pollutant, (timestamps, _) in species.items():
+            entries.append((pollutant, offset, len(timestamps)))
+            offset += 2 * len(timestamps)
+        layout.append(entries)
+    if not offset:
+        return None, layout
+
+    block = shared_memory.SharedMemory(create=True, size=offset * 8)
+    _untrack(block)
+    array: numpy.ndarray = numpy.ndarray((offset,), numpy.float64, block.buf)
+    for species, entries in zip(decoded, layout):
+        for (timestamps, values), (_, start, count) in zip(species.values(), entries):
+            array[start : start + count] = timestamps
+            array[start + count : start + 2 * count] = values
+    del array
+    block.close()
+    return block.name, layout
+
+
+def _untrack(block: Any) -> None:
+    """Hand the cleanup of a worker's block over to the parent
+
+    The parent unlinks the block once it has read it, so the worker's
+    registration with the resource tracker is dropped; otherwise the tracker
+    would also clean it up, and warn about a leak, when it shuts down.
+    """
+    # resource_tracker and SharedMemory._name are private. If they change, the
+    # block simply stays registered, which costs no more than that warning.
+    try:
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(block._name, "shared_memory")
+    except (ImportError, AttributeError):
+        pass
+
+
+def _read_chunk(name: Optional[str], layout: _Layout) -> List[_Species]:
+    """Copy a chunk's arrays out of its shared memory block, and free the block"""
+    from multiprocessing import shared_memory
+
+    if name is None:
+        empty = numpy.empty(0)
+        return [{pollutant: (empty, empty) for pollutant, _, _ in e} for e in layout]
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        array: numpy.ndarray = numpy.ndarray(
+            (block.size // 8,), numpy.float64, block.buf
+        )
+        try:
+            return [
+                {
+                    pollutant: (
+                        array[start : start + count].copy(),
+                        array[start + count : start + 2 * count].copy(),
+                    )
+                    for pollutant, start, count in entries
+                }
+                for entries in layout
+            ]
+        finally:
+            del array
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _unlink(name: str) -> None:
+    from multiprocessing import shared_memory
+
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+if __name__ == "__main__":
+    pass
@@ -1,12 +1,19 @@
 import json
+import time
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import js2py
+import numpy
 import pandas
 import requests
 from sseclient import SSEClient
 
+from ..metrics import Metrics
+from ..tracing import Tracer, _emit
+from ..urls import URLs
+from ._disk_cache import HistoricalCache
+from ._pool import DecoderPool
 from .relevant_funcs import JS_FUNCS
 
 # NOTE(lahdjirayhan):
@@ -20,66 +27,140 @@ _context = js2py.EvalJs()
 _context.execute(JS_FUNCS)
 
 
-def get_results_from_backend(city_id: int) -> List[Dict[str, Any]]:
-    event_data_url = f"https://api.waqi.info/api/attsse/{city_id}/yd.json"
-
-    r = requests.get(event_data_url)
-
-    # Catch cases where the returned response is not a server-sent events,
-    # i.e. an error.
-    if "text/event-stream" not in r.headers["Content-Type"]:
-        raise Exception(
-            "Server does not return data stream. "
-            f'It is likely that city ID "{city_id}" does not exist.'
-        )
-
-    client = SSEClient(r)
-    result = []
-
-    for event in client.events():
-        if event.event == "done":
-            break
-
-        try:
-            if "msg" in event.data:
-                result.append(json.loads(event.data))
-        except json.JSONDecodeError:
-            pass
+def get_results_from_backend(
+    city_id: int,
+    tracers: Sequence[Tracer] = (),
+    url: str = URLs.historical_url,
+    timeout: Optional[float] = 30.0,
+) -> List[Dict[str, Any]]:
+    event_data_url = f"{url}{city_id}/yd.json"
+    details = {"endpoint": "historical", "city_id": city_id}
+
+    if tracers:
+        _emit(tracers, "request_start", url=event_data_url, details=details)
+    start = time.perf_counter()
+    # Stream the response, so that events are handled (and traced) as they come.
+    # The timeout applies to connecting and to every wait for more data.
+    with requests.get(event_data_url, stream=True, timeout=timeout) as r:
+        if tracers:
+            _emit(
+                tracers,
+                "response",
+                seconds=time.perf_counter() - start,
+                url=event_data_url,
+                details={**details, "status_code": r.status_code},
+            )
+
+        # Catch cases where the returned response is not a server-sent events,
+        # i.e. an error.
+        if "text/event-stream" not in r.headers["Content-Type"]:
+            raise Exception(
+                "Server does not return data stream. "
+                f'It is likely that city ID "{city_id}" does not exist.'
+            )
+
+        client = SSEClient(r)
+        result = []
+
+        for event in client.events():
+            if tracers:
+                _emit(
+                    tracers,
+                    "sse_event",
+                    seconds=time.perf_counter() - start,
+                    url=event_data_url,
+                    size=len(event.data),
+                    details={**details, "event": event.event},
+                )
+            if event.event == "done":
+                break
+
+            try:
+                if "msg" in event.data:
+                    result.append(json.loads(event.data))
+            except json.JSONDecodeError:
+                pass
 
     return result
 
 
 def parse_incoming_result(json_object: dict) -> pandas.DataFrame:
+    return _species_frame(_decode_species(json_object["msg"]))
+
+
+def _decode_species(msg: dict) -> Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]:
+    """Unix timestamps and values of each pollutant of one message"""
     # Run JS code
     # Function is defined within JS code above
     # Convert result to Python dict afterwards
-    OUTPUT = _context.gatekeep_convert_date_object_to_unix_seconds(
-        json_object["msg"]
-    ).to_dict()
+    OUTPUT = _context.gatekeep_convert_date_object_to_unix_seconds(msg).to_dict()
 
-    result_dict = {}
+    species = {}
     for spec in OUTPUT["species"]:
         pollutant_name: str = spec["pol"]
+        steps = spec["values"]
+        timestamps = numpy.array([step["t"]["d"] for step in steps], dtype=float)
+        values = numpy.array([step["v"] for step in steps], dtype=float)
+        species[pollutant_name] = (timestamps, values)
+    return species
 
-        dates, values = [], []
-        for step in spec["values"]:
-            # Change unix timestamp back to datetime
-            date = datetime.fromtimestamp(step["t"]["d"])
-            value: int = step["v"]
-
-            dates.append(date)
-            values.append(value)
 
-        series = pandas.Series(values, index=dates)
-        result_dict[pollutant_name] = series
+def _species_frame(
+    species: Dict[str, Tuple[numpy.ndarray, numpy.ndarray]],
+) -> pandas.DataFrame:
+    result_dict = {}
+    for pollutant_name, (timestamps, values) in species.items():
+        # Change unix timestamp back to datetime
+        dates = [datetime.fromtimestamp(t) for t in timestamps.tolist()]
+        result_dict[pollutant_name] = pandas.Series(values, index=dates)
 
     FRAME = pandas.DataFrame(result_dict)
     return FRAME
 
 
-def get_data_from_id(city_id: int) -> pandas.DataFrame:
-    backend_data = get_results_from_backend(city_id)
-    result = pandas.concat([parse_incoming_result(data) for data in backend_data])
+def get_data_from_id(
+    city_id: int,
+    metrics: Optional[Metrics] = None,
+    tracers: Sequence[Tracer] = (),
+    url: str = URLs.historical_url,
+    pool: Optional[DecoderPool] = None,
+    cache: Optional[HistoricalCache] = None,
+    timeout: Optional[float] = 30.0,
+) -> pandas.DataFrame:
+    if metrics is None:
+        metrics = Metrics()
+
+    backend_data = cache.get(city_id) if cache is not None else None
+    if backend_data is None:
+        with metrics.time("ozon3_phase_seconds", phase="historical_fetch"):
+            backend_data = get_results_from_backend(city_id, tracers, url, timeout)
+        if cache is not None and backend_data:
+            cache.set(city_id, backend_data)
+
+    start = time.perf_counter()
+    with metrics.time("ozon3_phase_seconds", phase="historical_decode"):
+        result = _decode_results(backend_data, pool)
+    if tracers:
+        _emit(
+            tracers,
+            "decode_done",
+            seconds=time.perf_counter() - start,
+            size=len(result),
+            details={"phase": "historical_decode", "city_id": city_id},
+        )
+    return result
+
+
+def _decode_results(
+    backend_data: List[Dict[str, Any]], pool: Optional[DecoderPool] = None
+) -> pandas.DataFrame:
+    if pool is None:
+        frames = [parse_incoming_result(data) for data in backend_data]
+    else:
+        # Decode in the pool's worker processes, several messages at once.
+        messages = [data["msg"] for data in backend_data]
+        frames = [_species_frame(species) for species in pool.decode(messages)]
+    result = pandas.concat(frames)
 
     # Arrange to make most recent appear on top of DataFrame
     result = result.sort_index(ascending=False, na_position="last")
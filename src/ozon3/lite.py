@@ -0,0 +1,1413 @@
+"""lite module for the Ozon3 package.
+
+This module contains the Ozon3Lite class, the pandas-free core of Ozon3. It
+holds everything needed to talk to the WAQI API and parse its responses, and
+returns results as plain Python objects (floats, dictionaries and AirReading
+records). The main Ozon3 class builds its DataFrame-returning methods on top of
+it.
+
+Importing this module does not import pandas, so latency-sensitive services
+can use `from ozon3.lite import Ozon3Lite` without paying pandas' import and
+memory cost.
+
+This module should be used only as a part of the Ozon3 package, and should not
+be run directly.
+
+Attributes (module level):
+    CALLS (int=1000): The number of calls per second allowed by the WAQI API is 1000.
+    RATE_LIMIT (int=1): The time period in seconds for the max number of calls is
+        1 second.
+"""
+
+import contextlib
+import itertools
+import json
+import re
+import threading
+import time
+import warnings
+import weakref
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import numpy
+import requests
+
+from ._cache import TTLCache
+from ._hedging import Hedger
+from ._scheduler import BULK, INTERACTIVE, PriorityScheduler
+from ._singleflight import SingleFlight
+from ._tokens import TokenPool
+from ._utils import _as_float
+from .errors import APIError
+from .metrics import Metrics
+from .tracing import Tracer, _emit
+from .records import _COLUMN_TO_FIELD, AirReading
+from .spatial import (
+    CoordinateSnapCache,
+    InterpolatedGrid,
+    StationIndex,
+    interpolate_grid,
+)
+from .urls import URLs
+
+# 1000 calls per second is the limit allowed by API
+CALLS: int = 1000
+RATE_LIMIT: int = 1
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+_Client = TypeVar("_Client", bound="Ozon3Lite")
+
+# Stands in for the result of a request that did not finish before a deadline.
+UNFINISHED: Any = object()
+
+
+class _Config(NamedTuple):
+    """Settings every request is made with
+
+    Never modified: changing a setting replaces the whole object, so that a
+    request always uses one consistent set of settings.
+    """
+
+    token: str
+    token_pool: TokenPool
+    search_aqi_url: str
+    find_stations_url: str
+    find_coordinates_url: str
+    station_search_url: str
+    historical_url: str
+    timeout: Optional[float]
+
+
+class Ozon3Lite:
+    """Pandas-free core class for Ozon3 API
+
+    This class contains the request and parsing machinery shared by all Ozon3
+    clients, along with methods that return plain Python objects instead of
+    DataFrames. Use it directly when pandas is not wanted; use Ozon3 otherwise.
+
+    Thread safety:
+        One instance can be shared by any number of threads, and all public
+        methods can be called concurrently. The token, token pool and endpoint
+        urls are kept in one immutable configuration object, which reset_token
+        replaces as a whole, so every request sees either the old or the new
+        configuration, never a mix. Each thread uses its own HTTP session (and
+        so its own connection pool). Methods that fetch several locations at
+        once share one long-lived thread pool, so its threads keep their
+        sessions, and their open connections, from one call to the next. Calls
+        with a deadline use threads of their own, which they may abandon. Cache,
+        snap cache and station index lookups
+        do not take locks; only writes do. Hit and miss counters may be slightly
+        off while several threads update them at once.
+
+    Attributes:
+        token (str): The private API token for the WAQI API service.
+        token_pool (TokenPool): Every token requests can be made with. Each has
+            its own rate limit, and requests go to the least loaded one. Tokens
+            the API rejects as invalid or over quota are taken out of rotation
+            for a while, and the request is retried with another token.
+        max_workers (int): Number of threads used by methods that fetch several
+            locations at once. The threads are started when first needed and
+            stopped by close, or when the client is used as a context manager.
+        cache (TTLCache): Cache of recently fetched `feed` data, shared by all
+            live-data and forecast methods. Disabled unless cache_ttl is given.
+        single_flight (SingleFlight): Coalesces identical requests made at the
+            same time, e.g. by several threads asking for the same city. Its
+            `calls` and `coalesced` counters show how many requests were made and
+            how many were saved.
+        snap_cache (CoordinateSnapCache): Remembers which station answered each
+            coordinate query, so that nearby coordinates are served from that
+            station instead of a new `geo:` query. Disabled unless
+            snap_radius_km is given.
+        station_index (StationIndex): Local spatial index of every station seen
+            in a bounds request, for nearest-station and radius queries.
+        hedger (Hedger): Sends a duplicate of a `feed` request that is slower
+            than most recent ones, and uses whichever answer arrives first. Its
+            `hedged` and `hedge_wins` counters show how often that happened.
+            Disabled unless hedge_percentile is given.
+        scheduler (PriorityScheduler): Orders requests waiting for the rate
+            limit by priority class. Requests made by methods that fetch many
+            locations at once are "bulk", all others "interactive", unless
+            changed with the priority method. Interactive requests get most of
+            the rate limit while both wait; bulk requests get the rest.
+        metrics (Metrics): Request counts and latencies per endpoint, bytes
+            received, time spent waiting for the rate limit, parsing and
+            extracting data, cache hits and errors by type. Disabled unless
+            metrics is True.
+        tracers (list): Tracers whose hooks are called at every phase of every
+            request, with timing and size information. See also trace.
+    """
+
+    _default_params: List[str] = [
+        "aqi",
+        "pm2.5",
+        "pm10",
+        "o3",
+        "co",
+        "no2",
+        "so2",
+        "dew",
+        "h",
+        "p",
+        "t",
+        "w",
+        "wg",
+    ]
+
+    def __init__(
+        self,
+        token: str = "",
+        max_workers: int = 8,
+        cache_ttl: float = 0.0,
+        snap_radius_km: float = 0.0,
+        tokens: Optional[Sequence[str]] = None,
+        quarantine_seconds: float = 60.0,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = 30.0,
+        hedge_percentile: Optional[float] = None,
+        priority_weights: Optional[Dict[str, float]] = None,
+        metrics: bool = False,
+    ):
+        """Initialises the class instance and sets the API token value
+
+        Args:
+            token (str): The users private API token for the WAQI API.
+            max_workers (int, optional): Number of threads used to fetch several
+                locations concurrently. Defaults to 8.
+            cache_ttl (float, optional): Number of seconds fetched live data is
+                reused for before being requested again. Defaults to 0, which
+                disables caching.
+            snap_radius_km (float, optional): Coordinates within this many
+                kilometres of an earlier coordinate query are answered by the
+                station that answered it, from the cache. Needs cache_ttl.
+                Defaults to 0, which disables snapping.
+            tokens (list, optional): Additional API tokens to spread requests
+                over, for a higher total request rate.
+            quarantine_seconds (float, optional): Number of seconds a token the
+                API rejects is kept out of rotation. Defaults to 60.
+            base_url (str, optional): Base url of the API, e.g. of a local mirror
+                or test server such as ozon3.testing.MockWAQIServer. Station
+                search and historical data are requested from it too. Defaults
+                to "https://api.waqi.info/".
+            timeout (float, optional): Number of seconds to wait for the API to
+                respond to a request before giving up on it. Defaults to 30.
+                None waits indefinitely.
+            hedge_percentile (float, optional): Percentile of recent request
+                latencies, e.g. 95, after which a `feed` request that has not
+                answered yet is sent again. The duplicate counts against the
+                rate limit like any request. Defaults to None, which disables
+                hedging.
+            priority_weights (dict, optional): Share of the rate limit each
+                priority class gets while several classes wait for it, merged
+                over the defaults of {"interactive": 8, "bulk": 1}.
+            metrics (bool, optional): Record metrics, see the metrics attribute.
+                Defaults to False.
+        """
+        if snap_radius_km > 0 and cache_ttl <= 0:
+            # Snapped coordinates are answered by the station's cached data; with
+            # nothing cached, every one would still need a request.
+            raise Exception("snap_radius_km needs a cache_ttl greater than 0.")
+        pool = list(tokens or [])
+        if token or not pool:
+            pool.insert(0, token)
+        station_search_url = URLs.station_search_url
+        if base_url is None:
+            base_url = URLs._base_url
+        else:
+            base_url = base_url.rstrip("/") + "/"
+            station_search_url = f"{base_url}nsearch/station/"
+        self._config: _Config = _Config(
+            token=pool[0],
+            token_pool=TokenPool(pool, CALLS, RATE_LIMIT, quarantine_seconds),
+            search_aqi_url=f"{base_url}feed/",
+            find_stations_url=f"{base_url}search/",
+            find_coordinates_url=f"{base_url}map/",
+            station_search_url=station_search_url,
+            historical_url=f"{base_url}api/attsse/",
+            timeout=timeout,
+        )
+        self._local = threading.local()
+        self.max_workers: int = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_size: int = 0
+        # Every thread's session, to close them all; a thread's session goes
+        # away with the thread.
+        self._sessions: "weakref.WeakSet[requests.Session]" = weakref.WeakSet()
+        self._resources_lock = threading.Lock()
+        self.cache: TTLCache = TTLCache(ttl=cache_ttl)
+        self.single_flight: SingleFlight = SingleFlight()
+        self.snap_cache: CoordinateSnapCache = CoordinateSnapCache(snap_radius_km)
+        self.station_index: StationIndex = StationIndex()
+        self.hedger: Hedger = Hedger(hedge_percentile)
+        self.scheduler: PriorityScheduler = PriorityScheduler(priority_weights)
+        self.metrics: Metrics = Metrics(enabled=metrics)
+        self.metrics.add_collector(self._collect_metrics)
+        self.tracers: List[Tracer] = []
+        self._check_token_validity()
+
+    @property
+    def token(self) -> str:
+        return self._config.token
+
+    @token.setter
+    def token(self, token: str) -> None:
+        # Replace the whole configuration, so that threads making requests
+        # never see the new token together with the old token pool. Only the
+        # primary token is replaced; the additional tokens stay in the pool.
+        config = self._config
+        pool = config.token_pool
+        others = [t for t in pool.tokens if t not in (config.token, token)]
+        self._config = config._replace(
+            token=token,
+            token_pool=TokenPool(
+                [token, *others], pool.calls, pool.period, pool.quarantine_seconds
+            ),
+        )
+
+    @property
+    def token_pool(self) -> TokenPool:
+        return self._config.token_pool
+
+    @property
+    def _search_aqi_url(self) -> str:
+        return self._config.search_aqi_url
+
+    @property
+    def _find_stations_url(self) -> str:
+        return self._config.find_stations_url
+
+    @property
+    def _find_coordinates_url(self) -> str:
+        return self._config.find_coordinates_url
+
+    def _check_token_validity(self) -> None:
+        """Check if the tokens are valid, and quarantine those that are not"""
+        config = self._config
+        test_city: str = "london"
+        url = f"{config.search_aqi_url}/{test_city}/?token={config.token}"
+
+        for token in config.token_pool.tokens:
+            config.token_pool.wait(token)
+            r = self._get(url, token)
+
+            self._check_status_code(r)
+            if json.loads(r.content)["status"] != "ok":
+                warnings.warn("Token may be invalid!")
+                if len(config.token_pool) > 1:
+                    config.token_pool.quarantine(token)
+
+    def _make_api_request(self, url: str) -> requests.Response:
+        """Make an API request
+
+        The request is made with the least loaded token of the token pool, once
+        its rate limit allows. If the API rejects that token, it is quarantined
+        and the request is retried with the next token.
+
+        Args:
+            url (str): The url to make the request to.
+
+        Returns:
+            requests.Response: The response from the API.
+        """
+        # Use one configuration for the whole request, even if reset_token
+        # replaces it in the meantime.
+        token_pool = self._config.token_pool
+
+        for _ in range(len(token_pool)):
+            with self.metrics.time("ozon3_phase_seconds", phase="rate_limit"):
+                with self.scheduler.turn(self._priority()):
+                    token = token_pool.acquire()
+            try:
+                r = self._request_with_token(url, token, token_pool)
+            finally:
+                token_pool.release(token)
+
+            if not _is_token_rejected(r):
+                break
+            token_pool.quarantine(token)
+            if not token_pool.available:
+                break
+        return r
+
+    def _request_with_token(
+        self, url: str, token: str, token_pool: Optional[TokenPool] = None
+    ) -> requests.Response:
+        """Request url, with its token query parameter replaced by token
+
+        `feed` requests are hedged if the hedger is enabled. The hedger only
+        times the HTTP request, which starts once token has been acquired; a
+        duplicate request waits for a token of token_pool of its own.
+        """
+        if not (self.hedger.enabled and url.startswith(self._search_aqi_url)):
+            return self._get(url, token)
+
+        if token_pool is None:
+            token_pool = self._config.token_pool
+        # The hedger's threads make the requests, with this thread's priority
+        # and tracers.
+        priority, tracers = self._priority(), self._thread_tracers()
+
+        def request() -> requests.Response:
+            with self._thread_state(priority, tracers):
+                return self._get(url, token)
+
+        def duplicate() -> requests.Response:
+            with self._thread_state(priority, tracers):
+                with self.metrics.time("ozon3_phase_seconds", phase="rate_limit"):
+                    with self.scheduler.turn(priority):
+                        other_token = token_pool.acquire()
+                try:
+                    return self._get(url, other_token)
+                finally:
+                    token_pool.release(other_token)
+
+        return self.hedger.call(request, duplicate)
+
+    def _get(self, url: str, token: str) -> requests.Response:
+        """Send the HTTP request for url with token, and record its metrics"""
+        split = urlsplit(url)
+        query = parse_qsl(split.query, keep_blank_values=True)
+        if any(key == "token" and value != token for key, value in query):
+            query = [(key, token if key == "token" else value) for key, value in query]
+            url = urlunsplit(split._replace(query=urlencode(query)))
+        tracers = self._active_tracers()
+        if not self.metrics.enabled and not tracers:
+            return self._session().get(url, timeout=self._config.timeout)
+
+        endpoint = self._endpoint(url)
+        if tracers:
+            _emit(
+                tracers,
+                "request_start",
+                url=_redact(url),
+                details={"endpoint": endpoint},
+            )
+        start = time.perf_counter()
+        try:
+            r = self._session().get(url, timeout=self._config.timeout)
+        except Exception as e:
+            self.metrics.inc("ozon3_errors_total", type=type(e).__name__)
+            if tracers:
+                _emit(
+                    tracers,
+                    "response",
+                    seconds=time.perf_counter() - start,
+                    url=_redact(url),
+                    details={"endpoint": endpoint, "error": e},
+                )
+            raise
+        seconds = time.perf_counter() - start
+        self.metrics.observe("ozon3_request_seconds", seconds, endpoint=endpoint)
+        self.metrics.inc(
+            "ozon3_requests_total", endpoint=endpoint, status=r.status_code
+        )
+        self.metrics.inc(
+            "ozon3_received_bytes_total", len(r.content), endpoint=endpoint
+        )
+        if tracers:
+            _emit(
+                tracers,
+                "response",
+                seconds=seconds,
+                url=_redact(url),
+                size=len(r.content),
+                details={"endpoint": endpoint, "status_code": r.status_code},
+            )
+        return r
+
+    def _endpoint(self, url: str) -> str:
+        """Name of the API endpoint url belongs to, e.g. feed"""
+        config = self._config
+        for endpoint, prefix in (
+            ("feed", config.search_aqi_url),
+            ("search", config.find_stations_url),
+            ("map", config.find_coordinates_url),
+        ):
+            if url.startswith(prefix):
+                return endpoint
+        return "other"
+
+    def _collect_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Counters kept by the caches, the hedger and the scheduler"""
+        counters: List[Tuple[str, Dict[str, str], float]] = [
+            ("ozon3_cache_hits_total", {"cache": "feed"}, self.cache.hits),
+            ("ozon3_cache_misses_total", {"cache": "feed"}, self.cache.misses),
+            ("ozon3_cache_hits_total", {"cache": "snap"}, self.snap_cache.hits),
+            ("ozon3_cache_misses_total", {"cache": "snap"}, self.snap_cache.misses),
+            ("ozon3_coalesced_requests_total", {}, self.single_flight.coalesced),
+            ("ozon3_hedged_requests_total", {}, self.hedger.hedged),
+            ("ozon3_hedge_wins_total", {}, self.hedger.hedge_wins),
+            ("ozon3_scheduler_queued_total", {}, self.scheduler.queued),
+        ]
+        for priority, granted in self.scheduler.granted.items():
+            counters.append(
+                ("ozon3_scheduler_turns_total", {"priority": priority}, granted)
+            )
+        return counters
+
+    @contextlib.contextmanager
+    def priority(self, priority: str) -> Iterator[None]:
+        """Make the requests of the calling thread with the given priority
+
+        Applies to every request made inside the `with` block, including those
+        of methods that fetch many locations at once, e.g. to run a sweep as
+        "interactive":
+
+            with o3.priority("interactive"):
+                o3.get_multiple_city_air(cities)
+
+        Args:
+            priority (str): A priority class of the scheduler, e.g. "bulk".
+        """
+        if priority not in self.scheduler.weights:
+            raise Exception(
+                f"Unknown priority {priority!r}, "
+                f"expected one of {list(self.scheduler.weights)}."
+            )
+        with self._thread_state(priority, self._thread_tracers()):
+            yield
+
+    def _priority(self, default: str = INTERACTIVE) -> str:
+        """Priority of the calling thread's requests"""
+        priority = getattr(self._local, "priority", None)
+        return default if priority is None else priority
+
+    @contextlib.contextmanager
+    def trace(self, tracer: Tracer) -> Iterator[Tracer]:
+        """Trace the calls made by the calling thread inside a `with` block
+
+        Unlike tracers added to the tracers attribute, the tracer only sees the
+        requests of calls made inside the block (including those made by other
+        threads on their behalf, e.g. by get_multiple_city_air), which makes it
+        easy to profile one particular slow call:
+
+            with o3.trace(TraceRecorder()) as recorder:
+                o3.get_historical_data(city_id=5724)
+
+        Args:
+            tracer (Tracer): The tracer to call.
+
+        Yields:
+            Tracer: The tracer.
+        """
+        tracers = self._thread_tracers() + [tracer]
+        with self._thread_state(getattr(self._local, "priority", None), tracers):
+            yield tracer
+
+    def _thread_tracers(self) -> List[Tracer]:
+        """Tracers added by trace for the calling thread"""
+        return getattr(self._local, "tracers", None) or []
+
+    def _active_tracers(self) -> List[Tracer]:
+        """Every tracer of the calling thread's requests"""
+        local = getattr(self._local, "tracers", None)
+        return self.tracers + local if local else self.tracers
+
+    @contextlib.contextmanager
+    def _thread_state(
+        self, priority: Optional[str], tracers: List[Tracer]
+    ) -> Iterator[None]:
+        """Set the calling thread's priority and tracers for a `with` block"""
+        local = self._local
+        previous = getattr(local, "priority", None), getattr(local, "tracers", None)
+        local.priority, local.tracers = priority, tracers
+        try:
+            yield
+        finally:
+            local.priority, local.tracers = previous
+
+    def _phase(self, phase: str, **details: Any) -> Any:
+        """Context manager that times a phase for metrics and tracers"""
+        tracers = self._active_tracers()
+        if not tracers:
+            return self.metrics.time("ozon3_phase_seconds", phase=phase)
+        return self._traced_phase(tracers, phase, details)
+
+    @contextlib.contextmanager
+    def _traced_phase(
+        self, tracers: List[Tracer], phase: str, details: Dict[str, Any]
+    ) -> Iterator[None]:
+        start = time.perf_counter()
+        with self.metrics.time("ozon3_phase_seconds", phase=phase):
+            yield
+        _emit(
+            tracers,
+            "decode_done",
+            seconds=time.perf_counter() - start,
+            details={"phase": phase, **details},
+        )
+
+    def _session(self) -> requests.Session:
+        """The calling thread's HTTP session, which keeps its connections open"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            with self._resources_lock:
+                self._sessions.add(session)
+        return session
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        """The thread pool of _map_concurrently, started when first needed
+
+        The pool is replaced if max_workers has changed since it was started.
+        """
+        size = max(self.max_workers, 1)
+        old = None
+        with self._resources_lock:
+            if self._executor is None or self._executor_size != size:
+                old = self._executor
+                self._executor = ThreadPoolExecutor(
+                    max_workers=size, thread_name_prefix="ozon3"
+                )
+                self._executor_size = size
+            executor = self._executor
+        if old is not None:
+            # Calls still running on the old pool finish on their own.
+            old.shutdown(wait=False)
+        return executor
+
+    def close(self) -> None:
+        """Stop the client's threads and close its HTTP sessions
+
+        The client can still be used afterwards; threads and sessions are
+        started again when needed.
+        """
+        with self._resources_lock:
+            executor, self._executor = self._executor, None
+            sessions = list(self._sessions)
+        if executor is not None:
+            executor.shutdown()
+        self.hedger.close()
+        # A closed session opens new connections if it is used again.
+        for session in sessions:
+            session.close()
+
+    def __enter__(self: _Client) -> _Client:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _get_data_obj(self, url: str, **check_debug_info) -> Any:
+        """Request url and return the `data` part of the response
+
+        Successful responses are kept in the instance cache, so the live-data and
+        forecast methods share fetched data with each other. Concurrent calls for
+        the same url (which includes the token) are coalesced into one request.
+
+        Args:
+            url (str): The url to make the request to.
+            **check_debug_info: Passed on to _check_and_get_data_obj.
+
+        Returns:
+            Union[dict, List[dict]]: The data object of the API response.
+        """
+        data_obj = self.cache.get(url)
+        if data_obj is None:
+            data_obj = self.single_flight.do(
+                url, lambda: self._fetch_data_obj(url, **check_debug_info)
+            )
+        return data_obj
+
+    async def _get_data_obj_async(self, url: str, **check_debug_info) -> Any:
+        """Asyncio counterpart of _get_data_obj
+
+        The blocking request runs in the event loop's default executor, and is
+        coalesced with identical requests from other coroutines and threads.
+        """
+        data_obj = self.cache.get(url)
+        if data_obj is None:
+            data_obj = await self.single_flight.do_async(
+                url, lambda: self._fetch_data_obj(url, **check_debug_info)
+            )
+        return data_obj
+
+    def _fetch_data_obj(self, url: str, **check_debug_info) -> Any:
+        """Request url, parse the response and cache its data object"""
+        r = self._make_api_request(url)
+        data_obj = self._check_and_get_data_obj(r, **check_debug_info)
+        self.cache.set(url, data_obj)
+        return data_obj
+
+    def _get_city_data_obj(self, city: str) -> Any:
+        """Get the data object of a city's station
+
+        Args:
+            city (str): The city to get data for.
+
+        Returns:
+            dict: The data object of the API response.
+        """
+        return self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}",
+            city=city,  # City is for traceback
+        )
+
+    def _get_coordinate_data_obj(self, lat: Any, lon: Any) -> Any:
+        """Get the data object of the station nearest to a coordinate
+
+        If the coordinate snaps to a station that answered a nearby query, that
+        station's data is requested (or taken from the cache) instead.
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            dict: The data object of the API response.
+        """
+        uid = self.snap_cache.lookup(lat, lon)
+        if uid is not None:
+            return self._get_data_obj(self._station_url(uid))
+        return self._fetch_geo_data_obj(lat, lon)
+
+    async def _get_coordinate_data_obj_async(self, lat: Any, lon: Any) -> Any:
+        """Asyncio counterpart of _get_coordinate_data_obj"""
+        uid = self.snap_cache.lookup(lat, lon)
+        if uid is not None:
+            return await self._get_data_obj_async(self._station_url(uid))
+        data_obj = await self._get_data_obj_async(
+            f"{self._search_aqi_url}/geo:{lat};{lon}/?token={self.token}"
+        )
+        self._remember_geo_answer(lat, lon, data_obj)
+        return data_obj
+
+    def _fetch_geo_data_obj(self, lat: Any, lon: Any) -> Any:
+        """Make a `geo:` query and remember which station answered it"""
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/geo:{lat};{lon}/?token={self.token}"
+        )
+        self._remember_geo_answer(lat, lon, data_obj)
+        return data_obj
+
+    def _remember_geo_answer(self, lat: Any, lon: Any, data_obj: Any) -> None:
+        """Add the station that answered a `geo:` query to the snap cache"""
+        uid = data_obj.get("idx")
+        if self.snap_cache.enabled and uid is not None:
+            self.snap_cache.add(lat, lon, uid)
+            station_lat, station_lon = data_obj["city"]["geo"][:2]
+            self.snap_cache.add(station_lat, station_lon, uid)
+            # Nearby queries will ask for the station directly.
+            self.cache.set(self._station_url(uid), data_obj)
+
+    def _get_many_coordinate_data_objs(
+        self, locations: Sequence[Tuple], deadline: Optional[float] = None
+    ) -> List[Any]:
+        """Get the data objects for many coordinates with as few requests as possible
+
+        Coordinates that snap to a known station are grouped by station. The
+        remaining ones are clustered within the batch (same radius as the snap
+        cache, or identical coordinates if snapping is disabled), and only one
+        `geo:` query is made per cluster. Each unique station is requested once,
+        and all requests are made concurrently.
+
+        Args:
+            locations (list): Pairs of (latitude, longitude).
+            deadline (float, optional): Number of seconds to wait for the
+                requests, see _map_concurrently.
+
+        Returns:
+            list: The data object for each location, in the same order, the
+                exception raised where the location could not be fetched, or
+                UNFINISHED where its request did not finish before the deadline.
+        """
+        uids = [self.snap_cache.lookup(loc[0], loc[1]) for loc in locations]
+
+        # Cluster the coordinates that did not snap to a known station.
+        batch_snap = CoordinateSnapCache(self.snap_cache.radius_km)
+        seen: Dict[Tuple, int] = {}
+        representatives: List[Tuple] = []
+        cluster_of: Dict[int, int] = {}
+        for i, (loc, uid) in enumerate(zip(locations, uids)):
+            if uid is not None:
+                continue
+            key = (loc[0], loc[1])
+            cluster = seen.get(key)
+            if cluster is None:
+                cluster = batch_snap.lookup(*key)
+            if cluster is None:
+                cluster = len(representatives)
+                representatives.append(key)
+                batch_snap.add(*key, cluster)
+            seen[key] = cluster
+            cluster_of[i] = cluster
+
+        def fetch_geo(loc: Tuple) -> Any:
+            try:
+                return self._fetch_geo_data_obj(loc[0], loc[1])
+            except Exception as e:
+                return e
+
+        def fetch_station(uid: int) -> Any:
+            try:
+                return self._get_data_obj(self._station_url(uid))
+            except Exception as e:
+                return e
+
+        unique_uids = list(dict.fromkeys(uid for uid in uids if uid is not None))
+        tasks: List[Tuple[Callable[[Any], Any], Any]] = [
+            *((fetch_geo, loc) for loc in representatives),
+            *((fetch_station, uid) for uid in unique_uids),
+        ]
+        results = self._map_concurrently(
+            lambda task: task[0](task[1]), tasks, deadline=deadline, default=UNFINISHED
+        )
+        cluster_objs = results[: len(representatives)]
+        station_objs = dict(zip(unique_uids, results[len(representatives) :]))
+
+        return [
+            station_objs[uid] if uid is not None else cluster_objs[cluster_of[i]]
+            for i, uid in enumerate(uids)
+        ]
+
+    def _get_bounds_data(
+        self, lower_bound: Tuple[float, float], upper_bound: Tuple[float, float]
+    ) -> List[Dict[str, Any]]:
+        """Get the stations between two pair of coordinates from `map/bounds`
+
+        Every result is also added to the instance's station index.
+
+        Args:
+            lower_bound (tuple): start location
+            upper_bound (tuple): end location
+
+        Returns:
+            list: The station entries of the response, each with "lat", "lon",
+                "uid", "aqi" and "station" keys.
+        """
+        coordinates_flattened: List[float] = list(
+            itertools.chain(lower_bound, upper_bound)
+        )
+        latlng: str = ",".join(map(str, coordinates_flattened))
+        response = self._make_api_request(
+            f"{self._find_coordinates_url}bounds/?token={self.token}&latlng={latlng}"
+        )
+
+        data = self._check_and_get_data_obj(response)
+        self.station_index.update(data)
+        return data  # type: ignore
+
+    def _locate_all_coordinates(
+        self, lower_bound: Tuple[float, float], upper_bound: Tuple[float, float]
+    ) -> List[Tuple]:
+        """Get all locations between two pair of coordinates
+
+        Args:
+            lower_bound (tuple): start location
+            upper_bound (tuple): end location
+
+        Returns:
+           list: a list of all coordinates located between lower_bound and
+               upper_bound.
+        """
+        data = self._get_bounds_data(lower_bound, upper_bound)
+
+        coordinates: List[Tuple] = [
+            (element["lat"], element["lon"]) for element in data
+        ]
+        return coordinates
+
+    def update_station_index(
+        self, lower_bound: Tuple[float, float], upper_bound: Tuple[float, float]
+    ) -> int:
+        """Add all stations between two pair of coordinates to the station index
+
+        This makes a single bounds request. Call it again later to refresh the
+        stations' positions and AQI values.
+
+        Args:
+            lower_bound (tuple): start coordinate
+            upper_bound (tuple): end coordinate
+
+        Returns:
+            int: The number of stations in the index afterwards.
+        """
+        self._get_bounds_data(lower_bound, upper_bound)
+        return len(self.station_index)
+
+    def interpolate_grid(
+        self,
+        lower_bound: Tuple[float, float],
+        upper_bound: Tuple[float, float],
+        resolution: float,
+        method: str = "idw",
+        k: int = 8,
+        power: float = 2.0,
+        max_distance_km: Optional[float] = None,
+    ) -> InterpolatedGrid:
+        """Interpolate AQI onto a regular grid from a snapshot of a region
+
+        This makes a single bounds request and uses the AQI reported for each
+        station in it, so no per-station request is made. The interpolation is
+        vectorized and done in chunks, see ozon3.spatial.interpolate_grid.
+
+        Args:
+            lower_bound (tuple): start coordinate
+            upper_bound (tuple): end coordinate
+            resolution (float): Grid spacing in degrees.
+            method (str, optional): "idw" for inverse distance weighting, or
+                "nearest". Defaults to "idw".
+            k (int, optional): Number of neighbouring stations used per cell by
+                "idw". Defaults to 8.
+            power (float, optional): Power of the inverse distance weights.
+                Defaults to 2.
+            max_distance_km (float, optional): Cells whose nearest station is
+                farther than this are nan. Defaults to None, i.e. no limit.
+
+        Returns:
+            InterpolatedGrid: Named tuple of the values, shape
+                (latitudes, longitudes), and the grid's latitudes and longitudes.
+        """
+        if resolution <= 0:
+            raise ValueError("resolution must be a positive number of degrees.")
+
+        stations = StationIndex(self._get_bounds_data(lower_bound, upper_bound))
+
+        (lat_min, lat_max), (lon_min, lon_max) = (
+            sorted(pair) for pair in zip(lower_bound, upper_bound)
+        )
+        # Small tolerance so that the upper bound is included despite rounding.
+        latitudes = numpy.arange(lat_min, lat_max + resolution * 1e-9, resolution)
+        longitudes = numpy.arange(lon_min, lon_max + resolution * 1e-9, resolution)
+
+        return interpolate_grid(
+            stations,
+            latitudes,
+            longitudes,
+            method=method,
+            k=k,
+            power=power,
+            max_distance_km=max_distance_km,
+        )
+
+    def _station_url(self, uid: int) -> str:
+        """Feed url of the station with the given ID"""
+        return f"{self._search_aqi_url}/@{uid}/?token={self.token}"
+
+    def _map_concurrently(
+        self,
+        func: Callable[[_T], _R],
+        items: Iterable[_T],
+        deadline: Optional[float] = None,
+        default: Any = None,
+    ) -> List[_R]:
+        """Call func on every item using the instance's thread pool size
+
+        The calls make their requests as "bulk", unless the calling thread set
+        a priority (see the priority method). Tracers added with trace see
+        them too.
+
+        Args:
+            func (Callable): Function to call with each item. Exceptions raised
+                by it are propagated.
+            items (Iterable): Items to call func with.
+            deadline (float, optional): Number of seconds to wait for all results.
+                Calls that have not started by then are cancelled, and calls
+                still running are abandoned: they end on their own (at the
+                latest when their request times out) and their result is
+                discarded. Defaults to None, which waits for every call.
+            default (Any, optional): Result given to items whose call did not
+                finish before the deadline.
+
+        Returns:
+            list: Results of func, in the same order as items.
+        """
+        items = list(items)
+        priority, tracers = self._priority(default=BULK), self._thread_tracers()
+
+        def call(item: _T) -> _R:
+            with self._thread_state(priority, tracers):
+                return func(item)
+
+        if deadline is None:
+            if len(items) <= 1 or self.max_workers <= 1:
+                return [call(item) for item in items]
+            return list(self._thread_pool().map(call, items))
+
+        if not items:
+            return []
+        # Calls still running at the deadline keep their thread until their
+        # request ends, so they get threads of their own instead of holding up
+        # the shared pool.
+        executor = ThreadPoolExecutor(
+            max_workers=max(self.max_workers, 1), thread_name_prefix="ozon3-deadline"
+        )
+        futures = [executor.submit(call, item) for item in items]
+        try:
+            wait(futures, timeout=max(deadline, 0))
+        finally:
+            for future in futures:
+                future.cancel()
+            # Don't wait for abandoned calls.
+            executor.shutdown(wait=False)
+
+        return [
+            future.result() if future.done() and not future.cancelled() else default
+            for future in futures
+        ]
+
+    def _check_status_code(self, r: requests.Response) -> None:
+        """Check the status code of the response"""
+        if r.status_code == 200:
+            pass
+        elif r.status_code == 401:
+            raise APIError("Unauthorized!", status_code=401)
+        elif r.status_code == 404:
+            raise APIError("Not Found!", status_code=404)
+        elif r.status_code == 500:
+            raise APIError("Internal Server Error!", status_code=500)
+        else:
+            raise APIError(f"Error! Code {r.status_code}", status_code=r.status_code)
+
+    def reset_token(self, token: str) -> None:
+        """Use this method to set your API token
+
+        The token replaces the one given to the constructor (or set before);
+        additional tokens passed as `tokens` are kept.
+
+        Args:
+            token (str): The new API token.
+        """
+        self.token = token
+        self._check_token_validity()
+
+    def _extract_live_data(self, data_obj: Any) -> Dict[str, Union[str, float]]:
+        """Extract live AQI data from API response's 'data' part.
+
+        Args:
+            data_obj (JSON object returned by json.loads): The 'data' part from
+                the API's response.
+
+        Returns:
+            dict: Dictionary containing the data.
+        """
+
+        with self._phase("extract"):
+            # This dict will become a single row of data for the dataframe.
+            row: Dict[str, Union[str, float]] = {}
+
+            # City column can be added back later by the caller method.
+            row["city"] = numpy.nan
+            row["latitude"] = data_obj["city"]["geo"][0]
+            row["longitude"] = data_obj["city"]["geo"][1]
+            row["station"] = data_obj["city"]["name"]
+            # Station names are not unique; their IDs are.
+            row["station_id"] = data_obj.get("idx")
+            row["dominant_pollutant"] = data_obj["dominentpol"]
+            if data_obj["dominentpol"] == "pm25":
+                # Ensures that pm2.5 is correctly labeled.
+                row["dominant_pollutant"] = "pm2.5"
+            row["timestamp"] = data_obj["time"]["s"]
+            row["timestamp_timezone"] = data_obj["time"]["tz"]
+
+            for param in self._default_params:
+                try:
+                    if param == "aqi":
+                        # This is in different part of JSON object.
+                        row["aqi"] = _as_float(data_obj["aqi"])
+                        # This adds AQI_meaning and AQI_health_implications data.
+                        (
+                            row["AQI_meaning"],
+                            row["AQI_health_implications"],
+                        ) = self._AQI_meaning(_as_float(data_obj["aqi"]))
+                    elif param == "pm2.5":
+                        # To ensure that pm2.5 data is labelled correctly.
+                        row["pm2.5"] = _as_float(data_obj["iaqi"]["pm25"]["v"])
+                    else:
+                        row[param] = _as_float(data_obj["iaqi"][param]["v"])
+                except KeyError:
+                    # Gets triggered if the parameter is not provided by station.
+                    row[param] = numpy.nan
+
+            return row
+
+    def _extract_params(self, data_obj: Any, params: Sequence[str]) -> List[float]:
+        """Extract only the given parameters from API response's 'data' part.
+
+        This is a cheaper alternative to _extract_live_data for callers that only
+        need a few numeric values.
+
+        Args:
+            data_obj (JSON object returned by json.loads): The 'data' part from
+                the API's response.
+            params (list): Parameter names, chosen from _default_params.
+
+        Returns:
+            list: Value of each parameter as float, nan if not provided by station.
+        """
+        values: List[float] = []
+        for param in params:
+            try:
+                if param == "aqi":
+                    values.append(_as_float(data_obj["aqi"]))
+                elif param == "pm2.5":
+                    values.append(_as_float(data_obj["iaqi"]["pm25"]["v"]))
+                else:
+                    values.append(_as_float(data_obj["iaqi"][param]["v"]))
+            except KeyError:
+                values.append(numpy.nan)
+        return values
+
+    def _check_params(self, params: Sequence[str]) -> None:
+        """Raise an exception if any of params is not a known parameter"""
+        for param in params:
+            if param not in self._default_params:
+                raise Exception(
+                    f'Missing air quality parameter "{param}"\n'
+                    'Try another air quality parameters: "aqi", "no2", or "co"'
+                )
+
+    def _get_parameter_matrix(
+        self, cities: Sequence[str], params: Sequence[str]
+    ) -> numpy.ndarray:
+        """Get the given parameters for many cities as a city x param matrix
+
+        Cities are fetched concurrently. A city that can't be fetched gets a row
+        of nan instead of aborting the whole batch.
+
+        Args:
+            cities (list): Cities to get data for.
+            params (list): Parameter names, chosen from _default_params.
+
+        Returns:
+            numpy.ndarray: Float array of shape (len(cities), len(params)).
+        """
+        self._check_params(params)
+
+        def fetch(city: str) -> List[float]:
+            try:
+                data_obj = self._get_data_obj(
+                    f"{self._search_aqi_url}/{city}/?token={self.token}", city=city
+                )
+            except Exception:
+                return [numpy.nan] * len(params)
+            return self._extract_params(data_obj, params)
+
+        matrix = numpy.full((len(cities), len(params)), numpy.nan)
+        for i, values in enumerate(self._map_concurrently(fetch, cities)):
+            matrix[i, :] = values
+        return matrix
+
+    def _extract_record(self, data_obj: Any) -> AirReading:
+        """Extract live AQI data from API response's 'data' part as a record.
+
+        Args:
+            data_obj (JSON object returned by json.loads): The 'data' part from
+                the API's response.
+
+        Returns:
+            AirReading: The record containing the data. Its city field is None.
+        """
+        row = self._extract_live_data(data_obj)
+        fields: Dict[str, Any] = {
+            _COLUMN_TO_FIELD.get(col, col): value for col, value in row.items()
+        }
+        fields["city"] = None
+        return AirReading(**fields)
+
+    def _check_and_get_data_obj(
+        self, r: requests.Response, **check_debug_info
+    ) -> Union[dict, List[dict]]:
+        """Get data object from API response and throw error if any is encouuntered
+
+        Args:
+            r (requests.Response): Response object from API request.
+            **check_debug_info: Any debug info that can help make
+                exceptions in this method more informative. Give this argument in
+                format of e.g. `city="London"` to allow exceptions that can take
+                city names to show it instead of just generic exception message.
+
+        Returns:
+            Union[dict, List[dict]]: The data object i.e. the `data` part of the
+                API response, in dictionary or list format (already JSON-ified).
+
+        """
+        tracers = self._active_tracers()
+        start = time.perf_counter() if tracers else 0.0
+        try:
+            with self.metrics.time("ozon3_phase_seconds", phase="parse"):
+                data_obj = self._parse_data_obj(r, **check_debug_info)
+        except APIError as e:
+            self.metrics.inc("ozon3_errors_total", type=_error_type(e))
+            if tracers:
+                _emit(
+                    tracers,
+                    "parse_done",
+                    seconds=time.perf_counter() - start,
+                    url=_redact(r.url),
+                    size=len(r.content),
+                    details={**check_debug_info, "error": e},
+                )
+            raise
+        if tracers:
+            _emit(
+                tracers,
+                "parse_done",
+                seconds=time.perf_counter() - start,
+                url=_redact(r.url),
+                size=len(r.content),
+                details=check_debug_info,
+            )
+        return data_obj
+
+    def _parse_data_obj(
+        self, r: requests.Response, **check_debug_info
+    ) -> Union[dict, List[dict]]:
+        """Check the response and get its data object, see _check_and_get_data_obj"""
+        self._check_status_code(r)
+
+        response = json.loads(r.content)
+        status = response.get("status")
+        data = response.get("data")
+
+        if status == "ok":
+            if isinstance(data, dict) or isinstance(data, list):
+                # Only return data if status is ok and data is either dict or list.
+                # Otherwise it gets to exception raisers below.
+                return data
+
+        if isinstance(data, str):
+            if "Unknown station" in data:
+                # Usually happens when WAQI does not have a station
+                # for the searched city name.
+
+                # Check if a city name is provided so that user can get
+                # better exception message to aid them debug their program
+                city = check_debug_info.get("city")
+                city_info = f'\ncity: "{city}"' if city is not None else ""
+
+                raise APIError(
+                    "There is no known AQI station for the given query." + city_info,
+                    status_code=r.status_code,
+                    api_message=data,
+                )
+
+            if "Invalid geo position" in data:
+                # Usually happens when WAQI can't parse the given
+                # lat-lon coordinate.
+
+                # data is fortunately already informative
+                raise APIError(f"{data}", status_code=r.status_code, api_message=data)
+
+            if "Invalid key" in data:
+                raise APIError(
+                    "Your API token is invalid.",
+                    status_code=r.status_code,
+                    api_message=data,
+                )
+
+            # Unlikely since rate limiter is already used,
+            # but included anyway for completeness.
+            if "Over quota" in data:
+                raise APIError(
+                    "Too many requests within short time.",
+                    status_code=r.status_code,
+                    api_message=data,
+                )
+
+        # Catch-all exception for other not yet known cases
+        raise APIError(
+            f"Can't parse the returned response:\n{response}",
+            status_code=r.status_code,
+            api_message=data if isinstance(data, str) else None,
+        )
+
+    def _AQI_meaning(self, aqi: float) -> Tuple[str, str]:
+        """Retrieve AQI meaning and health implications
+
+        Args:
+            aqi (float): Air Quality Index (AQI) value.
+
+        Returns:
+            Tuple[str, str]: The meaning and health implication of the AQI value.
+        """
+
+        if 0 <= aqi <= 50:
+            AQI_meaning = "Good"
+            AQI_health_implications = (
+                "Air quality is considered satisfactory, "
+                "and air pollution poses little or no risk"
+            )
+        elif 51 <= aqi <= 100:
+            AQI_meaning = "Moderate"
+            AQI_health_implications = (
+                "Air quality is acceptable; however, for some pollutants "
+                "there may be a moderate health concern for a very small "
+                "number of people who are unusually sensitive to air pollution."
+            )
+        elif 101 <= aqi <= 150:
+            AQI_meaning = "Unhealthy for sensitive group"
+            AQI_health_implications = (
+                "Members of sensitive groups may experience health effects. "
+                "The general public is not likely to be affected."
+            )
+        elif 151 <= aqi <= 200:
+            AQI_meaning = "Unhealthy"
+            AQI_health_implications = (
+                "Everyone may begin to experience health effects; members of "
+                "sensitive groups may experience more serious health effects."
+            )
+        elif 201 <= aqi <= 300:
+            AQI_meaning = "Very Unhealthy"
+            AQI_health_implications = (
+                "Health warnings of emergency conditions. "
+                "The entire population is more likely to be affected."
+            )
+        elif 301 <= aqi <= 500:
+            AQI_meaning = "Hazardous"
+            AQI_health_implications = (
+                "Health alert: everyone may experience more serious health effects."
+            )
+        else:
+            AQI_meaning = "Invalid AQI value"
+            AQI_health_implications = "Invalid AQI value"
+
+        return AQI_meaning, AQI_health_implications
+
+    def get_city_air_record(self, city: str) -> AirReading:
+        """Get a city's air quality data as a lightweight record
+
+        This is the pandas-free counterpart of Ozon3.get_city_air, meant for
+        one-off lookups where building a DataFrame would cost more than the
+        request itself.
+
+        Args:
+            city (str): The city to get data for.
+
+        Returns:
+            AirReading: The record containing the data.
+        """
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}",
+            city=city,  # City is for traceback
+        )
+
+        return self._extract_record(data_obj)._replace(city=city)
+
+    def get_coordinate_air_record(self, lat: float, lon: float) -> AirReading:
+        """Get a location's air quality data by latitude and longitude as a record
+
+        This is the pandas-free counterpart of Ozon3.get_coordinate_air.
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            AirReading: The record containing the data. Its city field is None.
+        """
+        data_obj = self._get_coordinate_data_obj(lat, lon)
+
+        return self._extract_record(data_obj)
+
+    async def get_city_air_record_async(self, city: str) -> AirReading:
+        """Asyncio counterpart of get_city_air_record
+
+        Coroutines asking for the same city at the same time share one request.
+
+        Args:
+            city (str): The city to get data for.
+
+        Returns:
+            AirReading: The record containing the data.
+        """
+        data_obj = await self._get_data_obj_async(
+            f"{self._search_aqi_url}/{city}/?token={self.token}",
+            city=city,  # City is for traceback
+        )
+
+        return self._extract_record(data_obj)._replace(city=city)
+
+    async def get_coordinate_air_record_async(
+        self, lat: float, lon: float
+    ) -> AirReading:
+        """Asyncio counterpart of get_coordinate_air_record
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            AirReading: The record containing the data. Its city field is None.
+        """
+        data_obj = await self._get_coordinate_data_obj_async(lat, lon)
+
+        return self._extract_record(data_obj)
+
+    def get_specific_parameter(
+        self,
+        city: str,
+        air_param: str = "",
+    ) -> float:
+        """Get specific parameter as a float
+
+        Args:
+            city (string): A city to get the data for
+            air_param (string): A string containing the specified air quality parameter.
+                Choose from the following values:
+                ["aqi", "pm2.5", "pm10", "o3", "co", "no2", "so2", "dew", "h",
+                 "p", "t", "w", "wg"]
+                Gets all parameters by default.
+
+        Returns:
+            float: Value of the specified parameter for the given city.
+        """
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}"
+        )
+
+        self._check_params([air_param])
+        return self._extract_params(data_obj, [air_param])[0]
+
+
+def _redact(url: Optional[str]) -> Optional[str]:
+    """url with its token hidden, for tracers"""
+    if url is None:
+        return None
+    return re.sub(r"token=[^&]*", "token=***", url)
+
+
+def _error_type(e: APIError) -> str:
+    """Short type of an API error for metrics, e.g. Unknown station"""
+    if e.api_message is not None:
+        return e.api_message
+    if e.status_code is not None and e.status_code != 200:
+        return f"http_{e.status_code}"
+    return "unparseable"
+
+
+def _is_token_rejected(r: requests.Response) -> bool:
+    """Check if the API rejected the token of a request (invalid or over quota)"""
+    if r.status_code != 200 or (
+        b"Invalid key" not in r.content and b"Over quota" not in r.content
+    ):
+        return False
+    try:
+        response = json.loads(r.content)
+    except ValueError:
+        return False
+    data = response.get("data")
+    return (
+        response.get("status") == "error"
+        and isinstance(data, str)
+        and ("Invalid key" in data or "Over quota" in data)
+    )
+
+
+if __name__ == "__main__":
+    pass
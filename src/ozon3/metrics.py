@@ -0,0 +1,243 @@
+"""metrics module for the Ozon3 package.
+
+This module contains Metrics, a small registry of counters and latency
+histograms that Ozon3 records requests and parsing phases in. It can be read as
+a dict or exported in the Prometheus text format.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds, from half a millisecond to ten seconds.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: Sequence[float] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, number of observations <= it), ending with +Inf"""
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        total = 0
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", name: str, labels: _Labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        self._start: float = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._metrics._observe(
+            self._name, self._labels, time.perf_counter() - self._start
+        )
+
+
+class _NullTimer:
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Counters and latency histograms, with labels
+
+    While disabled, recording does nothing, and timing a block costs a single
+    attribute check. Counters kept elsewhere (e.g. cache hits) are added when
+    the metrics are read, by the functions given to add_collector.
+
+    Example:
+        >>> o3 = Ozon3(token, metrics=True)
+        >>> o3.get_city_air("london")
+        >>> o3.metrics.as_dict()["ozon3_requests_total"]
+        {'endpoint="feed",status="200"': 2.0}
+        >>> print(o3.metrics.to_prometheus())
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        buckets (tuple): Upper bounds of the histogram buckets, in seconds.
+    """
+
+    def __init__(
+        self, enabled: bool = False, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.enabled: bool = enabled
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._counters: Dict[str, Dict[_Labels, float]] = {}
+        self._histograms: Dict[str, Dict[_Labels, _Histogram]] = {}
+        self._collectors: List[
+            Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+        ] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """Add value to the counter name with the given labels"""
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record value (e.g. seconds) in the histogram name with the given labels"""
+        if self.enabled:
+            self._observe(name, _labels(labels), value)
+
+    def _observe(self, name: str, labels: _Labels, value: float) -> None:
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            histogram = histograms.get(labels)
+            if histogram is None:
+                histogram = histograms[labels] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def time(self, name: str, **labels: Any) -> Any:
+        """Context manager that records how long its block took in histogram name
+
+        Example:
+            >>> with metrics.time("ozon3_phase_seconds", phase="parse"):
+            ...     data = json.loads(content)
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, _labels(labels))
+
+    def add_collector(
+        self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+    ) -> None:
+        """Add counters kept elsewhere to the output
+
+        Args:
+            collector (Callable): Called whenever the metrics are read, returning
+                (name, labels, value) of each counter to add.
+        """
+        self._collectors.append(collector)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def _snapshot(
+        self,
+    ) -> Tuple[Dict[str, Dict[_Labels, float]], Dict[str, Dict[_Labels, _Histogram]]]:
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._counters.items()}
+            histograms = {
+                name: dict(values) for name, values in self._histograms.items()
+            }
+        if self.enabled:
+            for collector in self._collectors:
+                for name, labels, value in collector():
+                    counters.setdefault(name, {})[_labels(labels)] = float(value)
+        return counters, histograms
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """The metrics, by name and then by labels (as in the Prometheus format)
+
+        Counters map to their value. Histograms map to a dict with "count",
+        "sum" and "buckets", the cumulative count of each bucket's upper bound.
+        """
+        counters, histograms = self._snapshot()
+        result: Dict[str, Dict[str, Any]] = {}
+        for name, values in sorted(counters.items()):
+            result[name] = {_format_labels(k): v for k, v in sorted(values.items())}
+        for name, hists in sorted(histograms.items()):
+            result[name] = {
+                _format_labels(k): {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "buckets": dict(h.cumulative()),
+                }
+                for k, h in sorted(hists.items())
+            }
+        return result
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        counters, histograms = self._snapshot()
+        lines = []
+        for name, values in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_braced(labels)} {_format_value(value)}")
+        for name, hists in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in sorted(hists.items()):
+                for bound, count in h.cumulative():
+                    bucket_labels = labels + (("le", bound),)
+                    lines.append(f"{name}_bucket{_braced(bucket_labels)} {count}")
+                lines.append(f"{name}_sum{_braced(labels)} {_format_value(h.sum)}")
+                lines.append(f"{name}_count{_braced(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict[str, Any]) -> _Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: _Labels) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+def _braced(labels: _Labels) -> str:
+    return "{" + _format_labels(labels) + "}" if labels else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+if __name__ == "__main__":
+    pass
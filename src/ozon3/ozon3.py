@@ -6,40 +6,50 @@ collection done by the Ozon3 package.
 This module should be used only as a part of the Ozon3 package, and should not
 be run directly.
 
+The request and parsing machinery lives in the pandas-free Ozon3Lite base
+class (see lite.py); this module adds the methods that return DataFrames.
+
 Attributes (module level):
     CALLS (int=1000): The number of calls per second allowed by the WAQI API is 1000.
     RATE_LIMIT (int=1): The time period in seconds for the max number of calls is
         1 second.
 """
-import itertools
-import json
+
+import heapq
+import os
 import warnings
-from typing import Any, Dict, List, Tuple, Union
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    overload,
+)
 
-import numpy
 import pandas
-import requests
-from ratelimit import limits, sleep_and_retry
 
+from .batch import BatchResult
+from .delta import DeltaTracker
+from .export import export
+from .historical._disk_cache import HistoricalCache
+from .historical._pool import DecoderPool
 from .historical._reverse_engineered import get_data_from_id
-from .urls import URLs
-
-# 1000 calls per second is the limit allowed by API
-CALLS: int = 1000
-RATE_LIMIT: int = 1
-
+from .lite import CALLS, RATE_LIMIT, UNFINISHED, Ozon3Lite, _as_float  # noqa: F401
+from .sinks import SQLiteSink
 
-def _as_float(x: Any) -> float:
-    """Convert x into a float. If unable, convert into numpy.nan instead.
+if TYPE_CHECKING:
+    # typing.Literal is only in Python 3.8 and later.
+    from typing_extensions import Literal
 
-    Naming and functionality inspired by R function as.numeric()"""
-    try:
-        return float(x)
-    except (TypeError, ValueError):
-        return numpy.nan
 
-
-class Ozon3:
+class Ozon3(Ozon3Lite):
     """Primary class for Ozon3 API
 
     This class contains all the methods used for data collection.
@@ -48,130 +58,139 @@ class Ozon3:
 
     Attributes:
         token (str): The private API token for the WAQI API service.
+        output_path (str): Directory that sqlite_sink stores its database in.
+        file_name (str): Name of that database file, without extension.
+        historical_pool (DecoderPool): Worker processes that decode historical
+            data, so that it is decoded on several cores. None, which decodes
+            in the calling thread, unless historical_workers is given.
+        historical_cache (HistoricalCache): On-disk cache of downloaded
+            historical data, which get_historical_data decodes again instead
+            of downloading it. None unless historical_cache_dir is given.
     """
 
-    _search_aqi_url: str = URLs.search_aqi_url
-    _find_stations_url: str = URLs.find_stations_url
-    _default_params: List[str] = [
-        "aqi",
-        "pm2.5",
-        "pm10",
-        "o3",
-        "co",
-        "no2",
-        "so2",
-        "dew",
-        "h",
-        "p",
-        "t",
-        "w",
-        "wg",
-    ]
-
     def __init__(
-        self, token: str = "", output_path: str = ".", file_name: str = "air_quality"
+        self,
+        token: str = "",
+        output_path: str = ".",
+        file_name: str = "air_quality",
+        max_workers: int = 8,
+        cache_ttl: float = 0.0,
+        snap_radius_km: float = 0.0,
+        tokens: Optional[List[str]] = None,
+        quarantine_seconds: float = 60.0,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = 30.0,
+        hedge_percentile: Optional[float] = None,
+        priority_weights: Optional[Dict[str, float]] = None,
+        metrics: bool = False,
+        historical_workers: int = 0,
+        historical_cache_dir: Optional[str] = None,
+        historical_cache_ttl: Optional[float] = 86400.0,
     ):
         """Initialises the class instance and sets the API token value
 
         Args:
             token (str): The users private API token for the WAQI API.
+            output_path (str, optional): Directory that sqlite_sink stores its
+                database in. Defaults to the current directory.
+            file_name (str, optional): Name of that database file, without
+                extension. Defaults to "air_quality".
+            max_workers (int, optional): Number of threads used to fetch several
+                locations concurrently. Defaults to 8.
+            cache_ttl (float, optional): Number of seconds fetched live data is
+                reused for before being requested again. Defaults to 0, which
+                disables caching.
+            snap_radius_km (float, optional): Coordinates within this many
+                kilometres of an earlier coordinate query are answered by the
+                station that answered it, from the cache. Needs cache_ttl.
+                Defaults to 0, which disables snapping.
+            tokens (list, optional): Additional API tokens to spread requests
+                over, for a higher total request rate.
+            quarantine_seconds (float, optional): Number of seconds a token the
+                API rejects is kept out of rotation. Defaults to 60.
+            base_url (str, optional): Base url of the API, e.g. of a local mirror
+                or test server. Defaults to "https://api.waqi.info/".
+            timeout (float, optional): Number of seconds to wait for the API to
+                respond to a request before giving up on it. Defaults to 30.
+                None waits indefinitely.
+            hedge_percentile (float, optional): Percentile of recent request
+                latencies, e.g. 95, after which a `feed` request that has not
+                answered yet is sent again. Defaults to None, which disables
+                hedging.
+            priority_weights (dict, optional): Share of the rate limit each
+                priority class gets while several classes wait for it, merged
+                over the defaults of {"interactive": 8, "bulk": 1}.
+            metrics (bool, optional): Record request and parsing metrics in
+                the metrics attribute. Defaults to False.
+            historical_workers (int, optional): Number of worker processes
+                that decode historical data, started on first use. Defaults
+                to 0, which decodes in the calling thread. Needs Python 3.8
+                or later. Workers are spawned as new processes that import
+                the main module, so a script that uses them must create the
+                instance under an `if __name__ == "__main__":` guard.
+            historical_cache_dir (str, optional): Directory to keep downloaded
+                historical data in, compressed. Defaults to None, which
+                disables the cache.
+            historical_cache_ttl (float, optional): Number of seconds cached
+                historical data is used for before being downloaded again.
+                Defaults to one day. None uses it forever.
         """
-        self.token: str = token
-        self._check_token_validity()
-
-    def _check_token_validity(self) -> None:
-        """Check if the token is valid"""
-        test_city: str = "london"
-        r = self._make_api_request(
-            f"{self._search_aqi_url}/{test_city}/?token={self.token}"
+        self.output_path: str = output_path
+        self.file_name: str = file_name
+        self.historical_pool: Optional[DecoderPool] = (
+            DecoderPool(historical_workers) if historical_workers else None
+        )
+        self.historical_cache: Optional[HistoricalCache] = None
+        if historical_cache_dir is not None:
+            self.historical_cache = HistoricalCache(
+                historical_cache_dir, ttl=historical_cache_ttl
+            )
+        super().__init__(
+            token,
+            max_workers=max_workers,
+            cache_ttl=cache_ttl,
+            snap_radius_km=snap_radius_km,
+            tokens=tokens,
+            quarantine_seconds=quarantine_seconds,
+            base_url=base_url,
+            timeout=timeout,
+            hedge_percentile=hedge_percentile,
+            priority_weights=priority_weights,
+            metrics=metrics,
         )
 
-        self._check_status_code(r)
-        if json.loads(r.content)["status"] != "ok":
-            warnings.warn("Token may be invalid!")
-
-    @sleep_and_retry
-    @limits(calls=CALLS, period=RATE_LIMIT)
-    def _make_api_request(self, url: str) -> requests.Response:
-        """Make an API request
-
-        Args:
-            url (str): The url to make the request to.
-
-        Returns:
-            requests.Response: The response from the API.
-        """
-        r = requests.get(url)
-        return r
-
-    def _check_status_code(self, r: requests.Response) -> None:
-        """Check the status code of the response"""
-        if r.status_code == 200:
-            pass
-        elif r.status_code == 401:
-            raise Exception("Unauthorized!")
-        elif r.status_code == 404:
-            raise Exception("Not Found!")
-        elif r.status_code == 500:
-            raise Exception("Internal Server Error!")
-        else:
-            raise Exception(f"Error! Code {r.status_code}")
-
-    def reset_token(self, token: str) -> None:
-        """Use this method to set your API token
-
-        Args:
-            token (str): The new API token.
-        """
-        self.token = token
-        self._check_token_validity()
-
-    def _extract_live_data(self, data_obj: Any) -> Dict[str, Union[str, float]]:
-        """Extract live AQI data from API response's 'data' part.
+    def _collect_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Counters of the base class, and of the historical data cache"""
+        counters = super()._collect_metrics()
+        cache = self.historical_cache
+        if cache is not None:
+            labels = {"cache": "historical"}
+            counters.append(("ozon3_cache_hits_total", labels, cache.hits))
+            counters.append(("ozon3_cache_misses_total", labels, cache.misses))
+        return counters
+
+    def close(self) -> None:
+        """Stop the client's threads and worker processes, and close its sessions"""
+        super().close()
+        if self.historical_pool is not None:
+            self.historical_pool.close()
+
+    def sqlite_sink(self, batch_size: int = 50000) -> SQLiteSink:
+        """Open the SQLite database at output_path/file_name.db to store results in
+
+        Example:
+            >>> with o3.sqlite_sink() as sink:
+            ...     sink.write_live(o3.get_multiple_city_air(["london", "paris"]))
 
         Args:
-            data_obj (JSON object returned by json.loads): The 'data' part from
-                the API's response.
+            batch_size (int, optional): Number of rows written per transaction.
 
         Returns:
-            dict: Dictionary containing the data.
+            SQLiteSink: The sink, see SQLiteSink for its methods.
         """
-
-        # This dict will become a single row of data for the dataframe.
-        row: Dict[str, Union[str, float]] = {}
-
-        # City column can be added back later by the caller method.
-        row["city"] = numpy.nan
-        row["latitude"] = data_obj["city"]["geo"][0]
-        row["longitude"] = data_obj["city"]["geo"][1]
-        row["station"] = data_obj["city"]["name"]
-        row["dominant_pollutant"] = data_obj["dominentpol"]
-        if data_obj["dominentpol"] == "pm25":
-            # Ensures that pm2.5 is correctly labeled.
-            row["dominant_pollutant"] = "pm2.5"
-        row["timestamp"] = data_obj["time"]["s"]
-        row["timestamp_timezone"] = data_obj["time"]["tz"]
-
-        for param in self._default_params:
-            try:
-                if param == "aqi":
-                    # This is in different part of JSON object.
-                    row["aqi"] = _as_float(data_obj["aqi"])
-                    # This adds AQI_meaning and AQI_health_implications data.
-                    (
-                        row["AQI_meaning"],
-                        row["AQI_health_implications"],
-                    ) = self._AQI_meaning(_as_float(data_obj["aqi"]))
-                elif param == "pm2.5":
-                    # To ensure that pm2.5 data is labelled correctly.
-                    row["pm2.5"] = _as_float(data_obj["iaqi"]["pm25"]["v"])
-                else:
-                    row[param] = _as_float(data_obj["iaqi"][param]["v"])
-            except KeyError:
-                # Gets triggered if the parameter is not provided by station.
-                row[param] = numpy.nan
-
-        return row
+        os.makedirs(self.output_path, exist_ok=True)
+        path = os.path.join(self.output_path, f"{self.file_name}.db")
+        return SQLiteSink(path, batch_size=batch_size)
 
     def _extract_forecast_data(self, data_obj: Any) -> pandas.DataFrame:
         """Extract forecast data from API response's 'data' part.
@@ -195,149 +214,58 @@ class Ozon3:
         df = df.apply(lambda x: pandas.to_numeric(x, errors="coerce")).astype(float)
         df.index = pandas.to_datetime(df.index)
         df = df.reset_index().rename(columns={"day": "date"})
+        if "pm25" in df.columns:
+            # This ensures that pm25 data is labelled correctly.
+            df.rename(columns={"pm25": "pm2.5"}, inplace=True)
         return df
 
-    def _check_and_get_data_obj(
-        self, r: requests.Response, **check_debug_info
-    ) -> Union[dict, List[dict]]:
-        """Get data object from API response and throw error if any is encouuntered
-
-        Args:
-            r (requests.Response): Response object from API request.
-            **check_debug_info: Any debug info that can help make
-                exceptions in this method more informative. Give this argument in
-                format of e.g. `city="London"` to allow exceptions that can take
-                city names to show it instead of just generic exception message.
-
-        Returns:
-            Union[dict, List[dict]]: The data object i.e. the `data` part of the
-                API response, in dictionary or list format (already JSON-ified).
-
-        """
-        self._check_status_code(r)
-
-        response = json.loads(r.content)
-        status = response.get("status")
-        data = response.get("data")
-
-        if status == "ok":
-            if isinstance(data, dict) or isinstance(data, list):
-                # Only return data if status is ok and data is either dict or list.
-                # Otherwise it gets to exception raisers below.
-                return data
-
-        if isinstance(data, str):
-            if "Unknown station" in data:
-                # Usually happens when WAQI does not have a station
-                # for the searched city name.
-
-                # Check if a city name is provided so that user can get
-                # better exception message to aid them debug their program
-                city = check_debug_info.get("city")
-                city_info = f'\ncity: "{city}"' if city is not None else ""
-
-                raise Exception(
-                    "There is no known AQI station for the given query." + city_info
-                )
-
-            if "Invalid geo position" in data:
-                # Usually happens when WAQI can't parse the given
-                # lat-lon coordinate.
-
-                # data is fortunately already informative
-                raise Exception(f"{data}")
-
-            if "Invalid key" in data:
-                raise Exception("Your API token is invalid.")
-
-            # Unlikely since rate limiter is already used,
-            # but included anyway for completeness.
-            if "Over quota" in data:
-                raise Exception("Too many requests within short time.")
-
-        # Catch-all exception for other not yet known cases
-        raise Exception(f"Can't parse the returned response:\n{response}")
+    def get_nearest_stations(
+        self, lat: float, lon: float, k: int = 5
+    ) -> pandas.DataFrame:
+        """Get the k stations nearest to a location, from the local station index
 
-    def _AQI_meaning(self, aqi: float) -> Tuple[str, str]:
-        """Retrieve AQI meaning and health implications
+        No request is made. The station index only knows the stations returned
+        by earlier bounds requests, see update_station_index.
 
         Args:
-            aqi (float): Air Quality Index (AQI) value.
+            lat (float): Latitude
+            lon (float): Longitude
+            k (int, optional): Number of stations to return. Defaults to 5.
 
         Returns:
-            Tuple[str, str]: The meaning and health implication of the AQI value.
+            pandas.DataFrame: The stations sorted from nearest to farthest, with
+                columns uid, station, latitude, longitude, aqi, time and
+                distance_km. The aqi and time columns are as of the bounds
+                request that added the station.
         """
+        distances, rows = self.station_index.nearest(lat, lon, k=k)
+        return self._station_frame(rows[0], distances[0])
 
-        if 0 <= aqi <= 50:
-            AQI_meaning = "Good"
-            AQI_health_implications = (
-                "Air quality is considered satisfactory, "
-                "and air pollution poses little or no risk"
-            )
-        elif 51 <= aqi <= 100:
-            AQI_meaning = "Moderate"
-            AQI_health_implications = (
-                "Air quality is acceptable; however, for some pollutants "
-                "there may be a moderate health concern for a very small "
-                "number of people who are unusually sensitive to air pollution."
-            )
-        elif 101 <= aqi <= 150:
-            AQI_meaning = "Unhealthy for sensitive group"
-            AQI_health_implications = (
-                "Members of sensitive groups may experience health effects. "
-                "The general public is not likely to be affected."
-            )
-        elif 151 <= aqi <= 200:
-            AQI_meaning = "Unhealthy"
-            AQI_health_implications = (
-                "Everyone may begin to experience health effects; members of "
-                "sensitive groups may experience more serious health effects."
-            )
-        elif 201 <= aqi <= 300:
-            AQI_meaning = "Very Unhealthy"
-            AQI_health_implications = (
-                "Health warnings of emergency conditions. "
-                "The entire population is more likely to be affected."
-            )
-        elif 301 <= aqi <= 500:
-            AQI_meaning = "Hazardous"
-            AQI_health_implications = (
-                "Health alert: everyone may experience more serious health effects."
-            )
-        else:
-            AQI_meaning = "Invalid AQI value"
-            AQI_health_implications = "Invalid AQI value"
-
-        return AQI_meaning, AQI_health_implications
+    def get_stations_within(
+        self, lat: float, lon: float, radius_km: float
+    ) -> pandas.DataFrame:
+        """Get all stations within a radius of a location, from the local index
 
-    def _locate_all_coordinates(
-        self, lower_bound: Tuple[float, float], upper_bound: Tuple[float, float]
-    ) -> List[Tuple]:
-        """Get all locations between two pair of coordinates
+        No request is made. The station index only knows the stations returned
+        by earlier bounds requests, see update_station_index.
 
         Args:
-            lower_bound (tuple): start location
-            upper_bound (tuple): end location
+            lat (float): Latitude
+            lon (float): Longitude
+            radius_km (float): Search radius in kilometres.
 
         Returns:
-           list: a list of all coordinates located between lower_bound and
-               upper_bound.
+            pandas.DataFrame: The stations sorted from nearest to farthest, in
+                the same format as get_nearest_stations.
         """
+        distances, rows = self.station_index.within(lat, lon, radius_km)
+        return self._station_frame(rows, distances)
 
-        coordinates_flattened: List[float] = list(
-            itertools.chain(lower_bound, upper_bound)
-        )
-        latlng: str = ",".join(map(str, coordinates_flattened))
-        response = self._make_api_request(
-            f"{URLs.find_coordinates_url}bounds/?token={self.token}&latlng={latlng}"
-        )
-
-        data = self._check_and_get_data_obj(response)
-
-        coordinates: List[Tuple] = [
-            (element["lat"], element["lon"]) for element in data
-        ]
-        return coordinates
+    def _station_frame(self, rows: Any, distances: Any) -> pandas.DataFrame:
+        """Build a DataFrame of station index entries and their distances"""
+        df = pandas.DataFrame(self.station_index.columns(rows))
+        df["distance_km"] = distances
+        return df
 
     def get_coordinate_air(
         self,
@@ -356,10 +284,7 @@ class Ozon3:
         Returns:
             pandas.DataFrame: The dataframe containing the data.
         """
-        r = self._make_api_request(
-            f"{self._search_aqi_url}/geo:{lat};{lon}/?token={self.token}"
-        )
-        data_obj = self._check_and_get_data_obj(r)
+        data_obj = self._get_coordinate_data_obj(lat, lon)
 
         row = self._extract_live_data(data_obj)
         df = pandas.concat([df, pandas.DataFrame([row])], ignore_index=True)
@@ -380,8 +305,10 @@ class Ozon3:
         Returns:
             pandas.DataFrame: The dataframe containing the data.
         """
-        r = self._make_api_request(f"{self._search_aqi_url}/{city}/?token={self.token}")
-        data_obj = self._check_and_get_data_obj(r, city=city)  # City is for traceback
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}",
+            city=city,  # City is for traceback
+        )
 
         row = self._extract_live_data(data_obj)
         row["city"] = city
@@ -389,42 +316,157 @@ class Ozon3:
         df = pandas.concat([df, pandas.DataFrame([row])], ignore_index=True)
         return df
 
+    @overload
+    def get_multiple_coordinate_air(
+        self,
+        locations: List[Tuple],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: "Literal[False]" = ...,
+    ) -> pandas.DataFrame: ...
+
+    @overload
+    def get_multiple_coordinate_air(
+        self,
+        locations: List[Tuple],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        *,
+        as_result: "Literal[True]",
+    ) -> BatchResult: ...
+
+    @overload
+    def get_multiple_coordinate_air(
+        self,
+        locations: List[Tuple],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: bool = ...,
+    ) -> Union[pandas.DataFrame, BatchResult]: ...
+
     def get_multiple_coordinate_air(
         self,
         locations: List[Tuple],
         df: pandas.DataFrame = pandas.DataFrame(),
-    ) -> pandas.DataFrame:
+        delta: Optional[DeltaTracker] = None,
+        deadline: Optional[float] = None,
+        as_result: bool = False,
+    ) -> Union[pandas.DataFrame, BatchResult]:
         """Get multiple locations air quality data
 
+        Locations are fetched concurrently. Identical locations, and locations
+        that snap to the same station (see snap_radius_km), share one request.
+
         Args:
             locations (list): A list of pair (latitude,longitude) to get data for.
             df (pandas.DataFrame, optional): An existing dataframe to
                 append the data to.
+            delta (DeltaTracker, optional): If given, only readings whose station
+                timestamp changed since they were last seen by it are returned.
+            deadline (float, optional): Maximum number of seconds the whole call
+                may take, see get_multiple_city_air.
+            as_result (bool, optional): Return a BatchResult instead of the
+                dataframe, see get_multiple_city_air.
 
         Returns:
-            pandas.DataFrame: The dataframe containing the data.
+            pandas.DataFrame: The dataframe containing the data, or a
+                BatchResult if as_result is True.
         """
-        for loc in locations:
-            try:
-                # This just makes sure that it's always a returns a pandas.DataFrame.
-                # Makes mypy happy.
-                df = pandas.DataFrame(self.get_coordinate_air(loc[0], loc[1], df=df))
-            except Exception:
-                # NOTE: If we have custom exception we can catch it instead.
-                empty_row = pandas.DataFrame(
-                    {"latitude": [_as_float(loc[0])], "longitude": [_as_float(loc[1])]}
-                )
-                df = pandas.concat([df, empty_row], ignore_index=True)
+        if as_result:
+            return BatchResult(
+                locations,
+                lambda items: _rows_and_errors(
+                    self._coordinate_air_rows, items, deadline
+                ),
+                df=df,
+                delta=delta,
+            )
+
+        rows = self._coordinate_air_rows(locations, deadline)
+        if delta is not None:
+            rows = delta.filter(rows)
 
-        df.reset_index(inplace=True, drop=True)
+        with self._phase("dataframe"):
+            df = pandas.concat([df, pandas.DataFrame(rows)], ignore_index=True)
+            df.reset_index(inplace=True, drop=True)
         return df
 
+    def _coordinate_air_rows(
+        self,
+        locations: List[Tuple],
+        deadline: Optional[float] = None,
+        errors: Optional[Dict[int, Exception]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Live data rows of get_multiple_coordinate_air, one per location
+
+        With a deadline, every row gets a "timed_out" value, which is True for
+        locations not fetched in time. If errors is given, the exception of every
+        location that failed is added to it, by the location's position.
+        """
+        rows: List[Dict[str, Any]] = []
+        data_objs = self._get_many_coordinate_data_objs(locations, deadline)
+        for i, (loc, data_obj) in enumerate(zip(locations, data_objs)):
+            if data_obj is UNFINISHED or isinstance(data_obj, Exception):
+                # Location could not be fetched, keep only its coordinates.
+                row: Dict[str, Any] = {
+                    "latitude": _as_float(loc[0]),
+                    "longitude": _as_float(loc[1]),
+                }
+                if errors is not None:
+                    errors[i] = _timeout_error() if data_obj is UNFINISHED else data_obj
+            else:
+                row = self._extract_live_data(data_obj)
+            if deadline is not None:
+                row["timed_out"] = data_obj is UNFINISHED
+            rows.append(row)
+        return rows
+
+    @overload
+    def get_range_coordinates_air(
+        self,
+        lower_bound: Tuple[float, float],
+        upper_bound: Tuple[float, float],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: "Literal[False]" = ...,
+    ) -> pandas.DataFrame: ...
+
+    @overload
+    def get_range_coordinates_air(
+        self,
+        lower_bound: Tuple[float, float],
+        upper_bound: Tuple[float, float],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        *,
+        as_result: "Literal[True]",
+    ) -> BatchResult: ...
+
+    @overload
+    def get_range_coordinates_air(
+        self,
+        lower_bound: Tuple[float, float],
+        upper_bound: Tuple[float, float],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: bool = ...,
+    ) -> Union[pandas.DataFrame, BatchResult]: ...
+
     def get_range_coordinates_air(
         self,
         lower_bound: Tuple[float, float],
         upper_bound: Tuple[float, float],
         df: pandas.DataFrame = pandas.DataFrame(),
-    ) -> pandas.DataFrame:
+        delta: Optional[DeltaTracker] = None,
+        deadline: Optional[float] = None,
+        as_result: bool = False,
+    ) -> Union[pandas.DataFrame, BatchResult]:
         """Get aqi data for range of coordinates b/w lower_bound and upper_bound
 
         Args:
@@ -432,75 +474,290 @@ class Ozon3:
             upper_bound (tuple): end coordinate
             df (pandas.DataFrame, optional): An existing dataframe to
                 append the data to.
+            delta (DeltaTracker, optional): If given, only new readings are
+                returned, see get_multiple_coordinate_air.
+            deadline (float, optional): Maximum number of seconds fetching the
+                stations' data may take, see get_multiple_city_air.
+            as_result (bool, optional): Return a BatchResult instead of the
+                dataframe, see get_multiple_city_air.
 
         Returns:
-            pandas.DataFrame: The dataframe containing the data.
+            pandas.DataFrame: The dataframe containing the data, or a
+                BatchResult if as_result is True.
         """
         locations = self._locate_all_coordinates(
             lower_bound=lower_bound, upper_bound=upper_bound
         )
-        return self.get_multiple_coordinate_air(locations, df=df)
+        return self.get_multiple_coordinate_air(
+            locations, df=df, delta=delta, deadline=deadline, as_result=as_result
+        )
+
+    def get_top_polluted(
+        self,
+        lower_bound: Tuple[float, float],
+        upper_bound: Tuple[float, float],
+        n: int = 10,
+        param: str = "aqi",
+    ) -> pandas.DataFrame:
+        """Get air quality data of the n most polluted stations in a region
+
+        Unlike get_range_coordinates_air, this does not request every station.
+        The stations are ranked using the AQI already included in the bounds
+        response, and full data is only requested for the top n, so the whole
+        call costs n + 1 requests.
+
+        Ranking by any other parameter needs each station's full data, so every
+        station in the region is requested (concurrently) in that case.
+
+        Args:
+            lower_bound (tuple): start coordinate
+            upper_bound (tuple): end coordinate
+            n (int, optional): Number of stations to return. Defaults to 10.
+            param (str, optional): Parameter to rank by. Defaults to "aqi".
+
+        Returns:
+            pandas.DataFrame: The dataframe containing the data, in the same
+                format as get_range_coordinates_air, sorted from most to least
+                polluted. Stations whose data can't be fetched have a row
+                containing only their coordinates.
+        """
+        self._check_params([param])
+        stations = self._get_bounds_data(lower_bound, upper_bound)
+
+        if param == "aqi":
+            # Stations without a current reading have "-" as AQI.
+            ranked = [s for s in stations if _as_float(s.get("aqi")) >= 0]
+            stations = heapq.nlargest(n, ranked, key=lambda s: _as_float(s["aqi"]))
+
+        def fetch(station: Dict[str, Any]) -> Any:
+            try:
+                return self._get_data_obj(self._station_url(station["uid"]))
+            except Exception:
+                return None
+
+        rows: List[Dict[str, Any]] = []
+        for station, data_obj in zip(stations, self._map_concurrently(fetch, stations)):
+            if data_obj is None:
+                rows.append(
+                    {
+                        "latitude": _as_float(station["lat"]),
+                        "longitude": _as_float(station["lon"]),
+                    }
+                )
+            else:
+                rows.append(self._extract_live_data(data_obj))
+
+        df = pandas.DataFrame(rows)
+        if param not in df.columns:
+            # No station in the region, or none could be fetched.
+            return df
+        if param != "aqi":
+            df = df.nlargest(n, param)
+        # The feed may be newer than the bounds snapshot, so sort once more.
+        return df.sort_values(
+            by=param, ascending=False, na_position="last", kind="stable"
+        ).reset_index(drop=True)
+
+    @overload
+    def get_multiple_city_air(
+        self,
+        cities: List[str],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: "Literal[False]" = ...,
+    ) -> pandas.DataFrame: ...
+
+    @overload
+    def get_multiple_city_air(
+        self,
+        cities: List[str],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        *,
+        as_result: "Literal[True]",
+    ) -> BatchResult: ...
+
+    @overload
+    def get_multiple_city_air(
+        self,
+        cities: List[str],
+        df: pandas.DataFrame = ...,
+        delta: Optional[DeltaTracker] = ...,
+        deadline: Optional[float] = ...,
+        as_result: bool = ...,
+    ) -> Union[pandas.DataFrame, BatchResult]: ...
 
     def get_multiple_city_air(
         self,
         cities: List[str],
         df: pandas.DataFrame = pandas.DataFrame(),
-    ) -> pandas.DataFrame:
+        delta: Optional[DeltaTracker] = None,
+        deadline: Optional[float] = None,
+        as_result: bool = False,
+    ) -> Union[pandas.DataFrame, BatchResult]:
         """Get multiple cities' air quality data
 
+        Cities are fetched concurrently.
+
         Args:
             cities (list): A list of cities to get data for.
             df (pandas.DataFrame, optional): An existing dataframe to
                 append the data to.
+            delta (DeltaTracker, optional): If given, only readings whose station
+                timestamp changed since they were last seen by it are returned.
+            deadline (float, optional): Maximum number of seconds the whole call
+                may take. The data fetched by then is returned, with a
+                "timed_out" column that is True for the cities that were not
+                fetched in time. Their requests are cancelled or abandoned.
+            as_result (bool, optional): Return a BatchResult instead of the
+                dataframe. Its `data` is the same dataframe, its `errors` say why
+                each failed city failed (status code and API message), and its
+                `retry_failed` method fetches only the failed cities again.
 
         Returns:
-            pandas.DataFrame: The dataframe containing the data.
+            pandas.DataFrame: The dataframe containing the data, or a
+                BatchResult if as_result is True.
         """
-        for city in cities:
-            try:
-                # This just makes sure that it's always a returns a pandas.DataFrame.
-                # Makes mypy happy.
-                df = pandas.DataFrame(self.get_city_air(city=city, df=df))
-            except Exception:
-                # NOTE: If we have custom exception we can catch it instead.
-                empty_row = pandas.DataFrame({"city": [city]})
-                df = pandas.concat([df, empty_row], ignore_index=True)
+        if as_result:
+            return BatchResult(
+                cities,
+                lambda items: _rows_and_errors(self._city_air_rows, items, deadline),
+                df=df,
+                delta=delta,
+            )
 
-        df.reset_index(inplace=True, drop=True)
+        rows = self._city_air_rows(cities, deadline)
+        if delta is not None:
+            rows = delta.filter(rows)
+
+        with self._phase("dataframe"):
+            df = pandas.concat([df, pandas.DataFrame(rows)], ignore_index=True)
+            df.reset_index(inplace=True, drop=True)
         return df
 
-    def get_specific_parameter(
+    def _city_air_rows(
         self,
-        city: str,
-        air_param: str = "",
-    ) -> float:
-        """Get specific parameter as a float
+        cities: List[str],
+        deadline: Optional[float] = None,
+        errors: Optional[Dict[int, Exception]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Live data rows of get_multiple_city_air, one per city
+
+        Cities are fetched concurrently. With a deadline, every row gets a
+        "timed_out" value, which is True for cities not fetched in time. If
+        errors is given, the exception of every city that failed is added to it,
+        by the city's position.
+        """
+
+        def fetch(city: str) -> Tuple[Dict[str, Any], Optional[Exception]]:
+            try:
+                data_obj = self._get_data_obj(
+                    f"{self._search_aqi_url}/{city}/?token={self.token}",
+                    city=city,  # City is for traceback
+                )
+                row: Dict[str, Any] = self._extract_live_data(data_obj)
+                row["city"] = city
+                return row, None
+            except Exception as e:
+                return {"city": city}, e
+
+        rows: List[Dict[str, Any]] = []
+        results = self._map_concurrently(fetch, cities, deadline=deadline)
+        for i, (city, result) in enumerate(zip(cities, results)):
+            if result is None:
+                row, error = {"city": city}, _timeout_error()
+            else:
+                row, error = result
+            if deadline is not None:
+                row["timed_out"] = result is None
+            if error is not None and errors is not None:
+                errors[i] = error
+            rows.append(row)
+        return rows
+
+    def iter_multiple_city_air(
+        self,
+        cities: Iterable[str],
+        chunk_size: int = 1000,
+        delta: Optional[DeltaTracker] = None,
+    ) -> Iterator[pandas.DataFrame]:
+        """Get multiple cities' air quality data, chunk_size cities at a time
+
+        Like get_multiple_city_air, but yields one DataFrame per chunk of cities
+        instead of building a single one, so any number of cities can be
+        exported (see export) without holding all their data in memory.
 
         Args:
-            city (string): A city to get the data for
-            air_param (string): A string containing the specified air quality parameter.
-                Choose from the following values:
-                ["aqi", "pm2.5", "pm10", "o3", "co", "no2", "so2", "dew", "h",
-                 "p", "t", "w", "wg"]
-                Gets all parameters by default.
+            cities (iterable): The cities to get data for.
+            chunk_size (int, optional): Number of cities per DataFrame.
+            delta (DeltaTracker, optional): See get_multiple_city_air.
 
-        Returns:
-            float: Value of the specified parameter for the given city.
+        Yields:
+            pandas.DataFrame: The data of the next chunk of cities.
         """
-        r = self._make_api_request(f"{self._search_aqi_url}/{city}/?token={self.token}")
-        data_obj = self._check_and_get_data_obj(r)
+        for chunk in _chunks(cities, chunk_size):
+            rows = self._city_air_rows(chunk)
+            if delta is not None:
+                rows = delta.filter(rows)
+            with self._phase("dataframe"):
+                chunk_df = pandas.DataFrame(rows)
+            yield chunk_df
+
+    def iter_multiple_coordinate_air(
+        self,
+        locations: Iterable[Tuple],
+        chunk_size: int = 1000,
+        delta: Optional[DeltaTracker] = None,
+    ) -> Iterator[pandas.DataFrame]:
+        """Get multiple locations air quality data, chunk_size locations at a time
 
-        row = self._extract_live_data(data_obj)
+        Like get_multiple_coordinate_air, but yields one DataFrame per chunk of
+        locations instead of building a single one, see iter_multiple_city_air.
 
-        try:
-            result = _as_float(row[air_param])
-        except KeyError:
-            raise Exception(
-                f'Missing air quality parameter "{air_param}"\n'
-                'Try another air quality parameters: "aqi", "no2", or "co"'
-            )
+        Args:
+            locations (iterable): Pairs of (latitude, longitude) to get data for.
+            chunk_size (int, optional): Number of locations per DataFrame.
+            delta (DeltaTracker, optional): See get_multiple_coordinate_air.
+
+        Yields:
+            pandas.DataFrame: The data of the next chunk of locations.
+        """
+        for chunk in _chunks(locations, chunk_size):
+            rows = self._coordinate_air_rows(chunk)
+            if delta is not None:
+                rows = delta.filter(rows)
+            with self._phase("dataframe"):
+                chunk_df = pandas.DataFrame(rows)
+            yield chunk_df
+
+    def get_specific_parameters(
+        self,
+        cities: List[str],
+        params: List[str],
+    ) -> pandas.DataFrame:
+        """Get specific parameters for multiple cities at once
+
+        Cities are fetched concurrently, and only the requested parameters are
+        extracted from each response. Fetched data is shared with the other
+        live-data methods through the instance cache.
+
+        Args:
+            cities (list): A list of cities to get data for.
+            params (list): A list of air quality parameters. Choose from the
+                following values:
+                ["aqi", "pm2.5", "pm10", "o3", "co", "no2", "so2", "dew", "h",
+                 "p", "t", "w", "wg"]
 
-        return result
+        Returns:
+            pandas.DataFrame: A city x parameter table of floats, indexed by city.
+                Cities that can't be fetched have a row of nan.
+        """
+        matrix = self._get_parameter_matrix(cities, params)
+        return pandas.DataFrame(
+            matrix, index=pandas.Index(cities, name="city"), columns=list(params)
+        )
 
     def get_city_station_options(self, city: str) -> pandas.DataFrame:
         """Get available stations for a given city
@@ -516,7 +773,8 @@ class Ozon3:
         # _check_and_get_data_obj private method above.
         # If exists, alternative within API's spec is more than welcome to
         # replace this implementation.
-        r = requests.get(f"https://search.waqi.info/nsearch/station/{city}")
+        r = self._make_api_request(f"{self._config.station_search_url}{city}")
+        self._check_status_code(r)
         res = r.json()
 
         city_id, country_code, station_name, city_url, score = [], [], [], [], []
@@ -585,7 +843,15 @@ class Ozon3:
                     "Only city_id will be used. city argument will be ignored."
                 )
 
-        df = get_data_from_id(city_id)
+        df = get_data_from_id(
+            city_id,
+            metrics=self.metrics,
+            tracers=self._active_tracers(),
+            url=self._config.historical_url,
+            pool=self.historical_pool,
+            cache=self.historical_cache,
+            timeout=self._config.timeout,
+        )
         if "pm25" in df.columns:
             # This ensures that pm25 data is labelled correctly.
             df.rename(columns={"pm25": "pm2.5"}, inplace=True)
@@ -595,6 +861,69 @@ class Ozon3:
 
         return df
 
+    def iter_historical_data(
+        self, city_ids: Iterable[int]
+    ) -> Iterator[pandas.DataFrame]:
+        """Get historical air quality data for several cities, one city at a time
+
+        Args:
+            city_ids (iterable): IDs of the cities, see get_city_station_options.
+
+        Yields:
+            pandas.DataFrame: The data of the next city, as returned by
+                get_historical_data, with a "city_id" column added in front.
+                Cities whose data can't be fetched give a row containing only
+                their ID.
+        """
+        for city_id in city_ids:
+            try:
+                df = self.get_historical_data(city_id=city_id)
+            except Exception:
+                df = pandas.DataFrame()
+            if df.empty:
+                yield pandas.DataFrame({"city_id": [city_id]})
+                continue
+            df.insert(0, "city_id", city_id)
+            yield df
+
+    def export(
+        self,
+        frames: Iterable[pandas.DataFrame],
+        format: Optional[str] = None,
+        path: Optional[str] = None,
+        **writer_kwargs: Any,
+    ) -> str:
+        """Write DataFrames to a CSV, JSON Lines, Parquet or Excel file in chunks
+
+        Pass the output of the iter_* methods to export millions of rows with
+        flat memory use. Each DataFrame is written as soon as it is produced.
+
+        Example:
+            >>> o3.export(o3.iter_multiple_city_air(cities), format="parquet")
+
+        Args:
+            frames (iterable): The DataFrames to write, in order.
+            format (str, optional): "csv", "jsonl", "parquet" or "xlsx".
+                Inferred from the extension of path if not given, and "csv"
+                if path isn't given either.
+            path (str, optional): Output file (or directory, for Parquet).
+                Defaults to output_path/file_name.<format>.
+            **writer_kwargs: Passed on to the writer, e.g. chunk_size, or
+                partition_cols for Parquet. See the export module. For CSV and
+                Excel, pass columns when a later DataFrame may have columns
+                the first ones don't (e.g. pollutants of historical data);
+                otherwise such columns raise an exception.
+
+        Returns:
+            str: The path written to.
+        """
+        if path is None:
+            os.makedirs(self.output_path, exist_ok=True)
+            extension = format or "csv"
+            path = os.path.join(self.output_path, f"{self.file_name}.{extension}")
+        export(frames, path, format=format, **writer_kwargs)
+        return path
+
     def get_city_forecast(
         self,
         city: str,
@@ -610,16 +939,188 @@ class Ozon3:
         Returns:
             pandas.DataFrame: The dataframe containing the data.
         """
-        r = self._make_api_request(f"{self._search_aqi_url}/{city}/?token={self.token}")
-        data_obj = self._check_and_get_data_obj(r)
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}"
+        )
 
-        df = self._extract_forecast_data(data_obj)
-        if "pm25" in df.columns:
-            # This ensures that pm25 data is labelled correctly.
-            df.rename(columns={"pm25": "pm2.5"}, inplace=True)
+        return self._extract_forecast_data(data_obj)
+
+    def get_multiple_city_forecast(self, cities: List[str]) -> pandas.DataFrame:
+        """Get multiple cities' air quality forecasts in long format
+
+        Cities are fetched concurrently, and all their forecasts are reshaped
+        together into one long table with a row per city, date and pollutant.
+
+        Args:
+            cities (list): A list of cities to get data for.
 
+        Returns:
+            pandas.DataFrame: The dataframe containing the data, with columns
+                city, date, pollutant, avg, min and max. Cities that can't be
+                fetched or have no forecast have no rows.
+        """
+
+        def fetch(city: str) -> Any:
+            try:
+                return self._get_data_obj(
+                    f"{self._search_aqi_url}/{city}/?token={self.token}", city=city
+                )
+            except Exception:
+                return None
+
+        data_objs = self._map_concurrently(fetch, cities)
+        return self._extract_forecast_long(
+            [(city, obj) for city, obj in zip(cities, data_objs) if obj is not None]
+        )
+
+    def _extract_forecast_long(self, items: List[Tuple[str, Any]]) -> pandas.DataFrame:
+        """Extract forecast data of many cities into a single long DataFrame.
+
+        Every `daily` array of every city is flattened in one pass, and the dates
+        and statistics are then converted with a single vectorized call each.
+
+        Args:
+            items (list): Pairs of (city, data_obj), where data_obj is the 'data'
+                part of that city's API response.
+
+        Returns:
+            pandas.DataFrame: A dataframe with columns city, date, pollutant, avg,
+                min and max.
+        """
+        stats = ["avg", "min", "max"]
+        city_col: List[str] = []
+        pol_col: List[str] = []
+        days: List[Any] = []
+        values: List[Any] = []
+
+        for city, data_obj in items:
+            daily = data_obj.get("forecast", {}).get("daily") or {}
+            for pol, lst in daily.items():
+                # This ensures that pm25 data is labelled correctly.
+                pol = "pm2.5" if pol == "pm25" else pol
+                for entry in lst:
+                    city_col.append(city)
+                    pol_col.append(pol)
+                    days.append(entry.get("day"))
+                    values.extend(entry.get(stat) for stat in stats)
+
+        # Convert to numeric while making non-numerics nan, all at once.
+        numeric = (
+            pandas.to_numeric(pandas.Series(values, dtype=object), errors="coerce")
+            .to_numpy(dtype=float)
+            .reshape(-1, len(stats))
+        )
+
+        df = pandas.DataFrame(
+            {
+                "city": city_col,
+                "date": pandas.to_datetime(pandas.Series(days, dtype=object)),
+                "pollutant": pol_col,
+            }
+        )
+        df[stats] = numeric
         return df
 
+    def get_city_feed(self, city: str) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+        """Get a city's live air quality data and forecast with a single request
+
+        get_city_air and get_city_forecast read the same API endpoint. Use this
+        method when both are needed to spend only one request (and one unit of
+        quota) on them.
+
+        Args:
+            city (str): The city to get data for.
+
+        Returns:
+            Tuple[pandas.DataFrame, pandas.DataFrame]: The live data, in the same
+                format as get_city_air, and the forecast, in the same format as
+                get_city_forecast. The forecast is empty if the station does not
+                provide one.
+        """
+        data_obj = self._get_data_obj(
+            f"{self._search_aqi_url}/{city}/?token={self.token}",
+            city=city,  # City is for traceback
+        )
+
+        row = self._extract_live_data(data_obj)
+        row["city"] = city
+
+        return pandas.DataFrame([row]), self._extract_feed_forecast(data_obj)
+
+    def get_multiple_city_feed(
+        self, cities: List[str]
+    ) -> Tuple[pandas.DataFrame, Dict[str, pandas.DataFrame]]:
+        """Get multiple cities' live air quality data and forecasts
+
+        Like get_city_feed, this makes a single request per city. Cities are
+        fetched concurrently.
+
+        Args:
+            cities (list): A list of cities to get data for.
+
+        Returns:
+            Tuple[pandas.DataFrame, Dict[str, pandas.DataFrame]]: The live data,
+                in the same format as get_multiple_city_air, and a dictionary
+                mapping each city to its forecast. Cities that can't be fetched
+                have a live data row containing only the city name and an empty
+                forecast.
+        """
+
+        def fetch(city: str) -> Any:
+            try:
+                return self._get_data_obj(
+                    f"{self._search_aqi_url}/{city}/?token={self.token}", city=city
+                )
+            except Exception:
+                return None
+
+        rows: List[Dict[str, Any]] = []
+        forecasts: Dict[str, pandas.DataFrame] = {}
+        for city, data_obj in zip(cities, self._map_concurrently(fetch, cities)):
+            if data_obj is None:
+                rows.append({"city": city})
+                forecasts[city] = pandas.DataFrame()
+                continue
+
+            row = self._extract_live_data(data_obj)
+            row["city"] = city
+            rows.append(row)
+            forecasts[city] = self._extract_feed_forecast(data_obj)
+
+        return pandas.DataFrame(rows), forecasts
+
+    def _extract_feed_forecast(self, data_obj: Any) -> pandas.DataFrame:
+        """Extract forecast data, or an empty DataFrame if there is none"""
+        if not data_obj.get("forecast", {}).get("daily"):
+            # Not every station provides a forecast.
+            return pandas.DataFrame()
+        return self._extract_forecast_data(data_obj)
+
+
+def _rows_and_errors(
+    rows_func: Callable[..., List[Dict[str, Any]]],
+    items: List[Any],
+    deadline: Optional[float],
+) -> Tuple[List[Dict[str, Any]], Dict[int, Exception]]:
+    """Call _city_air_rows or _coordinate_air_rows, and return the errors too"""
+    errors: Dict[int, Exception] = {}
+    rows = rows_func(items, deadline, errors)
+    return rows, errors
+
+
+def _timeout_error() -> TimeoutError:
+    return TimeoutError("Not fetched before the deadline.")
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of up to size items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 if __name__ == "__main__":
     pass
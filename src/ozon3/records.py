@@ -0,0 +1,69 @@
+"""records module for the Ozon3 package.
+
+This module contains lightweight record types that Ozon3 returns from its
+`*_record` methods. They are plain named tuples, so building one costs
+little more than parsing the API response, and importing this module does not
+require pandas.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+from typing import Dict, NamedTuple, Optional, Union
+
+
+class AirReading(NamedTuple):
+    """A single live air quality reading from one station
+
+    Field names follow the columns returned by Ozon3.get_city_air, except that
+    they are valid Python identifiers (e.g. `pm25` instead of `pm2.5`).
+    Pollutant and weather values that are not reported by the station are nan.
+    """
+
+    city: Optional[str]
+    latitude: float
+    longitude: float
+    station: str
+    station_id: Optional[int]
+    dominant_pollutant: str
+    timestamp: str
+    timestamp_timezone: str
+    aqi: float
+    aqi_meaning: str
+    aqi_health_implications: str
+    pm25: float
+    pm10: float
+    o3: float
+    co: float
+    no2: float
+    so2: float
+    dew: float
+    h: float
+    p: float
+    t: float
+    w: float
+    wg: float
+
+    def to_row(self) -> Dict[str, Union[str, float, None]]:
+        """Convert the reading into a row dictionary keyed by Ozon3 column names
+
+        Returns:
+            dict: The same dictionary that Ozon3._extract_live_data produces,
+                ready to be turned into a pandas.DataFrame row.
+        """
+        return {
+            _FIELD_TO_COLUMN.get(field, field): value
+            for field, value in zip(self._fields, self)
+        }
+
+
+# Fields whose names differ from the corresponding DataFrame column names.
+_FIELD_TO_COLUMN: Dict[str, str] = {
+    "pm25": "pm2.5",
+    "aqi_meaning": "AQI_meaning",
+    "aqi_health_implications": "AQI_health_implications",
+}
+_COLUMN_TO_FIELD: Dict[str, str] = {v: k for k, v in _FIELD_TO_COLUMN.items()}
+
+
+if __name__ == "__main__":
+    pass
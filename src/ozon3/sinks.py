@@ -0,0 +1,330 @@
+"""sinks module for the Ozon3 package.
+
+This module contains SQLiteSink, which stores live, forecast and historical
+data returned by Ozon3 in a local SQLite database.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import pandas
+
+# Columns of the live table, in the order returned by Ozon3.get_city_air.
+LIVE_COLUMNS: List[str] = [
+    "station_id",
+    "timestamp",
+    "station",
+    "city",
+    "latitude",
+    "longitude",
+    "dominant_pollutant",
+    "timestamp_timezone",
+    "aqi",
+    "AQI_meaning",
+    "AQI_health_implications",
+    "pm2.5",
+    "pm10",
+    "o3",
+    "co",
+    "no2",
+    "so2",
+    "dew",
+    "h",
+    "p",
+    "t",
+    "w",
+    "wg",
+]
+FORECAST_COLUMNS: List[str] = ["station", "timestamp", "pollutant", "avg", "min", "max"]
+HISTORICAL_COLUMNS: List[str] = ["station", "timestamp", "pollutant", "value"]
+
+_TEXT_COLUMNS = {
+    "station",
+    "timestamp",
+    "city",
+    "dominant_pollutant",
+    "timestamp_timezone",
+    "AQI_meaning",
+    "AQI_health_implications",
+    "pollutant",
+}
+
+_INTEGER_COLUMNS = {"station_id"}
+
+# Live readings carry the station's ID, which (unlike its name) is unique.
+# Forecast and historical frames don't, so those tables are keyed by the name
+# they are written with.
+_TABLES = {
+    "live": (LIVE_COLUMNS, ["station_id", "timestamp"]),
+    "forecast": (FORECAST_COLUMNS, ["station", "timestamp", "pollutant"]),
+    "historical": (HISTORICAL_COLUMNS, ["station", "timestamp", "pollutant"]),
+}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_type(name: str) -> str:
+    if name in _TEXT_COLUMNS:
+        return "TEXT"
+    return "INTEGER" if name in _INTEGER_COLUMNS else "REAL"
+
+
+def _date_strings(dates: pandas.Series) -> pandas.Series:
+    """Format dates as ISO strings, so that they sort and compare as text"""
+    return pandas.to_datetime(dates).dt.strftime("%Y-%m-%d")
+
+
+class SQLiteSink:
+    """Store Ozon3 results in a local SQLite database
+
+    Rows are written with executemany in transactions of batch_size rows, and
+    upserted: writing a reading that is already stored (same station and
+    timestamp) updates it instead of adding a duplicate. Every table is keyed by
+    station and timestamp and has an index on timestamp, so reading back one
+    station or one time range does not scan the whole table. Upserts need
+    SQLite 3.24 or later.
+
+    The three tables are:
+        live: One row per station reading, as returned by get_city_air and the
+            other live-data methods. Keyed by station ID, as several stations
+            can share a name.
+        forecast: One row per station, day and pollutant, with avg, min and max.
+        historical: One row per station, day and pollutant, with its value.
+
+    A SQLiteSink can be called with a live-data DataFrame, so it can be used
+    directly as the sink of a Collector.
+
+    Example:
+        >>> with SQLiteSink("air_quality.db") as sink:
+        ...     sink.write_live(o3.get_multiple_city_air(["london", "paris"]))
+        ...     sink.read("live", station="London", start="2022-05-01")
+
+    Attributes:
+        path (str): Path of the database file. ":memory:" keeps it in memory.
+        batch_size (int): Number of rows written per transaction.
+        rows_written (int): Number of rows written so far.
+        rows_skipped (int): Number of rows left out because they had no station
+            (ID) or timestamp (e.g. locations that could not be fetched).
+    """
+
+    def __init__(self, path: str = "air_quality.db", batch_size: int = 50000):
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise Exception(
+                "SQLiteSink needs SQLite 3.24 or later for upserts, "
+                f"but Python uses SQLite {sqlite3.sqlite_version}."
+            )
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.rows_written: int = 0
+        self.rows_skipped: int = 0
+        self._lock = threading.Lock()
+
+        # Writes may come from a Collector's threads, so the connection is shared
+        # between threads and guarded by the lock instead.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for table, (columns, key) in _TABLES.items():
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    + ", ".join(f"{_quote(c)} {_column_type(c)}" for c in columns)
+                    + f", PRIMARY KEY ({', '.join(key)}))"
+                )
+                stored = {
+                    row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")
+                }
+                if not set(columns) <= stored:
+                    raise Exception(
+                        f"The {table} table of {path} was made by an older "
+                        "version of Ozon3, without the columns "
+                        f"{sorted(set(columns) - stored)}. Write to a new file."
+                    )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_timestamp "
+                    f"ON {table} (timestamp)"
+                )
+
+    def write_live(self, df: pandas.DataFrame) -> int:
+        """Upsert live data, as returned by get_city_air and similar methods
+
+        Args:
+            df (pandas.DataFrame): The live data.
+
+        Returns:
+            int: The number of rows written.
+        """
+        return self._write("live", df.reindex(columns=LIVE_COLUMNS))
+
+    def write_forecast(
+        self, df: pandas.DataFrame, station: Optional[str] = None
+    ) -> int:
+        """Upsert forecast data
+
+        Accepts both the frame of get_city_forecast, whose columns are
+        (pollutant, statistic) pairs, and the long frame of
+        get_multiple_city_forecast, whose "city" column is used as station.
+
+        Args:
+            df (pandas.DataFrame): The forecast data.
+            station (str, optional): Station (or city) the forecast is for.
+                Required for get_city_forecast frames.
+
+        Returns:
+            int: The number of rows written.
+        """
+        if isinstance(df.columns, pandas.MultiIndex):
+            if station is None:
+                raise Exception("station is required to write this forecast.")
+            dates = df["date"]
+            if isinstance(dates, pandas.DataFrame):
+                dates = dates.iloc[:, 0]
+            long = pandas.concat(
+                [
+                    df[pollutant].assign(timestamp=dates, pollutant=pollutant)
+                    for pollutant in df.columns.get_level_values(0).unique()
+                    if pollutant != "date"
+                ],
+                ignore_index=True,
+            )
+            long["station"] = station
+        else:
+            long = df.rename(columns={"city": "station", "date": "timestamp"})
+            if station is not None:
+                long["station"] = station
+
+        long = long.reindex(columns=FORECAST_COLUMNS)
+        long = long.dropna(subset=["avg", "min", "max"], how="all")
+        long["timestamp"] = _date_strings(long["timestamp"])
+        return self._write("forecast", long)
+
+    def write_historical(self, df: pandas.DataFrame, station: str) -> int:
+        """Upsert historical data, as returned by get_historical_data
+
+        Args:
+            df (pandas.DataFrame): The historical data.
+            station (str): Station (or city) the data is for.
+
+        Returns:
+            int: The number of rows written.
+        """
+        long = df.melt(id_vars="date", var_name="pollutant", value_name="value")
+        long = long.dropna(subset=["value"])
+        long = long.rename(columns={"date": "timestamp"})
+        long.insert(0, "station", station)
+        long["timestamp"] = _date_strings(long["timestamp"])
+        return self._write("historical", long.reindex(columns=HISTORICAL_COLUMNS))
+
+    def __call__(self, df: pandas.DataFrame) -> int:
+        return self.write_live(df)
+
+    def _write(self, table: str, df: pandas.DataFrame) -> int:
+        columns, key = _TABLES[table]
+        has_key = df[key].notna().all(axis=1)
+        self.rows_skipped += int((~has_key).sum())
+        df = df[has_key]
+
+        # sqlite3 stores None as NULL, but nan would be stored as a REAL.
+        values = df.astype(object).where(df.notna(), None)
+        updates = [c for c in columns if c not in key]
+        sql = (
+            f"INSERT INTO {table} ({', '.join(map(_quote, columns))}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+            + ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in updates)
+        )
+
+        rows = values.itertuples(index=False, name=None)
+        with self._lock:
+            for batch in _batches(rows, self.batch_size):
+                with self._conn:
+                    self._conn.executemany(sql, batch)
+                self.rows_written += len(batch)
+        return len(df)
+
+    def read(
+        self,
+        table: str = "live",
+        station: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        station_id: Optional[int] = None,
+    ) -> pandas.DataFrame:
+        """Read stored data, optionally for one station and a time range
+
+        Args:
+            table (str, optional): "live", "forecast" or "historical".
+                Defaults to "live".
+            station (str, optional): Only read the data of stations with this
+                name.
+            start (str, optional): Only read data from this time on, e.g.
+                "2022-05-01" or "2022-05-01 06:00:00".
+            end (str, optional): Only read data up to this time, inclusive. A
+                date includes the whole day.
+            station_id (int, optional): Only read this station's live data.
+
+        Returns:
+            pandas.DataFrame: The stored rows, ordered by station and timestamp
+                (and pollutant).
+        """
+        if table not in _TABLES:
+            raise Exception(f"Unknown table {table!r}, use one of {list(_TABLES)}.")
+
+        if station_id is not None and table != "live":
+            raise Exception("Only live data can be read by station_id.")
+        if end is not None:
+            # Timestamps sort as text, so any timestamp starting with end (e.g.
+            # every time of an end date) sorts before end followed by U+FFFF.
+            end += "\uffff"
+
+        conditions: List[str] = []
+        params: List[Any] = []
+        for condition, value in (
+            ("station = ?", station),
+            ("station_id = ?", station_id),
+            ("timestamp >= ?", start),
+            ("timestamp <= ?", end),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        sql = f"SELECT * FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        key = _TABLES[table][1]
+        order = key if "station" in key else ["station", *key]
+        sql += " ORDER BY " + ", ".join(order)
+
+        with self._lock:
+            return pandas.read_sql_query(sql, self._conn, params=params)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "SQLiteSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def _batches(rows: Iterable[Tuple], size: int) -> Iterable[Sequence[Tuple]]:
+    batch: List[Tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,594 @@
+"""spatial module for the Ozon3 package.
+
+This module contains the geographic helpers of Ozon3: great-circle distances,
+a cache that snaps coordinates to the WAQI station that answered a nearby
+query, a local spatial index of stations for nearest-neighbour and radius
+queries that don't touch the network, and spatial interpolation of station
+values onto regular grids.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import math
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy
+
+from ._utils import _as_float
+
+try:
+    # Optional: scipy's k-d tree makes queries against large indexes faster.
+    # Needs scipy 1.6 or later, for the `workers` argument of its queries.
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover
+    cKDTree = None
+
+# Mean Earth radius, and the length of one degree of latitude, in kilometres.
+EARTH_RADIUS_KM: float = 6371.0088
+KM_PER_DEGREE: float = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> Any:
+    """Great-circle distance in kilometres between two sets of points
+
+    All arguments are in degrees and may be scalars or NumPy arrays, in which
+    case the usual NumPy broadcasting rules apply.
+
+    Returns:
+        numpy.ndarray or float: The distance(s) in kilometres.
+    """
+    lat1, lon1, lat2, lon2 = map(numpy.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        numpy.sin((lat2 - lat1) / 2) ** 2
+        + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def _haversine_km_scalar(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """haversine_km for plain floats, without NumPy's per-call overhead"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _wrap_longitude(lon: float) -> float:
+    """The same longitude, between -180 (included) and 180 (excluded)"""
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+class CoordinateSnapCache:
+    """Remember which station answered each coordinate query
+
+    WAQI answers a `geo:` query with the nearest station, so many slightly
+    different coordinates resolve to the same station. This cache remembers the
+    station ID returned for every queried point (and the station's own location),
+    and maps any later point within radius_km of one of them to that station.
+
+    Points are bucketed in a grid of cells about radius_km wide (a geohash-like
+    scheme), so a lookup only compares distances with points in neighbouring
+    cells. Lookups do not take the lock; only add and clear do.
+
+    Attributes:
+        radius_km (float): Maximum distance in kilometres for a point to snap to
+            a remembered one. 0 or less disables the cache.
+        maxsize (int): Maximum number of remembered points. The cache is cleared
+            when it fills up.
+        hits (int): Number of lookups that snapped to a known station.
+        misses (int): Number of lookups that did not.
+    """
+
+    def __init__(self, radius_km: float = 0.0, maxsize: int = 1_000_000):
+        self.radius_km: float = radius_km
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._size: int = 0
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.radius_km > 0
+
+    def _cell_size(self) -> float:
+        """Width of a grid cell in degrees"""
+        return self.radius_km / KM_PER_DEGREE
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        size = self._cell_size()
+        return math.floor(lat / size), math.floor(lon / size)
+
+    def lookup(self, lat: Any, lon: Any) -> Optional[int]:
+        """Get the ID of the station a point snaps to, if any
+
+        Args:
+            lat (float): Latitude
+            lon (float): Longitude
+
+        Returns:
+            Optional[int]: The station ID, or None if no remembered point lies
+                within radius_km (or the coordinates are not valid numbers).
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            lat, lon = float(lat), _wrap_longitude(float(lon))
+            ci, cj = self._cell(lat, lon)
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+        # A degree of longitude shrinks with latitude, so more cells have to be
+        # checked along it to cover the whole radius: as many as at the radius'
+        # poleward edge, where it is shortest, and all of them near a pole.
+        size = self._cell_size()
+        edge = min(abs(lat) + size, 90.0)
+        lon_reach = min(size / max(math.cos(math.radians(edge)), 1e-12), 180.0)
+        lon_span = math.ceil(lon_reach / size)
+
+        # Near the antimeridian, points on its other side are stored 360
+        # degrees away.
+        centres = [cj]
+        if lon - lon_reach < -180.0:
+            centres.append(self._cell(lat, lon + 360.0)[1])
+        if lon + lon_reach >= 180.0:
+            centres.append(self._cell(lat, lon - 360.0)[1])
+        columns = {j for c in centres for j in range(c - lon_span, c + lon_span + 1)}
+
+        # Cell lists are replaced rather than appended to (see add), so they can
+        # be read without the lock.
+        cells = self._cells
+        best_uid, best_distance = None, self.radius_km
+        for i in range(ci - 1, ci + 2):
+            for j in columns:
+                for plat, plon, uid in cells.get((i, j), ()):
+                    distance = _haversine_km_scalar(lat, lon, plat, plon)
+                    if distance <= best_distance:
+                        best_uid, best_distance = uid, distance
+
+        if best_uid is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best_uid
+
+    def add(self, lat: Any, lon: Any, uid: int) -> None:
+        """Remember that a query at (lat, lon) was answered by station uid"""
+        if not self.enabled:
+            return
+
+        try:
+            lat, lon = float(lat), _wrap_longitude(float(lon))
+            cell = self._cell(lat, lon)
+        except (TypeError, ValueError, OverflowError):
+            return
+
+        with self._lock:
+            if self._size >= self.maxsize:
+                self._cells = {}
+                self._size = 0
+            self._cells[cell] = [*self._cells.get(cell, ()), (lat, lon, uid)]
+            self._size += 1
+
+    def clear(self) -> None:
+        """Forget all remembered points and reset hit/miss counters"""
+        with self._lock:
+            self._cells = {}
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def _unit_vectors(lat: Any, lon: Any) -> numpy.ndarray:
+    """Convert coordinates in degrees into 3D unit vectors, shape (n, 3)"""
+    lat = numpy.radians(numpy.atleast_1d(numpy.asarray(lat, dtype=float)))
+    lon = numpy.radians(numpy.atleast_1d(numpy.asarray(lon, dtype=float)))
+    cos_lat = numpy.cos(lat)
+    return numpy.stack(
+        [cos_lat * numpy.cos(lon), cos_lat * numpy.sin(lon), numpy.sin(lat)], axis=1
+    )
+
+
+def _chord_to_km(chord: numpy.ndarray) -> numpy.ndarray:
+    """Convert straight-line distances between unit vectors into kilometres"""
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.clip(chord / 2, 0.0, 1.0))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+
+class _StationSnapshot(NamedTuple):
+    """Immutable state of a StationIndex, swapped as a whole on every update"""
+
+    uids: numpy.ndarray
+    latitudes: numpy.ndarray
+    longitudes: numpy.ndarray
+    aqi: numpy.ndarray
+    names: numpy.ndarray
+    times: numpy.ndarray
+    vectors: numpy.ndarray
+    tree: Any
+    tree_size: int  # Rows [0, tree_size) are in tree, later ones are not.
+
+
+class StationIndex:
+    """Local spatial index of WAQI stations
+
+    The index is filled from `map/bounds` results (Ozon3 does this for every
+    bounds request it makes) and updated incrementally: a station seen again
+    replaces its previous entry, new stations are added, and nothing is removed.
+
+    Queries are answered locally and are vectorized, so a single call can look
+    up any number of points. Stations are stored as 3D unit vectors, which turns
+    great-circle nearest-neighbour search into plain Euclidean search.
+
+    If scipy 1.6 or later is installed (`pip install ozon3[spatial]`), the
+    search uses a k-d tree and all CPU cores, which serves millions of lookups
+    per second. Without scipy, every query is compared with every station in
+    chunks (brute force): its cost grows with the number of stations, so it is
+    fine for indexes of a few thousand stations, but far slower than the tree
+    for large ones.
+
+    Every update builds a new immutable snapshot and swaps it in, so queries
+    never take a lock and are safe to run from any number of threads. Updates
+    only compute the vectors of the stations they add or move, and the k-d
+    tree is not rebuilt for every update: stations added since it was built are
+    searched by brute force, until there are more than _max_tail of them (or an
+    eighth of the tree's size).
+    """
+
+    # Upper bound on the size of the (queries x stations) distance matrix
+    # built at once by the brute-force search.
+    _chunk_elements: int = 1 << 22
+    # Minimum number of stations added since the k-d tree was built that
+    # makes the next update rebuild it.
+    _max_tail: int = 1024
+
+    def __init__(self, stations: Iterable[Dict[str, Any]] = ()):
+        """Initialise the index, optionally with `map/bounds` station entries"""
+        self._lock = threading.Lock()
+        # Index row of each station ID; only used (and changed) by update.
+        self._row_of: Dict[int, int] = {}
+        empty = numpy.empty(0)
+        self._snapshot: _StationSnapshot = _StationSnapshot(
+            uids=numpy.empty(0, dtype=numpy.int64),
+            latitudes=empty,
+            longitudes=empty,
+            aqi=empty,
+            names=numpy.empty(0, dtype=object),
+            times=numpy.empty(0, dtype=object),
+            vectors=numpy.empty((0, 3)),
+            tree=None,
+            tree_size=0,
+        )
+        self.update(stations)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.uids)
+
+    @property
+    def uids(self) -> numpy.ndarray:
+        """Station IDs, in index row order"""
+        return self._snapshot.uids
+
+    def update(self, stations: Iterable[Dict[str, Any]]) -> None:
+        """Add or refresh stations
+
+        Args:
+            stations (list): Station entries as found in a `map/bounds` response,
+                i.e. dictionaries with "uid", "lat", "lon", and optionally "aqi"
+                and "station" ({"name": ..., "time": ...}).
+        """
+        entries: Dict[int, Tuple] = {}
+        for station in stations:
+            info = station.get("station") or {}
+            # A station listed twice keeps its last entry.
+            entries[int(station["uid"])] = (
+                float(station["lat"]),
+                float(station["lon"]),
+                _as_float(station.get("aqi")),
+                info.get("name"),
+                info.get("time"),
+            )
+        if not entries:
+            return
+
+        with self._lock:
+            current = self._snapshot
+            n = len(current.uids)
+            added = [uid for uid in entries if uid not in self._row_of]
+            known = [uid for uid in entries if uid in self._row_of]
+            rows = numpy.array([self._row_of[uid] for uid in known], dtype=numpy.int64)
+
+            # Concatenating copies the arrays, so the current snapshot stays
+            # intact for the queries still using it.
+            def column(field: int, values: numpy.ndarray) -> numpy.ndarray:
+                new = numpy.empty(len(added), dtype=values.dtype)
+                new[:] = [entries[uid][field] for uid in added]
+                result = numpy.concatenate([values, new])
+                result[rows] = [entries[uid][field] for uid in known]
+                return result
+
+            latitudes = column(0, current.latitudes)
+            longitudes = column(1, current.longitudes)
+            moved = rows[
+                (latitudes[rows] != current.latitudes[rows])
+                | (longitudes[rows] != current.longitudes[rows])
+            ]
+            vectors = numpy.concatenate(
+                [current.vectors, _unit_vectors(latitudes[n:], longitudes[n:])]
+            )
+            vectors[moved] = _unit_vectors(latitudes[moved], longitudes[moved])
+
+            uids = numpy.concatenate(
+                [current.uids, numpy.array(added, dtype=numpy.int64)]
+            )
+            tree, tree_size = current.tree, current.tree_size
+            tail = len(uids) - tree_size
+            if cKDTree is not None and (
+                (moved < tree_size).any() or tail > max(self._max_tail, tree_size // 8)
+            ):
+                tree, tree_size = cKDTree(vectors), len(uids)
+
+            self._snapshot = _StationSnapshot(
+                uids=uids,
+                latitudes=latitudes,
+                longitudes=longitudes,
+                aqi=column(2, current.aqi),
+                names=column(3, current.names),
+                times=column(4, current.times),
+                vectors=vectors,
+                tree=tree,
+                tree_size=tree_size,
+            )
+            for row, uid in enumerate(added, n):
+                self._row_of[uid] = row
+
+    def nearest(
+        self, lat: Any, lon: Any, k: int = 1
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Find the k nearest stations to each of the given points
+
+        Args:
+            lat (float or array): Latitude(s) of the query point(s).
+            lon (float or array): Longitude(s) of the query point(s).
+            k (int, optional): Number of stations per point. Capped at the
+                number of stations in the index. Defaults to 1.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: Distances in kilometres and
+                index rows of the nearest stations, both of shape (points, k) and
+                sorted from nearest to farthest. Use `columns` to turn rows into
+                station information.
+        """
+        snapshot = self._snapshot
+        queries = _unit_vectors(lat, lon)
+        k = min(k, len(snapshot.uids))
+        if k <= 0:
+            empty = numpy.empty((len(queries), 0))
+            return empty, empty.astype(numpy.int64)
+
+        if snapshot.tree is None:
+            return self._brute_force_nearest(queries, snapshot.vectors, k)
+
+        tree_k = min(k, snapshot.tree_size)
+        chords, rows = snapshot.tree.query(queries, k=tree_k, workers=-1)
+        distances = _chord_to_km(chords.reshape(len(queries), tree_k))
+        rows = rows.reshape(-1, tree_k)
+        tail = snapshot.vectors[snapshot.tree_size :]
+        if not len(tail):
+            return distances, rows
+
+        # Merge with the nearest of the stations added since the tree was built.
+        tail_distances, tail_rows = self._brute_force_nearest(
+            queries, tail, min(k, len(tail))
+        )
+        distances = numpy.concatenate([distances, tail_distances], axis=1)
+        rows = numpy.concatenate([rows, tail_rows + snapshot.tree_size], axis=1)
+        order = numpy.argsort(distances, axis=1, kind="stable")[:, :k]
+        return (
+            numpy.take_along_axis(distances, order, axis=1),
+            numpy.take_along_axis(rows, order, axis=1),
+        )
+
+    def _brute_force_nearest(
+        self, queries: numpy.ndarray, vectors: numpy.ndarray, k: int
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """nearest, by comparing unit vectors queries with every row of vectors"""
+        n = len(vectors)
+        chunk = max(1, self._chunk_elements // n)
+        distances = numpy.empty((len(queries), k))
+        rows = numpy.empty((len(queries), k), dtype=numpy.int64)
+        for start in range(0, len(queries), chunk):
+            # Dot products of unit vectors: larger means nearer.
+            dots = queries[start : start + chunk] @ vectors.T
+            if k == 1:
+                part = dots.argmax(axis=1)[:, None]
+            elif k < n:
+                part = numpy.argpartition(-dots, k - 1, axis=1)[:, :k]
+            else:
+                part = numpy.broadcast_to(numpy.arange(n), dots.shape)
+            part_dots = numpy.take_along_axis(dots, part, axis=1)
+            order = numpy.argsort(-part_dots, axis=1)
+            rows[start : start + chunk] = numpy.take_along_axis(part, order, axis=1)
+            chords = numpy.sqrt(
+                numpy.maximum(
+                    2 - 2 * numpy.take_along_axis(part_dots, order, axis=1), 0
+                )
+            )
+            distances[start : start + chunk] = _chord_to_km(chords)
+        return distances, rows
+
+    def within(
+        self, lat: float, lon: float, radius_km: float
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Find all stations within a radius of a point
+
+        Args:
+            lat (float): Latitude of the query point.
+            lon (float): Longitude of the query point.
+            radius_km (float): Search radius in kilometres.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: Distances in kilometres and
+                index rows of the stations found, sorted from nearest to farthest.
+        """
+        snapshot = self._snapshot
+        query = _unit_vectors(lat, lon)[0]
+        chord_radius = _km_to_chord(radius_km)
+
+        # Rows the tree does not cover are compared with the query one by one.
+        start = 0
+        rows = numpy.empty(0, dtype=numpy.int64)
+        if snapshot.tree is not None:
+            start = snapshot.tree_size
+            rows = numpy.asarray(
+                snapshot.tree.query_ball_point(query, chord_radius), dtype=numpy.int64
+            )
+        chords = numpy.linalg.norm(snapshot.vectors[start:] - query, axis=1)
+        rows = numpy.concatenate(
+            [rows, start + numpy.flatnonzero(chords <= chord_radius)]
+        )
+
+        distances = _chord_to_km(
+            numpy.linalg.norm(snapshot.vectors[rows] - query, axis=1)
+        )
+        order = numpy.argsort(distances)
+        return distances[order], rows[order]
+
+    def columns(self, rows: Any) -> Dict[str, numpy.ndarray]:
+        """Get station information for the given index rows
+
+        Args:
+            rows (array): Index rows, as returned by nearest or within.
+
+        Returns:
+            dict: Arrays "uid", "station", "latitude", "longitude", "aqi" and
+                "time", each shaped like rows.
+        """
+        snapshot = self._snapshot
+        return {
+            "uid": snapshot.uids[rows],
+            "station": snapshot.names[rows],
+            "latitude": snapshot.latitudes[rows],
+            "longitude": snapshot.longitudes[rows],
+            "aqi": snapshot.aqi[rows],
+            "time": snapshot.times[rows],
+        }
+
+
+class InterpolatedGrid(NamedTuple):
+    """Values interpolated onto a regular latitude/longitude grid
+
+    Attributes:
+        values (numpy.ndarray): Interpolated values, shape
+            (len(latitudes), len(longitudes)). Cells too far from any station
+            are nan.
+        latitudes (numpy.ndarray): Latitude of each grid row, ascending.
+        longitudes (numpy.ndarray): Longitude of each grid column, ascending.
+    """
+
+    values: numpy.ndarray
+    latitudes: numpy.ndarray
+    longitudes: numpy.ndarray
+
+
+def interpolate_grid(
+    index: StationIndex,
+    latitudes: numpy.ndarray,
+    longitudes: numpy.ndarray,
+    method: str = "idw",
+    k: int = 8,
+    power: float = 2.0,
+    max_distance_km: Optional[float] = None,
+    chunk_cells: int = 1 << 16,
+) -> InterpolatedGrid:
+    """Interpolate the AQI values of indexed stations onto a grid
+
+    Each grid cell only looks at its k nearest stations, found through the
+    index, and cells are processed chunk by chunk so memory use is bounded by
+    chunk_cells * k regardless of the grid size.
+
+    Args:
+        index (StationIndex): Stations to interpolate from. Stations without an
+            AQI value are ignored.
+        latitudes (numpy.ndarray): Latitudes of the grid rows.
+        longitudes (numpy.ndarray): Longitudes of the grid columns.
+        method (str, optional): "idw" for inverse distance weighting, or
+            "nearest" to take the nearest station's value. Defaults to "idw".
+        k (int, optional): Number of neighbouring stations used per cell by
+            "idw". Defaults to 8.
+        power (float, optional): Power of the inverse distance weights.
+            Defaults to 2.
+        max_distance_km (float, optional): Cells whose nearest station is
+            farther than this are nan. Defaults to None, i.e. no limit.
+        chunk_cells (int, optional): Number of cells interpolated at once.
+
+    Returns:
+        InterpolatedGrid: The interpolated values and the grid coordinates.
+    """
+    if method not in ("idw", "nearest"):
+        raise ValueError(f'Unknown interpolation method "{method}".')
+    if method == "nearest":
+        k = 1
+
+    columns = index.columns(numpy.arange(len(index)))
+    valid = ~numpy.isnan(columns["aqi"])
+    stations = StationIndex(
+        {"uid": uid, "lat": lat, "lon": lon, "aqi": aqi}
+        for uid, lat, lon, aqi in zip(
+            columns["uid"][valid],
+            columns["latitude"][valid],
+            columns["longitude"][valid],
+            columns["aqi"][valid],
+        )
+    )
+    station_values = stations.columns(numpy.arange(len(stations)))["aqi"]
+
+    latitudes = numpy.asarray(latitudes, dtype=float)
+    longitudes = numpy.asarray(longitudes, dtype=float)
+    values = numpy.full(len(latitudes) * len(longitudes), numpy.nan)
+    if len(stations) == 0:
+        return InterpolatedGrid(
+            values.reshape(len(latitudes), len(longitudes)), latitudes, longitudes
+        )
+
+    for start in range(0, values.size, chunk_cells):
+        cells = numpy.arange(start, min(start + chunk_cells, values.size))
+        distances, rows = stations.nearest(
+            latitudes[cells // len(longitudes)],
+            longitudes[cells % len(longitudes)],
+            k=k,
+        )
+        neighbour_values = station_values[rows]
+
+        if method == "nearest":
+            chunk = neighbour_values[:, 0]
+        else:
+            # A cell sitting on a station takes that station's value.
+            with numpy.errstate(divide="ignore"):
+                weights = 1.0 / distances**power
+            exact = numpy.isinf(weights)
+            weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+            chunk = (weights * neighbour_values).sum(axis=1) / weights.sum(axis=1)
+
+        if max_distance_km is not None:
+            chunk[distances[:, 0] > max_distance_km] = numpy.nan
+        values[cells] = chunk
+
+    return InterpolatedGrid(
+        values.reshape(len(latitudes), len(longitudes)), latitudes, longitudes
+    )
+
+
+if __name__ == "__main__":
+    pass
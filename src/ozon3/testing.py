@@ -0,0 +1,557 @@
+"""testing module for the Ozon3 package.
+
+This module contains MockWAQIServer, a local stand-in for the WAQI API with
+configurable latency, errors and "Over quota" answers, and load_test, which
+measures the throughput of Ozon3's concurrent methods against any server.
+
+Run it directly to load test Ozon3 against a MockWAQIServer:
+
+    python -m ozon3.testing --requests 2000 --threads 32 --latency 0.05
+"""
+
+import argparse
+import http.server
+import json
+import random
+import socketserver
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .lite import Ozon3Lite
+
+# Message of one month of London's historical data, as sent by the `attsse`
+# stream (without the list of data sources). Every month of the mock stream
+# repeats it, under the requested station's name.
+_HISTORICAL_MSG: Dict[str, Any] = {
+    "now": "2022-05-23T05:46:47+01:00",
+    "st": 458712,
+    "ps": {
+        "co": "1|0C2aBACBCad2AFaBAbc4A",
+        "no2": "1|0VAaHdDhdMhaCFcB2CaABgA",
+        "o3": "1|0!31djEGBgKBecDFGgcFAEgaH",
+        "pm10": "1|0ZDAHlDj2FAeDcJFegB2abC",
+        "pm25": "1!59KCDrBrMEeckIJQlidADGa",
+        "so2": "1|0.3AB2AaAB3AaABAaBa3A",
+    },
+    "dh": 24,
+    "time": {"span": ["2022-05-22T00:00:00Z", "2022-05-22T00:00:00Z"]},
+    "meta": {"si": {"city": {"name": "London", "idx": 5724}, "timezone": "1.00"}},
+}
+
+_TIME = {"s": "2022-05-23 06:00:00", "tz": "+01:00", "v": 1653285600}
+_FORECAST_DAYS = ["2022-05-21", "2022-05-22", "2022-05-23", "2022-05-24"]
+
+
+class _Station(NamedTuple):
+    uid: int
+    name: str
+    lat: float
+    lon: float
+
+    @property
+    def aqi(self) -> int:
+        return 10 + self.uid % 140
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive
+    disable_nagle_algorithm = True
+    server: "MockWAQIServer"
+
+    def do_GET(self) -> None:
+        self.server._handle(self)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def send_body(
+        self, status: int, body: bytes, content_type: str = "application/json"
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# http.server.ThreadingHTTPServer is only in Python 3.7 and later.
+class MockWAQIServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Local stand-in for the WAQI API, for tests and load tests
+
+    Serves `feed/<city>/`, `feed/geo:<lat>;<lon>/`, `feed/@<uid>/`,
+    `map/bounds/`, the `nsearch/station/<keyword>` station search and the
+    `api/attsse/<city_id>/yd.json` historical data stream, in the format of the
+    real API. Every city has its own station, named after the city; coordinates
+    are answered by the station of the nearest point of a grid. Data is made up
+    but stable: the same query always gets the same answer.
+
+    Every request waits latency seconds (plus up to jitter more) and then, with
+    the given probabilities, fails with HTTP 500 or answers "Over quota".
+    Requests made with a token in invalid_tokens or over_quota_tokens always
+    get "Invalid key" or "Over quota", and cities in unknown_cities get
+    "Unknown station".
+
+    Example:
+        >>> with MockWAQIServer(latency=0.05, over_quota_rate=0.01) as server:
+        ...     o3 = Ozon3("token", base_url=server.url)
+        ...     o3.get_multiple_city_air(["london", "paris"])
+
+    Attributes:
+        latency (float or Callable): Seconds every request waits before it is
+            answered, or a function of the request's last path segment (e.g.
+            the city) that returns them.
+        jitter (float): Up to this many seconds are added to latency, at random.
+        error_rate (float): Share of requests answered with HTTP 500.
+        over_quota_rate (float): Share of API requests answered "Over quota".
+        invalid_tokens (set): Tokens answered "Invalid key".
+        over_quota_tokens (set): Tokens answered "Over quota".
+        unknown_cities (set): Cities answered "Unknown station".
+        grid_degrees (float): Spacing of the grid of coordinate stations.
+        history_months (int): Number of months sent by the historical stream.
+        paths (list): Path of every request received, in order.
+        requests (dict): Number of requests received per endpoint ("feed",
+            "map", "nsearch", "attsse" or "other").
+    """
+
+    daemon_threads = True
+    # Many clients connect at once; the default backlog of 5 drops connections.
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[str], float]] = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        over_quota_rate: float = 0.0,
+        invalid_tokens: Optional[List[str]] = None,
+        over_quota_tokens: Optional[List[str]] = None,
+        unknown_cities: Optional[List[str]] = None,
+        grid_degrees: float = 0.25,
+        history_months: int = 2,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """Bind the server; call start (or use it as a context manager) to serve
+
+        Args:
+            latency (float or Callable, optional): See the latency attribute.
+                Defaults to 0.
+            jitter (float, optional): See the jitter attribute. Defaults to 0.
+            error_rate (float, optional): See the error_rate attribute.
+                Defaults to 0.
+            over_quota_rate (float, optional): See the over_quota_rate
+                attribute. Defaults to 0.
+            invalid_tokens (list, optional): Tokens answered "Invalid key".
+            over_quota_tokens (list, optional): Tokens answered "Over quota".
+            unknown_cities (list, optional): Cities answered "Unknown station".
+            grid_degrees (float, optional): See the grid_degrees attribute.
+                Defaults to 0.25.
+            history_months (int, optional): See the history_months attribute.
+                Defaults to 2.
+            seed (int, optional): Seed of the random jitter and errors, for
+                repeatable runs.
+            host (str, optional): Address to listen on. Defaults to 127.0.0.1.
+            port (int, optional): Port to listen on. Defaults to 0, which picks
+                a free port.
+        """
+        super().__init__((host, port), _Handler)
+        self.latency: Union[float, Callable[[str], float]] = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.over_quota_rate: float = over_quota_rate
+        self.invalid_tokens = set(invalid_tokens or [])
+        self.over_quota_tokens = set(over_quota_tokens or [])
+        self.unknown_cities = set(unknown_cities or [])
+        self.grid_degrees: float = grid_degrees
+        self.history_months: int = history_months
+        self.paths: List[str] = []
+        self.requests: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stations: Dict[int, _Station] = {}
+        self._host: str = host
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base url of the server, to pass to Ozon3 as base_url"""
+        return f"http://{self._host}:{self.server_address[1]}/"
+
+    def start(self) -> "MockWAQIServer":
+        """Serve requests in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.serve_forever,
+                kwargs={"poll_interval": 0.05},
+                name="ozon3-mock-waqi",
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket"""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self) -> "MockWAQIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _handle(self, handler: _Handler) -> None:
+        split = urlsplit(handler.path)
+        segments = [unquote(s) for s in split.path.split("/") if s]
+        query = parse_qs(split.query)
+        endpoint = segments[0] if segments else "other"
+        if endpoint == "api" and len(segments) > 1:
+            endpoint = segments[1]
+        if endpoint not in ("feed", "map", "nsearch", "attsse"):
+            endpoint = "other"
+
+        with self._lock:
+            self.paths.append(handler.path)
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            jitter = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            failed = self._random.random() < self.error_rate
+            over_quota = self._random.random() < self.over_quota_rate
+
+        name = segments[-1] if segments else ""
+        latency = self.latency(name) if callable(self.latency) else self.latency
+        if latency + jitter > 0:
+            time.sleep(latency + jitter)
+
+        if failed:
+            handler.send_body(500, b"Internal Server Error", "text/plain")
+            return
+
+        if endpoint in ("feed", "map"):
+            token = query.get("token", [""])[0]
+            if token in self.invalid_tokens:
+                handler.send_body(200, _error("Invalid key"))
+                return
+            if over_quota or token in self.over_quota_tokens:
+                handler.send_body(200, _error("Over quota"))
+                return
+
+        if endpoint == "feed" and len(segments) > 1:
+            handler.send_body(200, self._feed(name))
+        elif endpoint == "map" and segments[1:2] == ["bounds"]:
+            handler.send_body(200, self._bounds(query.get("latlng", [""])[0]))
+        elif endpoint == "nsearch" and len(segments) > 2:
+            handler.send_body(200, self._search(segments[2]))
+        elif endpoint == "attsse" and len(segments) > 2:
+            stream = self._history(segments[2])
+            if stream is None:
+                handler.send_body(200, _error("Unknown station"))
+            else:
+                handler.send_body(200, stream, "text/event-stream; charset=UTF-8")
+        else:
+            handler.send_body(404, b"Not Found", "text/plain")
+
+    def _register(self, station: _Station) -> _Station:
+        with self._lock:
+            self._stations[station.uid] = station
+        return station
+
+    def _city_station(self, city: str) -> _Station:
+        crc = zlib.crc32(city.encode())
+        lat = round((crc % 12000) / 100 - 60, 4)
+        lon = round((crc // 12000 % 36000) / 100 - 180, 4)
+        return self._register(_Station(crc % 100000, city, lat, lon))
+
+    def _grid_station(self, lat: float, lon: float) -> _Station:
+        step = self.grid_degrees
+        row, col = round(lat / step), round(lon / step)
+        lat, lon = round(row * step, 6), round(col * step, 6)
+        uid = 100000 + zlib.crc32(f"{row},{col}".encode()) % 900000
+        return self._register(_Station(uid, f"Station {lat:.2f}, {lon:.2f}", lat, lon))
+
+    def _feed(self, name: str) -> bytes:
+        if name.startswith("geo:"):
+            try:
+                lat, lon = (float(x) for x in name[4:].split(";"))
+            except ValueError:
+                return _error("Invalid geo position")
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                return _error("Invalid geo position")
+            station = self._grid_station(lat, lon)
+        elif name.startswith("@"):
+            found = self._stations.get(int(name[1:])) if name[1:].isdigit() else None
+            if found is None:
+                return _error("Unknown station")
+            station = found
+        elif name in self.unknown_cities:
+            return _error("Unknown station")
+        else:
+            station = self._city_station(name)
+        return _ok(_data_obj(station))
+
+    def _bounds(self, latlng: str) -> bytes:
+        try:
+            lat1, lon1, lat2, lon2 = (float(x) for x in latlng.split(","))
+        except ValueError:
+            return _error("Invalid geo position")
+        step = self.grid_degrees
+        rows = range(_ceil(min(lat1, lat2) / step), int(max(lat1, lat2) // step) + 1)
+        cols = range(_ceil(min(lon1, lon2) / step), int(max(lon1, lon2) // step) + 1)
+
+        entries = []
+        for row in rows:
+            for col in cols:
+                station = self._grid_station(row * step, col * step)
+                entries.append(
+                    {
+                        "lat": station.lat,
+                        "lon": station.lon,
+                        "uid": station.uid,
+                        "aqi": str(station.aqi),
+                        "station": {
+                            "name": station.name,
+                            "time": "2022-05-23T06:00:00+01:00",
+                        },
+                    }
+                )
+                # The real API never answers with more than 1000 stations.
+                if len(entries) == 1000:
+                    return _ok(entries)
+        return _ok(entries)
+
+    def _search(self, keyword: str) -> bytes:
+        results = []
+        for i, name in enumerate([keyword, f"{keyword} Central", f"{keyword} North"]):
+            station = self._city_station(name)
+            results.append(
+                {
+                    "x": station.uid,
+                    "c": "XX",
+                    "n": [name],
+                    "s": {
+                        "a": str(station.aqi),
+                        "n": [name],
+                        "t": [_TIME["s"], _TIME["tz"]],
+                        "u": name.lower().replace(" ", "-"),
+                    },
+                    "score": 3 - i,
+                }
+            )
+        body = {"dt": "1ms", "term": keyword, "results": results}
+        return json.dumps(body).encode()
+
+    def _history(self, city_id: str) -> Optional[bytes]:
+        station = self._stations.get(int(city_id)) if city_id.isdigit() else None
+        if station is None:
+            return None
+
+        msg = dict(_HISTORICAL_MSG)
+        msg["meta"] = {
+            "si": {
+                "city": {"name": station.name, "idx": station.uid},
+                "timezone": "1.00",
+            }
+        }
+        data = json.dumps({"msg": msg, "status": "ok"})
+        events = []
+        for month in range(self.history_months):
+            events.append(f'event: debug\ndata: "Fetching month {month}"\n\n')
+            events.append(f"event: data\ndata: {data}\n\n")
+        events.append('event: done\ndata: ""\n\n')
+        return "".join(events).encode()
+
+
+def _ceil(x: float) -> int:
+    return -int(-x // 1)
+
+
+def _ok(data: Any) -> bytes:
+    return json.dumps({"status": "ok", "data": data}).encode()
+
+
+def _error(message: str) -> bytes:
+    return json.dumps({"status": "error", "data": message}).encode()
+
+
+def _data_obj(station: _Station) -> Dict[str, Any]:
+    """`feed` data object of a station"""
+    aqi = station.aqi
+    iaqi = {
+        "pm25": aqi,
+        "pm10": aqi // 2,
+        "o3": station.uid % 40,
+        "no2": station.uid % 30,
+        "co": round(station.uid % 50 / 10, 1),
+        "t": 5 + station.uid % 25,
+        "h": 40 + station.uid % 50,
+    }
+    forecast = {
+        pol: [
+            {"avg": value + i, "day": day, "max": value + i + 5, "min": value + i - 5}
+            for i, day in enumerate(_FORECAST_DAYS)
+        ]
+        for pol, value in (("o3", iaqi["o3"]), ("pm10", iaqi["pm10"]), ("pm25", aqi))
+    }
+    return {
+        "aqi": aqi,
+        "idx": station.uid,
+        "attributions": [],
+        "city": {"geo": [station.lat, station.lon], "name": station.name, "url": ""},
+        "dominentpol": "pm25",
+        "iaqi": {param: {"v": value} for param, value in iaqi.items()},
+        "time": _TIME,
+        "forecast": {"daily": forecast},
+    }
+
+
+class LoadTestResult(NamedTuple):
+    """How one method of the client fared in a load test
+
+    Attributes:
+        method (str): Name of the method.
+        items (int): Number of cities, coordinates or stations requested.
+        errors (int): Number of items that failed.
+        seconds (float): Wall-clock time of the whole run.
+    """
+
+    method: str
+    items: int
+    errors: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Items per second"""
+        return self.items / self.seconds if self.seconds else float("inf")
+
+
+def load_test(
+    client: Ozon3Lite,
+    items: int = 1000,
+    threads: int = 16,
+    methods: Optional[List[str]] = None,
+) -> List[LoadTestResult]:
+    """Measure the end-to-end throughput of the client's concurrent methods
+
+    Each method requests items distinct cities or coordinates, so that nothing
+    is served from the client's caches:
+
+    - "city_air_record": get_city_air_record, called by threads threads.
+    - "multiple_city_air": get_multiple_city_air, one batch.
+    - "multiple_coordinate_air": get_multiple_coordinate_air, one batch.
+    - "range_coordinates_air": get_range_coordinates_air over a box of about
+      items grid cells of a MockWAQIServer.
+
+    The batch methods use the client's own thread pool (max_workers). Requests
+    are limited by the client's rate limit like any others. Against the real
+    API, every item counts against the quota.
+
+    Args:
+        client (Ozon3Lite): The client to test, e.g. Ozon3(token,
+            base_url=server.url).
+        items (int, optional): Number of items per method. Defaults to 1000.
+        threads (int, optional): Number of threads calling
+            get_city_air_record. Defaults to 16.
+        methods (list, optional): Names of the methods to test. Defaults to
+            every method the client has.
+
+    Returns:
+        list: A LoadTestResult for each method, in the order above.
+    """
+    runs: Dict[str, Callable[[], Tuple[int, int]]] = {}
+    cities = [f"loadtest-city-{i}" for i in range(items)]
+    # Half a degree apart, so that no two coordinates snap to the same station.
+    width = max(int(items**0.5), 1)
+    locations = [(-60 + i // width * 0.5, -170 + i % width * 0.5) for i in range(items)]
+
+    def city_air_record() -> Tuple[int, int]:
+        def lookup(city: str) -> bool:
+            try:
+                client.get_city_air_record(city)
+            except Exception:
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return items, items - sum(executor.map(lookup, cities))
+
+    runs["city_air_record"] = city_air_record
+
+    if hasattr(client, "get_multiple_city_air"):
+        ozon3: Any = client
+
+        def multiple_city_air() -> Tuple[int, int]:
+            result = ozon3.get_multiple_city_air(cities, as_result=True)
+            return items, len(result.errors)
+
+        def multiple_coordinate_air() -> Tuple[int, int]:
+            result = ozon3.get_multiple_coordinate_air(locations, as_result=True)
+            return items, len(result.errors)
+
+        def range_coordinates_air() -> Tuple[int, int]:
+            side = width * 0.25
+            result = ozon3.get_range_coordinates_air(
+                (10.0, 10.0), (10.0 + side, 10.0 + side), as_result=True
+            )
+            return len(result.data), len(result.errors)
+
+        runs["multiple_city_air"] = multiple_city_air
+        runs["multiple_coordinate_air"] = multiple_coordinate_air
+        runs["range_coordinates_air"] = range_coordinates_air
+
+    results = []
+    for method, run in runs.items():
+        if methods is not None and method not in methods:
+            continue
+        start = time.perf_counter()
+        count, errors = run()
+        results.append(
+            LoadTestResult(method, count, errors, time.perf_counter() - start)
+        )
+    return results
+
+
+def _main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m ozon3.testing",
+        description="Load test Ozon3 against a local mock of the WAQI API.",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="items per method")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--max-workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--over-quota-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from .ozon3 import Ozon3
+
+    with MockWAQIServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        over_quota_rate=args.over_quota_rate,
+        seed=args.seed,
+    ) as server:
+        client = Ozon3("token", base_url=server.url, max_workers=args.max_workers)
+        results = load_test(client, items=args.requests, threads=args.threads)
+
+    print(f"{'method':<25}{'items':>8}{'errors':>8}{'seconds':>10}{'items/s':>10}")
+    for r in results:
+        print(
+            f"{r.method:<25}{r.items:>8}{r.errors:>8}"
+            f"{r.seconds:>10.2f}{r.throughput:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    _main()
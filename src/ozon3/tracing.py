@@ -0,0 +1,105 @@
+"""tracing module for the Ozon3 package.
+
+This module contains Tracer, the base class of hooks that Ozon3 calls at every
+phase of a request (start, response, parsing, decoding and each server-sent
+event of historical data), with timing and size information.
+
+It should only be used with the Ozon3 package and not run directly.
+"""
+
+import warnings
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+
+class TraceEvent(NamedTuple):
+    """One phase of one request
+
+    Attributes:
+        kind (str): "request_start", "response", "parse_done", "decode_done"
+            or "sse_event"; the tracer method called is "on_" + kind.
+        seconds (float): How long the phase took. For "sse_event", the time
+            since the request started.
+        url (str): The url requested, if the phase belongs to one request.
+        size (int): Bytes received in the phase, or rows decoded.
+        details (dict): Anything else known about the phase, e.g. "endpoint",
+            "status_code", "error", "city", "city_id" or "event".
+    """
+
+    kind: str
+    seconds: Optional[float] = None
+    url: Optional[str] = None
+    size: Optional[int] = None
+    details: Optional[Dict[str, Any]] = None
+
+
+class Tracer:
+    """Hooks called at every phase of a request; override the ones needed
+
+    Tracers are added to Ozon3.tracers to trace every call, or passed to
+    Ozon3.trace to trace only the calls made inside a `with` block. Hooks are
+    called in the thread that ran the phase, so they must be thread-safe if the
+    client is used by several threads or fetches several locations at once.
+    Exceptions raised by hooks are turned into warnings.
+
+    Example:
+        >>> class SlowResponses(Tracer):
+        ...     def on_response(self, event):
+        ...         if event.seconds > 5:
+        ...             print(f"{event.url} took {event.seconds:.1f}s")
+        >>> o3.tracers.append(SlowResponses())
+    """
+
+    def on_request_start(self, event: TraceEvent) -> None:
+        """A request is about to be sent"""
+
+    def on_response(self, event: TraceEvent) -> None:
+        """The response (or its headers, for streams) arrived, or an error did"""
+
+    def on_parse_done(self, event: TraceEvent) -> None:
+        """A response was parsed and checked for API errors"""
+
+    def on_decode_done(self, event: TraceEvent) -> None:
+        """Parsed data was turned into rows, e.g. by extracting live data"""
+
+    def on_sse_event(self, event: TraceEvent) -> None:
+        """A server-sent event of a historical data stream arrived"""
+
+
+class TraceRecorder(Tracer):
+    """Tracer that keeps every event, e.g. to inspect a single slow call
+
+    Example:
+        >>> recorder = TraceRecorder()
+        >>> with o3.trace(recorder):
+        ...     o3.get_historical_data(city_id=5724)
+        >>> max(recorder.events, key=lambda e: e.seconds or 0)
+
+    Attributes:
+        events (list): The TraceEvents, in the order they were recorded.
+    """
+
+    def __init__(self) -> None:
+        self.events: List[TraceEvent] = []
+
+    def _record(self, event: TraceEvent) -> None:
+        self.events.append(event)
+
+    on_request_start = _record
+    on_response = _record
+    on_parse_done = _record
+    on_decode_done = _record
+    on_sse_event = _record
+
+
+def _emit(tracers: Sequence[Tracer], kind: str, **fields: Any) -> None:
+    """Call the hook of kind on every tracer"""
+    event = TraceEvent(kind, **fields)
+    for tracer in tracers:
+        try:
+            getattr(tracer, "on_" + kind)(event)
+        except Exception as e:
+            warnings.warn(f"Tracer {tracer!r} failed on {kind}: {e!r}")
+
+
+if __name__ == "__main__":
+    pass
@@ -24,6 +24,10 @@ class URLs:
          retrieving a collection of air quality measuring stations.
         find_coordinates_url (str): The endpoint used for
          retrieving geographical information
+        station_search_url (str): The endpoint used for searching stations by
+         name, outside the API's specification.
+        historical_url (str): The endpoint used for streaming historical data,
+         outside the API's specification.
     """
 
     # Base API endpoint.
@@ -38,6 +42,12 @@ class URLs:
     # For Map Queries
     find_coordinates_url: str = f"{_base_url}map/"
 
+    # For station search by name (used by historical data).
+    station_search_url: str = "https://search.waqi.info/nsearch/station/"
+
+    # For historical data, streamed as server-sent events.
+    historical_url: str = f"{_base_url}api/attsse/"
+
 
 if __name__ == "__main__":
     pass
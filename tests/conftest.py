@@ -1,5 +1,5 @@
 import pytest
-from utils import vcr_kwargs
+from utils import api, vcr_kwargs
 
 
 # Pytest configurations. Modified from
@@ -30,3 +30,17 @@ def pytest_collection_modifyitems(config, items):
 @pytest.fixture(scope="session")
 def vcr_config():
     return vcr_kwargs
+
+
+# VCR.py can't reliably replay a cassette from several threads at once, so
+# cassette-backed tests fetch one location at a time.
+@pytest.fixture(autouse=True)
+def serial_requests_under_vcr(request):
+    if request.node.get_closest_marker("vcr") is None:
+        yield
+        return
+
+    max_workers = api.max_workers
+    api.max_workers = 1
+    yield
+    api.max_workers = max_workers
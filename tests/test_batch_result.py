@@ -0,0 +1,106 @@
+import pandas
+import pytest
+
+from ozon3 import APIError, DeltaTracker
+from utils import api, fake_feed, make_response
+
+
+@pytest.fixture
+def flaky_feed(monkeypatch):
+    """Fake feed: "unknowncity" never exists, "flakycity" fails twice first"""
+    flaky_failures = [True, True]
+
+    def respond(url):
+        if "flakycity" in url and flaky_failures:
+            flaky_failures.pop()
+            return make_response({}, status_code=500)
+
+    return fake_feed(monkeypatch, respond)
+
+
+def test_errors_are_kept(flaky_feed):
+    result = api.get_multiple_city_air(
+        ["london", "unknowncity", "flakycity"], as_result=True
+    )
+
+    assert not result.ok
+    assert result.failed == ["unknowncity", "flakycity"]
+    unknown, flaky = result.errors
+    assert unknown.position == 1
+    assert unknown.status_code == 200
+    assert unknown.api_message == "Unknown station"
+    assert "no known AQI station" in unknown.message
+    assert flaky.status_code == 500
+    assert flaky.api_message is None
+
+    data = result.data
+    assert list(data["city"]) == ["london", "unknowncity", "flakycity"]
+    assert data["aqi"].isna().tolist() == [False, True, True]
+
+
+def test_retry_failed_only_requests_failed_items(flaky_feed):
+    result = api.get_multiple_city_air(
+        ["london", "unknowncity", "flakycity"], as_result=True
+    )
+    flaky_feed.clear()
+
+    result.retry_failed(attempts=3, backoff=0)
+
+    assert result.failed == ["unknowncity"]
+    assert not any("london" in url for url in flaky_feed)
+    # flakycity succeeds on its second retry, so it is not requested again.
+    assert sum("flakycity" in url for url in flaky_feed) == 2
+    assert sum("unknowncity" in url for url in flaky_feed) == 3
+    assert result.data["aqi"].isna().tolist() == [False, True, False]
+
+
+def test_retry_failed_backs_off_before_every_retry(flaky_feed, monkeypatch):
+    delays = []
+    monkeypatch.setattr("ozon3.batch.time.sleep", delays.append)
+    result = api.get_multiple_city_air(["london", "unknowncity"], as_result=True)
+
+    result.retry_failed(attempts=3, backoff=0.5)
+    assert delays == [0.5, 1.0, 2.0]
+
+    # Nothing left to retry: no waiting either.
+    delays.clear()
+    api.get_multiple_city_air(["london"], as_result=True).retry_failed()
+    assert delays == []
+
+
+def test_delta_is_saved_once_per_fetch(flaky_feed, tmp_path, monkeypatch):
+    delta = DeltaTracker(str(tmp_path / "delta.json"))
+    saves = []
+    save = delta.save
+    monkeypatch.setattr(delta, "save", lambda: saves.append(save()))
+
+    result = api.get_multiple_city_air(
+        ["london", "paris", "unknowncity", "flakycity"], delta=delta, as_result=True
+    )
+
+    assert len(saves) == 1
+    # Every city is answered by the same station, so only its first reading
+    # is kept; failed cities keep their row.
+    assert result.data["city"].tolist() == ["london", "unknowncity", "flakycity"]
+
+
+def test_coordinate_errors(monkeypatch):
+    def respond(url):
+        if "geo:0;0" in url:
+            return make_response({"status": "error", "data": "Invalid geo position"})
+
+    fake_feed(monkeypatch, respond)
+    result = api.get_multiple_coordinate_air(
+        [(51.5, -0.12), (0, 0)], df=pandas.DataFrame({"aqi": [1.0]}), as_result=True
+    )
+
+    assert result.failed == [(0, 0)]
+    assert result.errors[0].api_message == "Invalid geo position"
+    assert len(result.data) == 3
+
+
+def test_api_error_is_an_exception(flaky_feed):
+    with pytest.raises(APIError, match="no known AQI station") as info:
+        api.get_city_air("unknowncity")
+    assert info.value.api_message == "Unknown station"
+    assert isinstance(info.value, Exception)
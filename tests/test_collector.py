@@ -0,0 +1,195 @@
+import threading
+import time
+from concurrent.futures import wait
+
+import pandas
+import pytest
+
+from ozon3.collector import Collector
+from utils import api, fake_feed
+
+
+class FakeClock:
+    """Virtual time for Collectors, so that tests don't depend on real sleeps
+
+    Pass monotonic as a collector's clock, and attach the collector. Its sleep
+    then waits for its polls in flight to finish, and moves the virtual time
+    forward at once, up to end.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.end = float("inf")
+        self.reached_end = threading.Event()
+
+    def monotonic(self):
+        return self.now
+
+    def attach(self, collector):
+        def sleep(seconds):
+            with collector._lock:
+                pending = list(collector._pending)
+            wait(pending)
+            if self.now >= self.end:
+                self.reached_end.set()
+                time.sleep(0.001)  # Until the test stops the collector
+            else:
+                self.now = min(self.now + seconds, self.end)
+
+        collector._sleep = sleep
+        return collector
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def request_times(monkeypatch, clock):
+    """Make api answer every request, and record when each url was requested"""
+    times = []
+    fake_feed(monkeypatch, lambda url: times.append((clock.now, url)))
+    return times
+
+
+def run_collector(collector, seconds):
+    """Run collector for seconds of virtual time"""
+    clock = collector.clock.__self__
+    clock.end = clock.now + seconds
+    collector.start()
+    assert clock.reached_end.wait(10)
+    collector.stop()
+
+
+def test_delivers_rows_in_batches(request_times, clock):
+    batches = []
+    collector = clock.attach(
+        Collector(
+            api, sink=batches.append, interval=0.5, batch_size=3, clock=clock.monotonic
+        )
+    )
+    collector.add_cities(["london", "paris", "unknowncity"])
+    collector.add_coordinate(51.5, -0.13)
+
+    run_collector(collector, 1.2)
+
+    assert batches
+    assert all(isinstance(batch, pandas.DataFrame) for batch in batches)
+    data = pandas.concat(batches, ignore_index=True)
+    assert len(data) == collector.requests_made
+    assert {"london", "paris", "unknowncity"} <= set(data["city"].dropna())
+    assert data.loc[data["city"] == "london", "aqi"].iloc[0] == 34.0
+    assert data.loc[data["city"] == "unknowncity", "aqi"].isna().all()
+    assert collector.errors == (data["city"] == "unknowncity").sum()
+    assert (data["latitude"] == 51.5073509).any()
+
+
+def test_requests_are_spread_over_the_interval(request_times, clock):
+    collector = clock.attach(
+        Collector(api, sink=lambda _: None, interval=1.0, clock=clock.monotonic)
+    )
+    start = clock.now
+    collector.add_cities([f"city{i}" for i in range(10)])
+
+    run_collector(collector, 0.99)
+
+    times = sorted(t - start for t, _ in request_times)
+    assert len(times) == 10
+    # A burst would request every city at once; each gets its own phase instead.
+    assert times[0] == 0
+    assert times[-1] > 0.9
+    assert all(b - a > 0.03 for a, b in zip(times, times[1:]))
+
+
+def test_per_target_intervals(request_times, clock):
+    collector = clock.attach(
+        Collector(api, sink=lambda _: None, interval=10.0, clock=clock.monotonic)
+    )
+    collector.add_city("london", interval=0.1)
+    collector.add_city("paris")
+
+    run_collector(collector, 0.55)
+
+    urls = [url for _, url in request_times]
+    assert sum("london" in url for url in urls) == 6
+    assert sum("paris" in url for url in urls) <= 1
+
+
+def test_max_rate_paces_requests(request_times, clock):
+    collector = clock.attach(
+        Collector(
+            api, sink=lambda _: None, interval=0.01, max_rate=20, clock=clock.monotonic
+        )
+    )
+    collector.add_cities(["london", "paris"])
+
+    run_collector(collector, 0.5)
+
+    times = sorted(t for t, _ in request_times)
+    assert len(times) == 11
+    assert all(b - a >= 0.05 - 1e-9 for a, b in zip(times, times[1:]))
+
+
+def test_flushes_on_flush_interval(request_times, clock):
+    batches = []
+    collector = clock.attach(
+        Collector(
+            api,
+            sink=batches.append,
+            interval=10.0,
+            batch_size=100,
+            flush_interval=0.2,
+            clock=clock.monotonic,
+        )
+    )
+    collector.add_city("london")
+
+    run_collector(collector, 0.5)
+    # Flushed at 0.2s; nothing was left to flush at 0.4s or on stop.
+    assert len(batches) == 1
+    assert collector.batches_delivered == 1
+
+
+def test_sink_errors_do_not_stop_collection(request_times, clock):
+    def failing_sink(_):
+        raise ValueError("disk full")
+
+    collector = clock.attach(
+        Collector(
+            api, sink=failing_sink, interval=0.1, batch_size=1, clock=clock.monotonic
+        )
+    )
+    collector.add_city("london")
+
+    with pytest.warns(UserWarning, match="disk full"):
+        run_collector(collector, 0.35)
+    assert collector.requests_made >= 2
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError, match="flush_interval"):
+        Collector(api, sink=print, flush_interval=0)
+    with pytest.raises(ValueError, match="batch_size"):
+        Collector(api, sink=print, batch_size=0)
+
+
+def test_zero_interval_is_kept(clock):
+    collector = Collector(api, sink=print, interval=60.0, clock=clock.monotonic)
+    collector.add_city("london", interval=0)
+
+    assert collector._schedule[0][2].interval == 0
+
+
+def test_sleeps_without_targets():
+    collector = Collector(api, sink=print, flush_interval=0.1)
+    sleeps = []
+    sleep = collector._sleep
+    collector._sleep = lambda seconds: sleeps.append(seconds) or sleep(seconds)
+
+    collector.start()
+    time.sleep(0.35)
+    collector.stop()
+
+    assert 2 <= len(sleeps) <= 5
+    assert all(seconds > 0 for seconds in sleeps)
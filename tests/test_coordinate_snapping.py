@@ -0,0 +1,132 @@
+import asyncio
+import re
+
+import pytest
+
+from ozon3 import Ozon3
+
+from ozon3._cache import TTLCache
+from ozon3.spatial import CoordinateSnapCache, haversine_km
+from utils import api, make_response
+
+# Two fake stations: one in London and one in Paris.
+STATIONS = {
+    1: (51.5073509, -0.1277583, "London"),
+    2: (48.856614, 2.3522219, "Paris"),
+}
+
+
+def feed_data(uid):
+    lat, lon, name = STATIONS[uid]
+    return {
+        "aqi": 30 + uid,
+        "idx": uid,
+        "city": {"geo": [lat, lon], "name": name},
+        "dominentpol": "pm25",
+        "iaqi": {"pm25": {"v": 30 + uid}},
+        "time": {"s": "2022-05-23 06:00:00", "tz": "+01:00"},
+    }
+
+
+@pytest.fixture
+def requested_urls(monkeypatch):
+    """Make api answer from the fake stations, snapping within 5 km"""
+    urls = []
+
+    def fake_request(url):
+        urls.append(url)
+        station = re.search(r"/@(\d+)/", url)
+        if station is not None:
+            return make_response({"status": "ok", "data": feed_data(int(station[1]))})
+
+        lat, lon = map(float, re.search(r"geo:([^;]+);([^/]+)/", url).groups())
+        nearest = min(
+            STATIONS, key=lambda uid: haversine_km(lat, lon, *STATIONS[uid][:2])
+        )
+        return make_response({"status": "ok", "data": feed_data(nearest)})
+
+    monkeypatch.setattr(api, "_make_api_request", fake_request)
+    monkeypatch.setattr(api, "cache", TTLCache(ttl=60))
+    monkeypatch.setattr(api, "snap_cache", CoordinateSnapCache(radius_km=5))
+    return urls
+
+
+def test_nearby_coordinates_reuse_station(requested_urls):
+    first = api.get_coordinate_air(51.51, -0.13)
+    second = api.get_coordinate_air(51.52, -0.12)  # About 1.3 km away
+
+    assert len(requested_urls) == 1
+    assert second.at[0, "station"] == first.at[0, "station"] == "London"
+    assert api.snap_cache.hits == 1
+
+
+def test_async_lookups_use_the_snap_cache(requested_urls):
+    async def main():
+        first = await api.get_coordinate_air_record_async(51.51, -0.13)
+        second = await api.get_coordinate_air_record_async(51.52, -0.12)
+        return first, second
+
+    first, second = asyncio.run(main())
+    third = api.get_coordinate_air_record(51.515, -0.125)
+
+    assert len(requested_urls) == 1
+    assert first.station == second.station == third.station == "London"
+    assert api.snap_cache.hits == 2
+
+
+def test_distant_coordinates_are_not_snapped(requested_urls):
+    api.get_coordinate_air(51.51, -0.13)
+    result = api.get_coordinate_air(48.86, 2.35)
+
+    assert len(requested_urls) == 2
+    assert result.at[0, "station"] == "Paris"
+
+
+def test_batch_is_deduped_before_requests(requested_urls):
+    locations = [
+        (51.51, -0.13),
+        (51.511, -0.131),
+        (51.51, -0.13),
+        (48.86, 2.35),
+        (48.861, 2.351),
+    ]
+    result = api.get_multiple_coordinate_air(locations)
+
+    # One geo query per cluster of nearby coordinates
+    assert len(requested_urls) == 2
+    assert result["station"].tolist() == ["London"] * 3 + ["Paris"] * 2
+
+    # Later batches are served entirely from the known stations.
+    api.get_multiple_coordinate_air([(51.5, -0.14), (48.85, 2.34)])
+    assert len(requested_urls) == 2
+
+
+def test_snap_cache_lookup():
+    cache = CoordinateSnapCache(radius_km=1)
+    cache.add(60.0, 10.0, 7)
+
+    assert cache.lookup(60.0, 10.015) == 7  # About 0.8 km east
+    assert cache.lookup(60.0, 10.03) is None  # About 1.7 km east
+    assert cache.lookup("not a lat", "not a lon") is None
+    assert CoordinateSnapCache(radius_km=0).lookup(60.0, 10.0) is None
+
+
+def test_snap_cache_lookup_near_poles_and_antimeridian():
+    cache = CoordinateSnapCache(radius_km=10)
+    # About 9.8 km apart, but 55 degrees of longitude: more than 10 km spans
+    # at 89.9N, and as much as it spans a little closer to the pole.
+    cache.add(89.91, 55.0, 1)
+    assert cache.lookup(89.9, 0.0) == 1
+
+    cache.add(0.0, 179.99, 2)
+    assert cache.lookup(0.0, -179.99) == 2  # About 2.2 km apart
+    cache.add(0.0, -180.0, 3)
+    assert cache.lookup(0.0, 179.999) == 3
+
+    cache.add(89.99, 0.0, 4)
+    assert cache.lookup(89.99, 180.0) == 4  # About 2.2 km apart, over the pole
+
+
+def test_snapping_needs_a_cache():
+    with pytest.raises(Exception, match="needs a cache_ttl"):
+        Ozon3("token", snap_radius_km=5)
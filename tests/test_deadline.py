@@ -0,0 +1,81 @@
+import time
+
+import pytest
+import requests
+
+from ozon3 import Ozon3
+from utils import local_waqi_server
+
+
+@pytest.fixture
+def slow_server():
+    with local_waqi_server(delays={"slow": 3.0, "geo:3;3": 3.0}) as server:
+        yield server
+
+
+def client(server, **kwargs):
+    return Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}", **kwargs)
+
+
+def test_request_timeout(slow_server):
+    o3 = client(slow_server, timeout=0.2)
+
+    start = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        o3.get_city_air("slow")
+    assert time.perf_counter() - start < 1
+
+    # In a batch, the city that timed out gets an empty row.
+    data = o3.get_multiple_city_air(["london", "slow"])
+    assert list(data["city"]) == ["london", "slow"]
+    assert data["aqi"].isna().tolist() == [False, True]
+
+
+def test_multiple_city_air_deadline(slow_server):
+    o3 = client(slow_server)
+
+    start = time.perf_counter()
+    data = o3.get_multiple_city_air(["london", "slow", "paris"], deadline=0.3)
+    assert time.perf_counter() - start < 1
+
+    assert list(data["city"]) == ["london", "slow", "paris"]
+    assert data["timed_out"].tolist() == [False, True, False]
+    assert data["station"].tolist()[::2] == ["london", "paris"]
+    assert data["aqi"].isna().tolist() == [False, True, False]
+
+
+def test_multiple_coordinate_air_deadline(slow_server):
+    o3 = client(slow_server)
+
+    start = time.perf_counter()
+    data = o3.get_multiple_coordinate_air([(1, 1), (3, 3), (2, 2)], deadline=0.3)
+    assert time.perf_counter() - start < 1
+
+    assert data["timed_out"].tolist() == [False, True, False]
+    assert data["latitude"].tolist()[1] == 3.0
+    assert data["aqi"].isna().tolist() == [False, True, False]
+
+
+def test_requests_not_started_are_cancelled(slow_server):
+    o3 = client(slow_server, max_workers=1)
+    slow_server.paths.clear()
+
+    data = o3.get_multiple_city_air(["slow", "london", "paris"], deadline=0.3)
+
+    assert data["timed_out"].all()
+    # Only the first request was started; the others were cancelled.
+    assert len(slow_server.paths) == 1
+
+
+def test_abandoned_requests_do_not_hold_up_later_calls(slow_server):
+    o3 = client(slow_server, max_workers=1)
+    o3.get_multiple_city_air(["slow"], deadline=0.1)
+
+    # The abandoned request is still running, but doesn't take this one's thread.
+    data = o3.get_multiple_city_air(["london"], deadline=1.0)
+    assert data["timed_out"].tolist() == [False]
+
+
+def test_no_timed_out_column_without_deadline(slow_server):
+    data = client(slow_server).get_multiple_city_air(["london"])
+    assert "timed_out" not in data.columns
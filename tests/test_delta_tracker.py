@@ -0,0 +1,131 @@
+import pandas
+import pytest
+
+from ozon3 import DeltaTracker
+from ozon3.collector import Collector
+from utils import api, make_response
+
+STATION_IDS = {"london": 5724, "paris": 5722, "London": 5724}
+
+
+def feed(name, timestamp, idx=None):
+    return {
+        "aqi": 34,
+        "idx": STATION_IDS[name] if idx is None else idx,
+        "city": {"geo": [51.5073509, -0.1277583], "name": name},
+        "dominentpol": "pm25",
+        "iaqi": {"pm25": {"v": 34}},
+        "time": {"s": timestamp, "tz": "+01:00"},
+    }
+
+
+@pytest.fixture
+def station_times(monkeypatch):
+    """Make api answer with the timestamp currently set for each city"""
+    times = {"london": "2022-05-23 06:00:00", "paris": "2022-05-23 06:00:00"}
+
+    def fake_request(url):
+        for city, timestamp in times.items():
+            if f"/{city}/" in url:
+                return make_response({"status": "ok", "data": feed(city, timestamp)})
+        return make_response({"status": "error", "data": "Unknown station"})
+
+    monkeypatch.setattr(api, "_make_api_request", fake_request)
+    return times
+
+
+def test_is_new():
+    delta = DeltaTracker()
+
+    assert delta.is_new(5724, "2022-05-23 06:00:00")
+    assert not delta.is_new(5724, "2022-05-23 06:00:00")
+    assert delta.is_new(5722, "2022-05-23 06:00:00")
+    assert delta.is_new(5724, "2022-05-23 07:00:00")
+    assert delta.suppressed == 1
+    assert len(delta) == 2
+
+
+def test_filter_keeps_rows_without_reading():
+    delta = DeltaTracker()
+    rows = [
+        {"station_id": 5724, "timestamp": "2022-05-23 06:00:00"},
+        {"city": "unknowncity"},
+        {"station_id": float("nan"), "timestamp": float("nan")},
+    ]
+
+    assert delta.filter(rows) == rows
+    assert delta.filter(rows) == rows[1:]
+    assert delta.suppressed == 1
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "delta.json")
+    delta = DeltaTracker(path)
+    delta.filter([{"station_id": 5724, "timestamp": "2022-05-23 06:00:00"}])
+
+    restarted = DeltaTracker(path)
+    assert not restarted.is_new(5724, "2022-05-23 06:00:00")
+    assert restarted.is_new(5724, "2022-05-23 07:00:00")
+
+
+def test_stations_sharing_a_name_are_tracked_apart():
+    delta = DeltaTracker()
+    rows = [
+        {"station": "US Embassy", "station_id": 1, "timestamp": "2022-05-23"},
+        {"station": "US Embassy", "station_id": 2, "timestamp": "2022-05-23"},
+    ]
+
+    assert delta.filter(rows) == rows
+    assert delta.filter(rows) == []
+
+
+def test_get_multiple_city_air_delta(station_times):
+    delta = DeltaTracker()
+    cities = ["london", "paris", "unknowncity"]
+
+    first = api.get_multiple_city_air(cities, delta=delta)
+    assert list(first["city"]) == cities
+
+    station_times["paris"] = "2022-05-23 07:00:00"
+    second = api.get_multiple_city_air(cities, delta=delta)
+    assert list(second["city"]) == ["paris", "unknowncity"]
+    assert second.loc[0, "timestamp"] == "2022-05-23 07:00:00"
+    assert delta.suppressed == 1
+
+    # Without a tracker every reading is returned.
+    assert len(api.get_multiple_city_air(cities)) == 3
+
+
+def test_get_multiple_coordinate_air_delta(monkeypatch):
+    monkeypatch.setattr(
+        api,
+        "_make_api_request",
+        lambda url: make_response(
+            {"status": "ok", "data": feed("London", "2022-05-23 06:00:00")}
+        ),
+    )
+    delta = DeltaTracker()
+    locations = [(51.5, -0.12), (51.6, -0.13)]
+
+    # Both locations are answered by the same station, with the same reading.
+    assert len(api.get_multiple_coordinate_air(locations, delta=delta)) == 1
+    assert api.get_multiple_coordinate_air(locations, delta=delta).empty
+    assert delta.suppressed == 3
+
+
+def test_collector_delta(station_times):
+    batches = []
+    delta = DeltaTracker()
+    collector = Collector(
+        api, sink=batches.append, interval=10.0, batch_size=2, delta=delta
+    )
+    collector.add_cities(["london", "paris"])
+
+    for _ in range(3):
+        for target in list(t for _, _, t in collector._schedule):
+            collector._poll(target)
+    collector.flush()
+
+    data = pandas.concat(batches, ignore_index=True)
+    assert sorted(data["city"]) == ["london", "paris"]
+    assert delta.suppressed == 4
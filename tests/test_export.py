@@ -0,0 +1,191 @@
+import json
+
+import numpy
+import openpyxl
+import pandas
+import pytest
+
+from ozon3.export import ChunkedWriter, CSVWriter, ExcelWriter, export, open_writer
+import utils
+from utils import api
+
+
+def frames(n_frames=5, rows=7):
+    for i in range(n_frames):
+        start = i * rows
+        yield pandas.DataFrame(
+            {
+                "station": [f"station{j}" for j in range(start, start + rows)],
+                "timestamp": ["2022-05-23 06:00:00"] * rows,
+                "aqi": numpy.arange(start, start + rows, dtype=float),
+            }
+        )
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    return utils.fake_feed(monkeypatch)
+
+
+def test_writes_fixed_size_chunks(tmp_path):
+    written = []
+
+    class RecordingWriter(CSVWriter):
+        def _write_chunk(self, chunk):
+            written.append(len(chunk))
+            super()._write_chunk(chunk)
+
+    with RecordingWriter(str(tmp_path / "out.csv"), chunk_size=10) as writer:
+        for df in frames():
+            writer.write(df)
+
+    assert written == [10, 10, 10, 5]
+    assert writer.rows_written == 35
+
+
+def test_csv(tmp_path):
+    path = str(tmp_path / "out.csv")
+    assert export(frames(), path, chunk_size=10) == 35
+
+    data = pandas.read_csv(path)
+    assert len(data) == 35
+    assert list(data.columns) == ["station", "timestamp", "aqi"]
+    assert list(data["aqi"]) == list(range(35))
+
+
+def test_jsonl(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    export(frames(), path, chunk_size=10)
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 35
+    assert records[-1] == {
+        "station": "station34",
+        "timestamp": "2022-05-23 06:00:00",
+        "aqi": 34.0,
+    }
+
+
+def test_excel(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+
+    class SmallExcelWriter(ExcelWriter):
+        max_rows = 21
+
+    with SmallExcelWriter(path, chunk_size=10) as writer:
+        for df in frames():
+            writer.write(df)
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    assert workbook.sheetnames == ["data", "data_2"]
+    rows = [list(row) for ws in workbook for row in ws.iter_rows(values_only=True)]
+    assert rows[0] == ["station", "timestamp", "aqi"]
+    assert len(rows) == 35 + 2
+
+
+def test_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "dataset")
+    export(frames(), path, format="parquet", chunk_size=10)
+
+    assert (tmp_path / "dataset" / "date=2022-05-23").is_dir()
+    assert len(pandas.read_parquet(path)) == 35
+
+
+def test_later_chunk_with_extra_columns(tmp_path):
+    later = [
+        pandas.DataFrame({"city": ["x"]}),
+        pandas.DataFrame({"city": ["y"], "aqi": [5.0]}),
+    ]
+
+    # The header is fixed by the first chunk: data in other columns is an error.
+    with pytest.raises(Exception, match=r"\['aqi'\] are not in"):
+        export(iter(later), str(tmp_path / "out.csv"), chunk_size=1)
+    with pytest.raises(Exception, match=r"\['aqi'\] are not in"):
+        export(iter(later), str(tmp_path / "out.xlsx"), chunk_size=1)
+
+    path = str(tmp_path / "columns.csv")
+    export(iter(later), path, chunk_size=1, columns=["city", "aqi"])
+    data = pandas.read_csv(path)
+    assert list(data.columns) == ["city", "aqi"]
+    assert list(data["city"]) == ["x", "y"]
+    assert data["aqi"].isna().tolist() == [True, False]
+    assert data.loc[1, "aqi"] == 5.0
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(Exception, match="Unknown export format"):
+        open_writer(str(tmp_path / "out.txt"))
+
+
+def test_iter_multiple_city_air(feed):
+    cities = ["london", "unknowncity", "paris", "berlin", "rome"]
+    chunks = list(api.iter_multiple_city_air(cities, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    data = pandas.concat(chunks, ignore_index=True)
+    assert list(data["city"]) == cities
+    assert data["aqi"].isna().tolist() == [False, True, False, False, False]
+
+
+def test_iter_multiple_coordinate_air(feed):
+    locations = [(51.5, -0.12), (51.6, -0.13), (51.7, -0.14)]
+    chunks = list(api.iter_multiple_coordinate_air(locations, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+
+
+def test_iter_historical_data(monkeypatch):
+    def fake_historical_data(city_id):
+        if city_id == 0:
+            raise Exception("no data")
+        return pandas.DataFrame(
+            {"date": pandas.to_datetime(["2022-05-23"]), "pm2.5": [float(city_id)]}
+        )
+
+    monkeypatch.setattr(api, "get_historical_data", fake_historical_data)
+    chunks = list(api.iter_historical_data([5724, 0]))
+
+    assert list(chunks[0].columns) == ["city_id", "date", "pm2.5"]
+    assert chunks[0].loc[0, "pm2.5"] == 5724.0
+    assert chunks[1].to_dict("list") == {"city_id": [0]}
+
+
+def test_ozon3_export(feed, tmp_path):
+    api.output_path = str(tmp_path / "exports")
+    try:
+        path = api.export(
+            api.iter_multiple_city_air(["london", "paris"], chunk_size=1),
+            format="jsonl",
+        )
+    finally:
+        api.output_path = "."
+
+    assert path == str(tmp_path / "exports" / "air_quality.jsonl")
+    data = pandas.read_json(path, lines=True)
+    assert list(data["city"]) == ["london", "paris"]
+
+
+def test_ozon3_export_infers_format_from_path(feed, tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    assert api.export(api.iter_multiple_city_air(["london"]), path=path) == path
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    rows = list(workbook["data"].iter_rows(values_only=True))
+    assert rows[0][0] == "city" and rows[1][0] == "london"
+
+
+def test_ozon3_export_defaults_to_csv(feed, tmp_path):
+    api.output_path = str(tmp_path)
+    try:
+        path = api.export(api.iter_multiple_city_air(["london"]))
+    finally:
+        api.output_path = "."
+    assert path == str(tmp_path / "air_quality.csv")
+    assert list(pandas.read_csv(path)["city"]) == ["london"]
+
+
+def test_writers_must_write_chunks(tmp_path):
+    with pytest.raises(TypeError):
+        ChunkedWriter(str(tmp_path / "out"))  # type: ignore
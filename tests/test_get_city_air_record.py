@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+import pytest
+
+from ozon3 import AirReading
+from utils import api
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    result = api.get_city_air_record("london")
+
+    assert isinstance(result, AirReading)
+    assert result.city == "london"
+    assert isinstance(result.aqi, float)
+    assert isinstance(result.pm25, float)
+
+
+@pytest.mark.vcr
+def test_bad_city():
+    with pytest.raises(Exception, match="no known AQI station"):
+        api.get_city_air_record("a definitely nonexistent city")
+
+    with pytest.raises(Exception):
+        api.get_city_air_record("")
+
+
+def test_lite_import_does_not_load_pandas():
+    code = (
+        "import sys; import ozon3.lite; from ozon3 import Ozon3Lite, AirReading; "
+        "assert 'pandas' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,31 @@
+import pandas
+import pandas.api.types as pd_types
+import pytest
+
+from utils import api
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    # The cassette holds a single response for london, so both parts
+    # must come from one request.
+    live, forecast = api.get_city_feed("london")
+
+    assert isinstance(live, pandas.DataFrame)
+    assert len(live) == 1
+    assert live.at[0, "city"] == "london"
+
+    assert isinstance(forecast, pandas.DataFrame)
+    assert len(forecast) == 7
+    assert pd_types.is_datetime64_any_dtype(forecast["date"])
+    for stat in ["min", "max", "avg"]:
+        assert pd_types.is_float_dtype(forecast[("pm2.5", stat)])
+
+
+@pytest.mark.vcr
+def test_bad_city():
+    with pytest.raises(Exception, match="no known AQI station"):
+        api.get_city_feed("a definitely nonexistent city")
+
+    with pytest.raises(Exception):
+        api.get_city_feed("")
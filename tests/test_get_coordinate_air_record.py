@@ -0,0 +1,19 @@
+import pytest
+
+from ozon3 import AirReading
+from utils import api
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    result = api.get_coordinate_air_record(51.51, -0.13)
+
+    assert isinstance(result, AirReading)
+    assert result.city is None  # No city was given
+    assert result.station == "London"  # Given by server
+    assert result.latitude == pytest.approx(51.507351)
+    assert result.longitude == pytest.approx(-0.1277583)
+
+    # The record converts back into the same row get_coordinate_air builds.
+    row = result.to_row()
+    assert "pm2.5" in row and "AQI_meaning" in row
@@ -0,0 +1,32 @@
+import pandas
+import pytest
+
+from utils import api
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    live, forecasts = api.get_multiple_city_feed(["london", "new delhi", "paris"])
+
+    assert isinstance(live, pandas.DataFrame)
+    assert live["city"].tolist() == ["london", "new delhi", "paris"]
+
+    assert list(forecasts) == ["london", "new delhi", "paris"]
+    assert all([isinstance(df, pandas.DataFrame) for df in forecasts.values()])
+    assert "date" in forecasts["london"].columns
+
+
+@pytest.mark.vcr
+def test_bad_city():
+    live, forecasts = api.get_multiple_city_feed(
+        ["london", "paris", "a definitely nonexistent city"]
+    )
+
+    # The failed city keeps its name and nothing else ...
+    assert live.at[2, "city"] == "a definitely nonexistent city"
+    assert live.iloc[2, :].drop("city").isna().all()
+
+    # ... and does not stop the others from being collected.
+    assert not live.loc[:1, "aqi"].isna().any()
+    assert forecasts["a definitely nonexistent city"].empty
+    assert not forecasts["london"].empty
@@ -0,0 +1,49 @@
+import pandas
+import pandas.api.types as pd_types
+import pytest
+
+from utils import api
+
+CITIES = ["london", "new delhi", "paris"]
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    result = api.get_multiple_city_forecast(CITIES)
+
+    assert isinstance(result, pandas.DataFrame)
+    assert result.columns.tolist() == ["city", "date", "pollutant", "avg", "min", "max"]
+    assert set(result["city"]) == set(CITIES)
+
+
+@pytest.mark.vcr
+def test_column_types():
+    result = api.get_multiple_city_forecast(CITIES)
+
+    assert pd_types.is_datetime64_any_dtype(result["date"])
+    assert all([pd_types.is_float_dtype(result[col]) for col in ["avg", "min", "max"]])
+
+    # pm25 is relabelled, same as in get_city_forecast
+    assert "pm2.5" in set(result["pollutant"])
+    assert "pm25" not in set(result["pollutant"])
+
+
+@pytest.mark.vcr
+def test_matches_get_city_forecast():
+    result = api.get_multiple_city_forecast(CITIES)
+    london = result[result["city"] == "london"]
+
+    # Reshaped back into wide format, there is one row per forecast day,
+    # same as get_city_forecast returns for london.
+    wide = london.pivot(index="date", columns="pollutant", values=["avg"])
+    assert len(wide) == 7
+    assert wide[("avg", "pm2.5")].iloc[0] == 32
+
+
+@pytest.mark.vcr
+def test_bad_city():
+    result = api.get_multiple_city_forecast(
+        ["london", "paris", "a definitely nonexistent city"]
+    )
+
+    assert set(result["city"]) == {"london", "paris"}
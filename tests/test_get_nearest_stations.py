@@ -0,0 +1,29 @@
+import pandas
+import pytest
+
+from utils import api
+
+LOWER_BOUND = (51, -0.2)
+UPPER_BOUND = (52, 1)
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    assert api.update_station_index(LOWER_BOUND, UPPER_BOUND) >= 32
+
+    # London is located on 51.5072 N, 0.1276 W
+    result = api.get_nearest_stations(51.5072, -0.1276, k=3)
+
+    assert isinstance(result, pandas.DataFrame)
+    assert result.columns.tolist() == [
+        "uid",
+        "station",
+        "latitude",
+        "longitude",
+        "aqi",
+        "time",
+        "distance_km",
+    ]
+    assert len(result) == 3
+    assert result.at[0, "station"] == "London"
+    assert result["distance_km"].is_monotonic_increasing
@@ -0,0 +1,54 @@
+import pandas
+import pandas.api.types as pd_types
+import pytest
+
+from utils import api
+
+CITIES = ["london", "new delhi", "paris"]
+
+
+@pytest.fixture
+def cached_api():
+    api.cache.ttl = 60
+    yield api
+    api.cache.ttl = 0
+    api.cache.clear()
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    result = api.get_specific_parameters(CITIES, ["pm2.5", "o3"])
+
+    assert isinstance(result, pandas.DataFrame)
+    assert result.shape == (3, 2)
+    assert result.index.tolist() == CITIES
+    assert result.columns.tolist() == ["pm2.5", "o3"]
+    assert all([pd_types.is_float_dtype(result[col]) for col in result.columns])
+
+
+@pytest.mark.vcr
+def test_bad_city():
+    result = api.get_specific_parameters(
+        ["london", "paris", "a definitely nonexistent city"], ["aqi"]
+    )
+
+    assert not result.loc[["london", "paris"], "aqi"].isna().any()
+    assert result.loc["a definitely nonexistent city"].isna().all()
+
+
+def test_bad_param():
+    with pytest.raises(Exception, match="Missing air quality parameter"):
+        api.get_specific_parameters(CITIES, ["aqi", "not a param"])
+
+
+@pytest.mark.vcr
+def test_shares_cache_with_live_data(cached_api):
+    result = cached_api.get_specific_parameters(CITIES, ["aqi"])
+
+    # The cassette holds one response per city, so these can only be
+    # answered from the cache.
+    assert (
+        cached_api.get_specific_parameter("london", "aqi") == result.at["london", "aqi"]
+    )
+    assert len(cached_api.get_city_air("paris")) == 1
+    assert cached_api.cache.hits == 2
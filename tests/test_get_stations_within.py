@@ -0,0 +1,21 @@
+import pandas
+import pytest
+
+from utils import api
+
+LOWER_BOUND = (51, -0.2)
+UPPER_BOUND = (52, 1)
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    api.update_station_index(LOWER_BOUND, UPPER_BOUND)
+    result = api.get_stations_within(51.5072, -0.1276, radius_km=5)
+
+    assert isinstance(result, pandas.DataFrame)
+    assert len(result) > 0
+    assert (result["distance_km"] <= 5).all()
+    assert result["distance_km"].is_monotonic_increasing
+
+    # No station lies within 5 km of the middle of the North Sea.
+    assert len(api.get_stations_within(56, 3, radius_km=5)) == 0
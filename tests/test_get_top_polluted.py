@@ -0,0 +1,46 @@
+import pandas
+import pytest
+
+from utils import api
+
+LOWER_BOUND = (51, -0.2)
+UPPER_BOUND = (52, 1)
+
+
+@pytest.fixture
+def requested_urls(monkeypatch):
+    urls = []
+    make_api_request = api._make_api_request
+
+    def counting_request(url):
+        urls.append(url)
+        return make_api_request(url)
+
+    monkeypatch.setattr(api, "_make_api_request", counting_request)
+    return urls
+
+
+@pytest.mark.vcr
+def test_return_value_and_format(requested_urls):
+    result = api.get_top_polluted(LOWER_BOUND, UPPER_BOUND, n=3)
+
+    assert isinstance(result, pandas.DataFrame)
+    assert len(result) == 3
+    assert result["aqi"].is_monotonic_decreasing
+    assert result.at[0, "aqi"] == 43
+
+    # One bounds request plus one per returned station
+    assert len(requested_urls) == 4
+
+
+@pytest.mark.vcr
+def test_rank_by_other_param():
+    result = api.get_top_polluted(LOWER_BOUND, UPPER_BOUND, n=5, param="no2")
+
+    assert len(result) == 5
+    assert result["no2"].is_monotonic_decreasing
+
+
+def test_bad_param():
+    with pytest.raises(Exception, match="Missing air quality parameter"):
+        api.get_top_polluted(LOWER_BOUND, UPPER_BOUND, param="not a param")
@@ -0,0 +1,98 @@
+import time
+
+from ozon3 import Ozon3
+from ozon3._hedging import Hedger
+from ozon3._tokens import TokenPool
+from utils import local_waqi_server
+
+
+def warm_up(o3, n=30):
+    for i in range(n):
+        o3.get_city_air_record(f"warmup{i}")
+
+
+def test_slow_request_is_hedged():
+    with local_waqi_server(delay=0.005, delays={"slowcity": [2.0]}) as server:
+        o3 = Ozon3(
+            "token",
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            hedge_percentile=90,
+        )
+        warm_up(o3)
+        before = sum(o3.token_pool.requests().values())
+        hedged, hedge_wins = o3.hedger.hedged, o3.hedger.hedge_wins
+
+        start = time.perf_counter()
+        record = o3.get_city_air_record("slowcity")
+        elapsed = time.perf_counter() - start
+
+    assert record.station == "slowcity"
+    assert elapsed < 1.0
+    assert o3.hedger.hedged == hedged + 1
+    assert o3.hedger.hedge_wins == hedge_wins + 1
+    assert sum("slowcity" in path for path in server.paths) == 2
+    # The duplicate counts against the rate limit.
+    assert sum(o3.token_pool.requests().values()) == before + 2
+
+
+def test_latencies_are_recorded():
+    with local_waqi_server(delay=0.005) as server:
+        o3 = Ozon3(
+            "token",
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            hedge_percentile=99,
+        )
+        warm_up(o3)
+
+    assert o3.hedger.requests == 30
+    assert 0 < o3.hedger.delay() < 0.5
+
+
+def test_rate_limit_waits_are_not_recorded():
+    with local_waqi_server(delay=0.005) as server:
+        o3 = Ozon3(
+            "token",
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            hedge_percentile=90,
+        )
+        # One request every 50ms: each request waits for the rate limit first.
+        o3._config = o3._config._replace(token_pool=TokenPool(["token"], 1, 0.05))
+        warm_up(o3)
+
+    assert o3.hedger.delay() < 0.04
+
+
+def test_hedging_is_off_by_default():
+    with local_waqi_server(delay=0.005, delays={"slowcity": [0.3]}) as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        warm_up(o3)
+        o3.get_city_air_record("slowcity")
+
+    assert not o3.hedger.enabled
+    assert o3.hedger.requests == 0
+    assert sum("slowcity" in path for path in server.paths) == 1
+
+
+def test_no_hedging_before_enough_samples():
+    hedger = Hedger(percentile=50, min_samples=3)
+    assert hedger.delay() is None
+    for latency in (0.1, 0.2, 0.3):
+        hedger.record(latency)
+    assert abs(hedger.delay() - 0.2) < 1e-9
+
+
+def test_error_of_one_call_uses_the_other():
+    hedger = Hedger(percentile=50, min_samples=1)
+    hedger.record(0.01)
+    calls = []
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            raise Exception("connection reset")
+        return "answer"
+
+    assert hedger.call(request) == "answer"
+    assert hedger.hedged == 1
+    assert hedger.hedge_wins == 1
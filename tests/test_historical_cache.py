@@ -0,0 +1,55 @@
+import gzip
+import os
+import time
+
+import pandas
+
+from ozon3 import Ozon3
+from ozon3.historical._disk_cache import HistoricalCache
+from ozon3.testing import _HISTORICAL_MSG, MockWAQIServer
+
+EVENTS = [{"msg": _HISTORICAL_MSG, "status": "ok"}]
+
+
+def test_roundtrip_and_ttl(tmp_path):
+    cache = HistoricalCache(str(tmp_path), ttl=60)
+    assert cache.get(5724) is None
+
+    cache.set(5724, EVENTS)
+    assert cache.get(5724) == EVENTS
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.city_ids() == [5724]
+    # Stored compressed, and no temporary file is left behind.
+    assert os.listdir(tmp_path) == ["5724.jsonl.gz"]
+    with gzip.open(tmp_path / "5724.jsonl.gz", "rt") as f:
+        assert len(f.readlines()) == 1
+
+    # Expired once the file is older than the ttl.
+    old = time.time() - 120
+    os.utime(tmp_path / "5724.jsonl.gz", (old, old))
+    assert cache.get(5724) is None
+    assert HistoricalCache(str(tmp_path), ttl=None).get(5724) == EVENTS
+
+    cache.clear()
+    assert cache.city_ids() == []
+
+
+def test_corrupt_file_is_a_miss(tmp_path):
+    cache = HistoricalCache(str(tmp_path))
+    (tmp_path / "5724.jsonl.gz").write_bytes(b"not gzip")
+    assert cache.get(5724) is None
+
+
+def test_get_historical_data_replays_cache(tmp_path):
+    with MockWAQIServer() as server:
+        o3 = Ozon3("token", base_url=server.url, historical_cache_dir=str(tmp_path))
+        city_id = o3.get_city_station_options("london")["city_id"].iloc[0]
+
+        first = o3.get_historical_data(city_id=city_id)
+        second = o3.get_historical_data(city_id=city_id)
+
+    # Only the first call downloaded the stream.
+    assert server.requests["attsse"] == 1
+    pandas.testing.assert_frame_equal(first, second)
+    assert o3.historical_cache.city_ids() == [city_id]
+    assert (o3.historical_cache.hits, o3.historical_cache.misses) == (1, 1)
@@ -0,0 +1,56 @@
+import os
+import warnings
+
+import pandas
+import pytest
+
+from ozon3 import Ozon3
+from ozon3.historical import _reverse_engineered
+from ozon3.historical._pool import DecoderPool
+from ozon3.testing import _HISTORICAL_MSG, MockWAQIServer
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = DecoderPool(2)
+    yield pool
+    pool.close()
+
+
+def shared_blocks():
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def test_same_result_as_in_process(pool):
+    second = {**_HISTORICAL_MSG, "ps": {"pm25": "1!59KCDrBrMEeckIJQlidADGa"}}
+    backend_data = [{"msg": _HISTORICAL_MSG}, {"msg": second}]
+    before = shared_blocks()
+
+    expected = _reverse_engineered._decode_results(backend_data)
+    result = _reverse_engineered._decode_results(backend_data, pool)
+
+    pandas.testing.assert_frame_equal(result, expected)
+    assert pool.chunks == 2
+    # Every shared memory block was freed.
+    assert shared_blocks() == before
+
+
+def test_errors_are_raised(pool):
+    before = shared_blocks()
+    with pytest.raises(Exception):
+        pool.decode([_HISTORICAL_MSG, {"not": "a message"}])
+    assert shared_blocks() == before
+
+
+def test_get_historical_data_with_workers():
+    with MockWAQIServer() as server:
+        o3 = Ozon3("token", base_url=server.url, historical_workers=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            data = o3.get_historical_data(city="london")
+        o3.historical_pool.close()
+
+    assert o3.historical_pool.chunks == 1
+    assert data["pm2.5"].tolist()[:3] == [52.0, 53.0, 47.0]
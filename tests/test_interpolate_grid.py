@@ -0,0 +1,57 @@
+import numpy
+import pytest
+
+from ozon3.spatial import InterpolatedGrid, StationIndex, interpolate_grid
+from utils import api
+
+LOWER_BOUND = (51, -0.2)
+UPPER_BOUND = (52, 1)
+
+STATIONS = StationIndex(
+    [
+        {"uid": 1, "lat": 0.0, "lon": 0.0, "aqi": "10"},
+        {"uid": 2, "lat": 0.0, "lon": 1.0, "aqi": "30"},
+        {"uid": 3, "lat": 1.0, "lon": 0.0, "aqi": "-"},  # No value, ignored
+    ]
+)
+
+
+@pytest.mark.vcr
+def test_return_value_and_format():
+    result = api.interpolate_grid(LOWER_BOUND, UPPER_BOUND, resolution=0.1)
+
+    assert isinstance(result, InterpolatedGrid)
+    assert result.values.shape == (11, 13)
+    assert result.latitudes[0] == pytest.approx(51)
+    assert result.latitudes[-1] == pytest.approx(52)
+    assert result.longitudes[-1] == pytest.approx(1)
+    assert not numpy.isnan(result.values).any()
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError, match="resolution"):
+        api.interpolate_grid(LOWER_BOUND, UPPER_BOUND, resolution=0)
+
+    with pytest.raises(ValueError, match="Unknown interpolation method"):
+        interpolate_grid(STATIONS, [0.0], [0.0], method="kriging")
+
+
+def test_idw_values():
+    result = interpolate_grid(STATIONS, [0.0], [0.0, 0.5, 1.0])
+
+    # Cells on a station take its value, and the midpoint the average.
+    assert result.values[0] == pytest.approx([10, 20, 30])
+
+
+def test_nearest_and_max_distance():
+    result = interpolate_grid(
+        STATIONS,
+        [0.0, 5.0],
+        [0.2, 0.9],
+        method="nearest",
+        max_distance_km=100,
+        chunk_cells=1,
+    )
+
+    assert result.values[0] == pytest.approx([10, 30])
+    assert numpy.isnan(result.values[1]).all()  # More than 500 km away
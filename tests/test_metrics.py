@@ -0,0 +1,81 @@
+from ozon3 import Metrics, Ozon3
+from utils import local_waqi_server
+
+
+def test_disabled_by_default():
+    with local_waqi_server() as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        o3.get_city_air("london")
+
+    assert not o3.metrics.enabled
+    assert o3.metrics.as_dict() == {}
+    assert o3.metrics.to_prometheus() == "\n"
+
+
+def test_request_and_phase_metrics():
+    with local_waqi_server() as server:
+        o3 = Ozon3(
+            "token",
+            base_url=f"http://127.0.0.1:{server.server_port}",
+            metrics=True,
+            cache_ttl=60,
+        )
+        o3.get_multiple_city_air(["london", "paris"])
+        o3.get_city_air("london")
+
+    metrics = o3.metrics.as_dict()
+    # The token check and one request per city; the second london is cached.
+    assert metrics["ozon3_requests_total"] == {'endpoint="feed",status="200"': 3.0}
+    assert metrics["ozon3_received_bytes_total"]['endpoint="feed"'] > 0
+    assert metrics["ozon3_request_seconds"]['endpoint="feed"']["count"] == 3
+    assert metrics["ozon3_cache_hits_total"]['cache="feed"'] == 1.0
+
+    # The token check is not rate limited or parsed like other requests.
+    phases = metrics["ozon3_phase_seconds"]
+    assert phases['phase="rate_limit"']["count"] == 2
+    assert phases['phase="parse"']["count"] == 2
+    assert phases['phase="extract"']["count"] == 3
+    assert phases['phase="dataframe"']["count"] == 1
+    buckets = phases['phase="extract"']["buckets"]
+    assert buckets["+Inf"] == 3
+    assert list(buckets.values()) == sorted(buckets.values())
+
+
+def test_errors_by_type(monkeypatch):
+    from utils import api, make_response
+
+    monkeypatch.setattr(
+        api,
+        "_make_api_request",
+        lambda url: make_response({"status": "error", "data": "Unknown station"}),
+    )
+    api.metrics.enabled = True
+    try:
+        api.get_multiple_city_air(["atlantis", "lemuria"])
+        errors = api.metrics.as_dict()["ozon3_errors_total"]
+    finally:
+        api.metrics.enabled = False
+        api.metrics.reset()
+
+    assert errors == {'type="Unknown station"': 2.0}
+
+
+def test_prometheus_format():
+    metrics = Metrics(enabled=True, buckets=(0.1, 1.0))
+    metrics.inc("ozon3_requests_total", endpoint="feed", status=200)
+    metrics.inc("ozon3_requests_total", endpoint="feed", status=200)
+    metrics.observe("ozon3_request_seconds", 0.5, endpoint="feed")
+    metrics.add_collector(lambda: [("ozon3_cache_hits_total", {}, 4)])
+
+    assert metrics.to_prometheus() == (
+        "# TYPE ozon3_cache_hits_total counter\n"
+        "ozon3_cache_hits_total 4.0\n"
+        "# TYPE ozon3_requests_total counter\n"
+        'ozon3_requests_total{endpoint="feed",status="200"} 2.0\n'
+        "# TYPE ozon3_request_seconds histogram\n"
+        'ozon3_request_seconds_bucket{endpoint="feed",le="0.1"} 0\n'
+        'ozon3_request_seconds_bucket{endpoint="feed",le="1.0"} 1\n'
+        'ozon3_request_seconds_bucket{endpoint="feed",le="+Inf"} 1\n'
+        'ozon3_request_seconds_sum{endpoint="feed"} 0.5\n'
+        'ozon3_request_seconds_count{endpoint="feed"} 1\n'
+    )
@@ -0,0 +1,107 @@
+import time
+import warnings
+
+import pytest
+import requests
+
+from ozon3 import APIError, Ozon3
+from ozon3.testing import MockWAQIServer, load_test
+
+
+@pytest.fixture
+def server():
+    with MockWAQIServer(unknown_cities=["atlantis"]) as server:
+        yield server
+
+
+def test_feed_endpoints(server):
+    o3 = Ozon3("token", base_url=server.url)
+
+    assert o3.get_city_air_record("london").station == "london"
+    record = o3.get_coordinate_air_record(51.51, -0.13)
+    assert (record.latitude, record.longitude) == (51.5, -0.25)
+
+    # The station is remembered, so it can be requested by its ID.
+    data_obj = o3._get_coordinate_data_obj(10.1, 20.1)
+    assert o3._get_data_obj(o3._station_url(data_obj["idx"])) == data_obj
+
+    with pytest.raises(APIError, match="no known AQI station"):
+        o3.get_city_air_record("atlantis")
+    with pytest.raises(APIError, match="Invalid geo position"):
+        o3.get_coordinate_air_record(100, 0)
+
+
+def test_bounds_forecast_and_history(server):
+    o3 = Ozon3("token", base_url=server.url)
+
+    stations = o3.get_range_coordinates_air((51.0, -0.5), (51.5, 0.0))
+    assert len(stations) == 9
+    assert not stations["aqi"].isna().any()
+
+    forecast = o3.get_city_forecast("paris")
+    assert len(forecast) == 4
+
+    options = o3.get_city_station_options("london")
+    assert options["station_name"].iloc[0] == ["london"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        history = o3.get_historical_data(city="london")
+    assert {"date", "pm2.5", "pm10", "o3"} <= set(history.columns)
+
+    assert server.requests["nsearch"] == 2
+    assert server.requests["attsse"] == 1
+    assert server.requests["map"] == 1
+
+
+def test_latency_and_errors():
+    with MockWAQIServer(latency=0.05) as server:
+        o3 = Ozon3("token", base_url=server.url)
+        server.error_rate = 1.0
+
+        start = time.perf_counter()
+        result = o3.get_multiple_city_air(["london", "paris"], as_result=True)
+        assert time.perf_counter() - start >= 0.05
+        assert [error.status_code for error in result.errors] == [500, 500]
+
+
+def test_historical_stream_times_out():
+    stalled = {"yd.json": 2.0}
+    with MockWAQIServer(latency=lambda name: stalled.get(name, 0.0)) as server:
+        o3 = Ozon3("token", base_url=server.url, timeout=0.2)
+
+        start = time.perf_counter()
+        with pytest.raises(requests.exceptions.Timeout):
+            o3.get_historical_data(city_id=1)
+        assert time.perf_counter() - start < 1.5
+
+
+def test_over_quota_tokens_are_rotated():
+    with MockWAQIServer(over_quota_tokens=["spent"]) as server:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            o3 = Ozon3("spent", tokens=["fresh"], base_url=server.url)
+
+        assert o3.get_city_air_record("london").station == "london"
+        assert o3.token_pool.is_quarantined("spent")
+        assert server.paths[-1].endswith("token=fresh")
+
+        server.over_quota_rate = 1.0
+        with pytest.raises(APIError, match="Too many requests"):
+            o3.get_city_air_record("paris")
+
+
+def test_load_test():
+    with MockWAQIServer(latency=0.01) as server:
+        o3 = Ozon3("token", base_url=server.url, max_workers=8)
+        results = load_test(o3, items=40, threads=8)
+
+    assert [r.method for r in results] == [
+        "city_air_record",
+        "multiple_city_air",
+        "multiple_coordinate_air",
+        "range_coordinates_air",
+    ]
+    assert [r.items for r in results[:3]] == [40, 40, 40]
+    assert all(r.errors == 0 and r.throughput > 0 for r in results)
+    # 8 threads with 10ms of latency each: far faster than one at a time.
+    assert results[0].seconds < 40 * 0.01
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import api, fake_feed, make_response
+
+
+@pytest.fixture
+def requested_urls(monkeypatch):
+    """Make api answer every request after a short delay, and record the urls"""
+    monkeypatch.setattr(api, "single_flight", type(api.single_flight)())
+    return fake_feed(monkeypatch, lambda url: time.sleep(0.2))
+
+
+def test_threads_share_one_request(requested_urls):
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(
+            executor.map(lambda _: api.get_city_air_record("london"), range(10))
+        )
+
+    assert len(requested_urls) == 1
+    assert all([result == results[0] for result in results])
+    assert api.single_flight.calls == 1
+    assert api.single_flight.coalesced == 9
+
+
+def test_coroutines_share_one_request(requested_urls):
+    async def main():
+        return await asyncio.gather(
+            *[api.get_city_air_record_async("london") for _ in range(10)]
+        )
+
+    results = asyncio.run(main())
+
+    assert len(requested_urls) == 1
+    assert all([result.station == "London" for result in results])
+    assert api.single_flight.coalesced == 9
+
+
+def test_different_queries_are_not_coalesced(requested_urls):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(api.get_city_air_record, ["london", "paris"]))
+
+    assert len(requested_urls) == 2
+    assert api.single_flight.coalesced == 0
+
+
+def test_errors_reach_every_waiter(monkeypatch):
+    def failing_request(url):
+        time.sleep(0.2)
+        return make_response({"status": "error", "data": "Unknown station"})
+
+    monkeypatch.setattr(api, "_make_api_request", failing_request)
+
+    def lookup(_):
+        with pytest.raises(Exception, match="no known AQI station"):
+            api.get_city_air_record("a definitely nonexistent city")
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        list(executor.map(lookup, range(5)))
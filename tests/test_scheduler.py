@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from ozon3 import Ozon3
+from ozon3._scheduler import PriorityScheduler
+from ozon3._tokens import TokenPool
+from utils import FEED_DATA, make_response
+
+
+def queue_up(scheduler, priorities):
+    """Start a thread per priority, each waiting for a turn, in the given order"""
+    order = []
+    threads = []
+    for priority in priorities:
+        queued = scheduler.queued
+
+        def take_turn(priority=priority):
+            with scheduler.turn(priority):
+                order.append(priority)
+
+        thread = threading.Thread(target=take_turn)
+        thread.start()
+        threads.append(thread)
+        while scheduler.queued == queued:
+            time.sleep(0.001)
+    return order, threads
+
+
+def test_waiting_interactive_requests_go_first():
+    scheduler = PriorityScheduler()
+
+    with scheduler.turn("bulk"):
+        order, threads = queue_up(
+            scheduler, ["bulk"] * 5 + ["interactive", "interactive"]
+        )
+    for thread in threads:
+        thread.join()
+
+    assert order == ["interactive", "interactive"] + ["bulk"] * 5
+    assert scheduler.granted == {"interactive": 2, "bulk": 6}
+
+
+def test_turns_are_shared_by_weight():
+    scheduler = PriorityScheduler({"interactive": 3, "bulk": 1})
+
+    with scheduler.turn("bulk"):
+        order, threads = queue_up(scheduler, ["bulk"] * 4 + ["interactive"] * 9)
+    for thread in threads:
+        thread.join()
+
+    # Counting the turn it held, the bulk class gets 3 of the first 11 turns.
+    assert order[:10].count("bulk") == 2
+    assert order.count("bulk") == 4
+
+
+def test_partial_weights_keep_the_defaults():
+    scheduler = PriorityScheduler({"interactive": 4})
+    assert scheduler.weights == {"interactive": 4, "bulk": 1.0}
+    with scheduler.turn("bulk"):
+        pass
+
+    scheduler = PriorityScheduler({"background": 0.5})
+    assert set(scheduler.weights) == {"interactive", "bulk", "background"}
+    with pytest.raises(Exception, match="must be positive"):
+        PriorityScheduler({"bulk": 0})
+
+
+def test_unknown_priority():
+    scheduler = PriorityScheduler()
+    with pytest.raises(Exception, match="Unknown priority"):
+        with scheduler.turn("urgent"):
+            pass
+
+
+def test_interactive_lookup_during_bulk_sweep(monkeypatch):
+    def fake_get(session, url, **kwargs):
+        return make_response({"status": "ok", "data": FEED_DATA})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    o3 = Ozon3("token", max_workers=16)
+    # A rate limit of 200 requests per second, so the sweep takes about 1.5s.
+    o3._config = o3._config._replace(token_pool=TokenPool(["token"], 10, 0.05))
+
+    sweep = threading.Thread(
+        target=o3.get_multiple_city_air, args=([f"city{i}" for i in range(300)],)
+    )
+    sweep.start()
+    time.sleep(0.3)
+    latencies = []
+    for _ in range(5):
+        start = time.perf_counter()
+        o3.get_city_air_record("london")
+        latencies.append(time.perf_counter() - start)
+    sweep.join()
+
+    assert o3.scheduler.granted["bulk"] == 300
+    assert o3.scheduler.granted["interactive"] == 5
+    # Without priorities, each lookup would wait behind ~16 queued bulk requests.
+    assert max(latencies) < 0.06
+    assert o3.scheduler.queued > 0
+
+
+def test_priority_context(monkeypatch):
+    def fake_get(session, url, **kwargs):
+        return make_response({"status": "ok", "data": FEED_DATA})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    o3 = Ozon3("token")
+
+    with o3.priority("interactive"):
+        o3.get_multiple_city_air(["london", "paris"])
+    o3.get_city_air("london")
+    with o3.priority("bulk"):
+        o3.get_city_air("paris")
+
+    assert o3.scheduler.granted == {"interactive": 3, "bulk": 1}
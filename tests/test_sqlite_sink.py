@@ -0,0 +1,176 @@
+import sqlite3
+
+import numpy
+import pandas
+import pytest
+
+from ozon3 import SQLiteSink
+from utils import api
+
+LIVE = pandas.DataFrame(
+    {
+        "city": ["london", "paris", "unknowncity"],
+        "latitude": [51.5073509, 48.856614, numpy.nan],
+        "longitude": [-0.1277583, 2.3522219, numpy.nan],
+        "station": ["London", "Paris", numpy.nan],
+        "station_id": [5724, 5722, numpy.nan],
+        "timestamp": ["2022-05-23 06:00:00", "2022-05-23 07:00:00", numpy.nan],
+        "aqi": [34.0, numpy.nan, numpy.nan],
+        "pm2.5": [34.0, 12.0, numpy.nan],
+    }
+)
+
+
+@pytest.fixture
+def sink():
+    with SQLiteSink(":memory:") as sink:
+        yield sink
+
+
+def test_write_and_read_live(sink):
+    assert sink.write_live(LIVE) == 2
+    assert sink.rows_skipped == 1
+
+    data = sink.read("live")
+    assert list(data["station"]) == ["London", "Paris"]
+    assert data.loc[0, "pm2.5"] == 34.0
+    assert data["aqi"].isna().tolist() == [False, True]
+
+
+def test_upsert(sink):
+    sink.write_live(LIVE)
+    updated = LIVE.copy()
+    updated.loc[0, "aqi"] = 40.0
+    sink(updated)
+
+    data = sink.read("live")
+    assert len(data) == 2
+    assert data.loc[0, "aqi"] == 40.0
+
+
+def test_read_range(sink):
+    later = LIVE.copy()
+    later["timestamp"] = ["2022-05-23 08:00:00", "2022-05-23 09:00:00", numpy.nan]
+    sink.write_live(LIVE)
+    sink.write_live(later)
+
+    data = sink.read("live", station="London", start="2022-05-23 07:00:00")
+    assert list(data["timestamp"]) == ["2022-05-23 08:00:00"]
+    data = sink.read("live", end="2022-05-23 07:00:00")
+    assert list(data["station"]) == ["London", "Paris"]
+    # A date-only end includes the whole day.
+    assert len(sink.read("live", end="2022-05-23")) == 4
+    assert len(sink.read("live", end="2022-05-22")) == 0
+
+    with pytest.raises(Exception, match="Unknown table"):
+        sink.read("hourly")
+
+
+def test_stations_sharing_a_name(sink):
+    embassies = pandas.DataFrame(
+        {
+            "station": ["US Embassy", "US Embassy"],
+            "station_id": [1, 2],
+            "timestamp": ["2022-05-23 06:00:00", "2022-05-23 06:00:00"],
+            "aqi": [10.0, 90.0],
+        }
+    )
+
+    assert sink.write_live(embassies) == 2
+    data = sink.read("live", station="US Embassy")
+    assert list(zip(data["station_id"], data["aqi"])) == [(1, 10.0), (2, 90.0)]
+    assert sink.read("live", station_id=2)["aqi"].tolist() == [90.0]
+
+
+def test_tables_of_older_versions_are_rejected(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE live (station TEXT, timestamp TEXT, aqi REAL, "
+            "PRIMARY KEY (station, timestamp))"
+        )
+    conn.close()
+    with pytest.raises(Exception, match="older version"):
+        SQLiteSink(path)
+
+
+def test_write_forecast(sink):
+    forecast = api._extract_forecast_data(
+        {
+            "forecast": {
+                "daily": {
+                    "pm25": [
+                        {"day": "2022-05-23", "avg": 1, "min": 0, "max": 2},
+                        {"day": "2022-05-24", "avg": 3, "min": 1, "max": 5},
+                    ],
+                    "o3": [{"day": "2022-05-23", "avg": 7, "min": 6, "max": 9}],
+                }
+            }
+        }
+    )
+
+    with pytest.raises(Exception, match="station is required"):
+        sink.write_forecast(forecast)
+    assert sink.write_forecast(forecast, station="London") == 3
+
+    long = pandas.DataFrame(
+        {
+            "city": ["paris"],
+            "date": pandas.to_datetime(["2022-05-23"]),
+            "pollutant": ["o3"],
+            "avg": [5.0],
+            "min": [4.0],
+            "max": [6.0],
+        }
+    )
+    assert sink.write_forecast(long) == 1
+
+    data = sink.read("forecast", start="2022-05-23", end="2022-05-23")
+    assert list(zip(data["station"], data["pollutant"], data["avg"])) == [
+        ("London", "o3", 7.0),
+        ("London", "pm2.5", 1.0),
+        ("paris", "o3", 5.0),
+    ]
+
+
+def test_write_historical(sink):
+    historical = pandas.DataFrame(
+        {
+            "date": pandas.to_datetime(["2022-05-23", "2022-05-22"]),
+            "pm2.5": [34.0, numpy.nan],
+            "o3": [12.0, 10.0],
+        }
+    )
+
+    assert sink.write_historical(historical, station="London") == 3
+    data = sink.read("historical", station="London")
+    assert list(data["timestamp"]) == ["2022-05-22", "2022-05-23", "2022-05-23"]
+
+
+def test_batches_many_rows():
+    n = 25000
+    live = pandas.DataFrame(
+        {
+            "station": [f"station{i % 500}" for i in range(n)],
+            "station_id": [i % 500 for i in range(n)],
+            "timestamp": [f"2022-05-{1 + i // 500:02d} 06:00:00" for i in range(n)],
+            "aqi": numpy.arange(n, dtype=float),
+        }
+    )
+    with SQLiteSink(":memory:", batch_size=1000) as sink:
+        assert sink.write_live(live) == n
+        assert sink.rows_written == n
+        assert len(sink.read("live", station="station7")) == 50
+
+
+def test_ozon3_sqlite_sink(tmp_path):
+    api.output_path = str(tmp_path / "data")
+    api.file_name = "snapshots"
+    try:
+        with api.sqlite_sink() as sink:
+            sink.write_live(LIVE)
+    finally:
+        api.output_path, api.file_name = ".", "air_quality"
+
+    with SQLiteSink(str(tmp_path / "data" / "snapshots.db")) as sink:
+        assert len(sink.read()) == 2
@@ -0,0 +1,99 @@
+import numpy
+import pytest
+
+from ozon3.spatial import StationIndex, haversine_km
+
+rng = numpy.random.default_rng(0)
+LATS = rng.uniform(-60, 60, 500)
+LONS = rng.uniform(-180, 180, 500)
+STATIONS = [
+    {"uid": i, "lat": lat, "lon": lon, "aqi": str(i % 300)}
+    for i, (lat, lon) in enumerate(zip(LATS, LONS))
+]
+
+
+@pytest.fixture(params=["kdtree", "brute force"])
+def index(request, monkeypatch):
+    if request.param == "kdtree":
+        pytest.importorskip("scipy")
+    else:
+        monkeypatch.setattr("ozon3.spatial.cKDTree", None)
+    return StationIndex(STATIONS)
+
+
+def test_nearest_matches_haversine(index):
+    query_lats = rng.uniform(-60, 60, 200)
+    query_lons = rng.uniform(-180, 180, 200)
+    distances, rows = index.nearest(query_lats, query_lons, k=3)
+
+    expected = haversine_km(
+        query_lats[:, None], query_lons[:, None], LATS[None, :], LONS[None, :]
+    )
+    expected_rows = numpy.argsort(expected, axis=1)[:, :3]
+
+    assert distances.shape == rows.shape == (200, 3)
+    assert (index.uids[rows] == expected_rows).all()
+    assert distances == pytest.approx(
+        numpy.take_along_axis(expected, expected_rows, axis=1)
+    )
+
+
+def test_within_matches_haversine(index):
+    distances, rows = index.within(10.0, 20.0, radius_km=2000)
+
+    expected = haversine_km(10.0, 20.0, LATS, LONS)
+    assert set(index.uids[rows]) == set(numpy.flatnonzero(expected <= 2000))
+    assert (numpy.diff(distances) >= 0).all()
+
+
+def test_incremental_update(index):
+    index.update([{"uid": 0, "lat": 10.0, "lon": 20.0, "aqi": "-"}])
+    index.update([{"uid": 1000, "lat": 10.001, "lon": 20.001}])
+
+    assert len(index) == len(STATIONS) + 1
+    _, rows = index.nearest(10.0, 20.0, k=2)
+    columns = index.columns(rows[0])
+    assert set(columns["uid"]) == {0, 1000}
+    assert numpy.isnan(columns["aqi"]).all()
+
+
+def test_empty_index():
+    distances, rows = StationIndex().nearest(10.0, 20.0, k=3)
+    assert distances.shape == (1, 0)
+    assert len(StationIndex().within(10.0, 20.0, radius_km=100)[1]) == 0
+
+
+def test_many_incremental_updates(index, monkeypatch):
+    # Rebuild the k-d tree (if any) every few updates, so that queries see both
+    # stations in the tree and stations added since.
+    monkeypatch.setattr(StationIndex, "_max_tail", 50)
+    new_lats = rng.uniform(-60, 60, 300)
+    new_lons = rng.uniform(-180, 180, 300)
+    for start in range(0, 300, 30):
+        index.update(
+            {"uid": 1000 + i, "lat": new_lats[i], "lon": new_lons[i]}
+            for i in range(start, start + 30)
+        )
+        # Refreshing known stations must not move them.
+        index.update(STATIONS[start : start + 30])
+
+    lats = numpy.concatenate([LATS, new_lats])
+    lons = numpy.concatenate([LONS, new_lons])
+    uids = numpy.concatenate([numpy.arange(500), 1000 + numpy.arange(300)])
+    query_lats = rng.uniform(-60, 60, 100)
+    query_lons = rng.uniform(-180, 180, 100)
+    distances, rows = index.nearest(query_lats, query_lons, k=3)
+
+    expected = haversine_km(
+        query_lats[:, None], query_lons[:, None], lats[None, :], lons[None, :]
+    )
+    expected_rows = numpy.argsort(expected, axis=1)[:, :3]
+    assert len(index) == 800
+    assert (index.uids[rows] == uids[expected_rows]).all()
+    assert distances == pytest.approx(
+        numpy.take_along_axis(expected, expected_rows, axis=1)
+    )
+    _, rows = index.within(10.0, 20.0, radius_km=2000)
+    assert set(index.uids[rows]) == set(
+        uids[haversine_km(10.0, 20.0, lats, lons) <= 2000]
+    )
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from ozon3 import Ozon3
+from utils import local_waqi_server
+
+CITIES = [f"city{i}" for i in range(48)]
+
+
+def lookup_all(o3, threads):
+    def lookup(city):
+        return city, o3.get_city_air_record(city)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lookup, CITIES))
+
+
+def test_shared_client_scales_with_threads():
+    with local_waqi_server(delay=0.02) as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+
+        start = time.perf_counter()
+        lookup_all(o3, threads=1)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = lookup_all(o3, threads=16)
+        parallel = time.perf_counter() - start
+
+    assert all(record.station == city for city, record in results)
+    assert parallel < serial / 4
+
+
+def test_reset_token_while_requests_are_made():
+    with local_waqi_server() as server:
+        o3 = Ozon3("first", base_url=f"http://127.0.0.1:{server.server_port}")
+        stop = threading.Event()
+
+        def swap_tokens():
+            while not stop.is_set():
+                o3.token = "second"
+                o3.token = "first"
+
+        swapper = threading.Thread(target=swap_tokens)
+        swapper.start()
+        try:
+            results = lookup_all(o3, threads=16)
+        finally:
+            stop.set()
+            swapper.join()
+
+    assert all(record.station == city for city, record in results)
+    tokens = {parse_qs(urlsplit(path).query)["token"][0] for path in server.paths}
+    assert tokens <= {"first", "second"}
+
+
+def test_each_thread_has_its_own_session():
+    with local_waqi_server() as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        sessions = []
+
+        def get_session():
+            sessions.append(o3._session())
+            assert o3._session() is sessions[-1]
+
+        threads = [threading.Thread(target=get_session) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len({id(session) for session in sessions}) == 4
+
+
+def test_batches_reuse_the_thread_pool_and_its_sessions():
+    with local_waqi_server() as server:
+        with Ozon3(
+            "token", base_url=f"http://127.0.0.1:{server.server_port}", max_workers=4
+        ) as o3:
+            o3.get_multiple_city_air(CITIES[:8])
+            executor = o3._executor
+            sessions = set(o3._sessions)
+
+            o3.get_multiple_city_air(CITIES[8:16])
+            assert o3._executor is executor
+            # No new threads, so no new sessions.
+            assert set(o3._sessions) == sessions
+
+        # Leaving the block stopped the threads; the client still works.
+        assert o3._executor is None
+        assert len(o3.get_multiple_city_air(CITIES[:2])) == 2
+        o3.close()
+
+    assert executor._shutdown
@@ -0,0 +1,119 @@
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from ozon3 import Ozon3
+from ozon3._tokens import TokenPool
+from utils import FEED_DATA, make_response
+
+
+@pytest.fixture
+def token_requests(monkeypatch):
+    """Answer requests without network, and record the token of each request
+
+    Token "bad" is rejected as invalid, and tokens added to the returned list's
+    over_quota set are rejected as over quota.
+    """
+
+    class TokenList(list):
+        over_quota: set
+
+    tokens = TokenList()
+    tokens.over_quota = {"spent"}
+    lock = threading.Lock()
+
+    def fake_get(session, url, **kwargs):
+        token = parse_qs(urlsplit(url).query)["token"][0]
+        with lock:
+            tokens.append(token)
+        time.sleep(0.01)
+        if token == "bad":
+            return make_response({"status": "error", "data": "Invalid key"})
+        if token in tokens.over_quota:
+            return make_response({"status": "error", "data": "Over quota"})
+        return make_response({"status": "ok", "data": FEED_DATA})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    return tokens
+
+
+def test_single_token_is_unchanged(token_requests):
+    o3 = Ozon3("one")
+    assert o3.token_pool.tokens == ["one"]
+    o3.get_city_air("london")
+    assert token_requests == ["one", "one"]
+
+
+def test_requests_are_spread_over_tokens(token_requests):
+    o3 = Ozon3("one", tokens=["two", "three"], max_workers=6)
+    token_requests.clear()
+
+    o3.get_multiple_coordinate_air([(i, i) for i in range(30)])
+
+    assert sorted(set(token_requests)) == ["one", "three", "two"]
+    counts = [token_requests.count(t) for t in ("one", "two", "three")]
+    assert max(counts) - min(counts) <= 2
+
+
+def test_rejected_tokens_are_quarantined(token_requests):
+    with pytest.warns(UserWarning, match="Token may be invalid"):
+        o3 = Ozon3("good", tokens=["bad"])
+    assert o3.token_pool.is_quarantined("bad")
+    token_requests.clear()
+
+    o3.get_multiple_city_air(["london", "paris", "rome"])
+
+    assert token_requests == ["good"] * 3
+
+
+def test_request_retried_with_another_token(token_requests):
+    o3 = Ozon3("good", tokens=["other"], quarantine_seconds=30)
+    token_requests.clear()
+    # The quota of "other" runs out after the client was created.
+    token_requests.over_quota.add("other")
+    # Make sure the next request goes to that token first.
+    o3.token_pool._states["good"].in_flight = 1
+
+    assert o3.get_city_air("london").loc[0, "aqi"] == 34.0
+    assert token_requests == ["other", "good"]
+    assert o3.token_pool.is_quarantined("other")
+    assert not o3.token_pool.is_quarantined("good")
+
+
+def test_all_tokens_rejected(token_requests):
+    with pytest.warns(UserWarning):
+        o3 = Ozon3("bad", tokens=["spent"])
+
+    with pytest.raises(Exception, match="invalid|Too many requests"):
+        o3.get_city_air("london")
+
+
+def test_reset_token(token_requests):
+    o3 = Ozon3("one", tokens=["two"])
+    o3.reset_token("three")
+
+    assert o3.token == "three"
+    assert o3.token_pool.tokens == ["three", "two"]
+
+    o3.reset_token("two")
+    assert o3.token_pool.tokens == ["two"]
+
+
+def test_rate_limit_is_per_token():
+    pool = TokenPool(["one", "two"], calls=2, period=0.3)
+
+    start = time.monotonic()
+    tokens = []
+    for _ in range(4):
+        token = pool.acquire()
+        pool.release(token)
+        tokens.append(token)
+    # Two tokens with two calls each: no waiting yet.
+    assert time.monotonic() - start < 0.1
+    assert sorted(tokens) == ["one", "one", "two", "two"]
+
+    pool.release(pool.acquire())
+    assert time.monotonic() - start >= 0.29
@@ -0,0 +1,86 @@
+import io
+
+import pytest
+import requests
+
+from ozon3 import Ozon3, Tracer, TraceRecorder
+from ozon3.historical import _reverse_engineered
+from utils import local_waqi_server
+
+
+def test_trace_single_call():
+    with local_waqi_server() as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        with o3.trace(TraceRecorder()) as recorder:
+            o3.get_city_air("london")
+        o3.get_city_air("paris")
+
+    kinds = [event.kind for event in recorder.events]
+    assert kinds == [
+        "request_start",
+        "response",
+        "parse_done",
+        "decode_done",
+    ]
+    start, response, parse, extract = recorder.events
+    assert response.details == {"endpoint": "feed", "status_code": 200}
+    assert response.size > 0 and response.seconds > 0
+    assert "token=***" in response.url and "london" in response.url
+    assert parse.details == {"city": "london"}
+    assert extract.details == {"phase": "extract"}
+
+
+def test_trace_follows_batch_threads():
+    with local_waqi_server() as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        with o3.trace(TraceRecorder()) as recorder:
+            o3.get_multiple_city_air(["london", "paris", "rome"])
+
+    responses = [e for e in recorder.events if e.kind == "response"]
+    assert len(responses) == 3
+    phases = [e.details["phase"] for e in recorder.events if e.kind == "decode_done"]
+    assert phases.count("extract") == 3
+    assert phases.count("dataframe") == 1
+
+
+def test_instance_tracers_and_errors():
+    class FailingTracer(Tracer):
+        def on_response(self, event):
+            raise ValueError("broken tracer")
+
+    with local_waqi_server() as server:
+        o3 = Ozon3("token", base_url=f"http://127.0.0.1:{server.server_port}")
+        recorder = TraceRecorder()
+        o3.tracers.extend([FailingTracer(), recorder])
+        with pytest.warns(UserWarning, match="broken tracer"):
+            o3.get_city_air_record("london")
+
+    assert [e.kind for e in recorder.events][:2] == ["request_start", "response"]
+
+
+def test_sse_events_are_traced(monkeypatch):
+    stream = (
+        b'event: data\ndata: {"msg": 1}\n\n'
+        b'event: data\ndata: {"msg": 2}\n\n'
+        b"event: done\ndata: \n\n"
+    )
+
+    def fake_get(url, **kwargs):
+        r = requests.Response()
+        r.status_code = 200
+        r.headers["Content-Type"] = "text/event-stream"
+        r.raw = io.BytesIO(stream)
+        return r
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    recorder = TraceRecorder()
+    results = _reverse_engineered.get_results_from_backend(5724, [recorder])
+
+    assert results == [{"msg": 1}, {"msg": 2}]
+    kinds = [e.kind for e in recorder.events]
+    assert kinds == ["request_start", "response"] + ["sse_event"] * 3
+    events = recorder.events[2:]
+    assert [e.details["event"] for e in events] == ["data", "data", "done"]
+    assert events[0].size == len('{"msg": 1}')
+    assert events[0].details["city_id"] == 5724
+    assert events[0].seconds <= events[-1].seconds
@@ -1,7 +1,12 @@
+import contextlib
+import json
+import threading
 from urllib.parse import urlsplit, urlunsplit, urlencode
+import requests
 import vcr
 from decouple import config
 from ozon3 import Ozon3
+from ozon3.testing import MockWAQIServer
 
 
 # Filter out token in response headers
@@ -36,3 +41,66 @@ vcr_kwargs = {
 WAQI_TOKEN = config("WAQI_TOKEN", default="DUMMY_TOKEN")
 with vcr.use_cassette("tests/cassettes/ozon3_init.yaml", **vcr_kwargs):
     api = Ozon3(WAQI_TOKEN)  # type: ignore
+
+
+# Build a response object without going through the network, for tests that
+# replace Ozon3's request method with a fake one.
+def make_response(payload, status_code=200):
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = json.dumps(payload).encode()
+    return r
+
+
+# The `data` part of a feed response, as answered by fake_feed.
+FEED_DATA = {
+    "aqi": 34,
+    "idx": 5724,
+    "city": {"geo": [51.5073509, -0.1277583], "name": "London"},
+    "dominentpol": "pm25",
+    "iaqi": {"pm25": {"v": 34}, "o3": {"v": 13.9}},
+    "time": {"s": "2022-05-23 06:00:00", "tz": "+01:00"},
+}
+
+
+# Make client answer requests without network access, and return the list of
+# requested urls. Urls containing "unknown" get an unknown station error, and
+# all others get FEED_DATA. If given, respond(url) is called first, and the
+# response it returns (if not None) is used instead.
+def fake_feed(monkeypatch, respond=None, client=api):
+    requested = []
+    lock = threading.Lock()
+
+    def fake_request(url):
+        with lock:
+            requested.append(url)
+        r = respond(url) if respond is not None else None
+        if r is not None:
+            return r
+        if "unknown" in url:
+            return make_response({"status": "error", "data": "Unknown station"})
+        return make_response({"status": "ok", "data": FEED_DATA})
+
+    monkeypatch.setattr(client, "_make_api_request", fake_request)
+    return requested
+
+
+# A local stand-in for the WAQI API, for tests that need real HTTP requests
+# (e.g. with many threads) without network access. /feed/<city>/ answers with a
+# station named after the city, after `delay` seconds (or `delays[city]`). If
+# `delays[city]` is a list, each request for the city takes the next delay from
+# it, and `delay` once it is empty.
+# Requested urls are recorded in `server.paths`.
+@contextlib.contextmanager
+def local_waqi_server(delay=0.0, delays=None):
+    def latency(name):
+        delay = server.delays.get(name, server.delay)
+        if isinstance(delay, list):
+            delay = delay.pop(0) if delay else server.delay
+        return delay
+
+    server = MockWAQIServer(latency=latency)
+    server.delay = delay
+    server.delays = delays or {}
+    with server:
+        yield server